@@ -0,0 +1,237 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from column_registry import ColumnRegistry, SUBSIDIO_CAUSADO
+from ledger import NominaLedger
+
+# Concept sections of the receipt; their 'Total' columns (TotalPercepciones, ...) are
+# header values and are not summed again
+CONCEPT_SECTIONS = ('Percepciones', 'Deducciones', 'OtrosPagos')
+
+# Per-receipt amounts computed from the concept columns (or lines)
+AMOUNT_COLUMNS = ['PercepcionesGravado', 'PercepcionesExento', 'Percepciones',
+                  'Deducciones', 'OtrosPagos', 'Neto']
+
+# Header amounts carried into the summaries when present
+HEADER_AMOUNTS = ['Total']
+
+# Period granularity: characters of FechaPago ('YYYY-MM-DD') kept
+PERIODS = {'date': 10, 'month': 7, 'year': 4}
+
+CONCEPT_COLUMNS = ['Seccion', 'Clave', 'Concepto', 'ImporteGravado', 'ImporteExento', 'Importe', 'Recibos']
+
+# Summary table -> (group keys, descriptive columns taken from the first receipt)
+SUMMARIES: Dict[str, Tuple[List[str], List[str]]] = {
+    'Resumen Trabajador': (['Receptor_RFC'], ['Receptor_Nombre']),
+    'Resumen Periodo': (['Periodo'], []),
+    'Resumen Concepto': (['Seccion', 'Clave', 'Concepto'], []),
+    'Resumen Patron': (['Emisor_RFC'], ['Emisor_Nombre']),
+}
+
+_SUFFIXES = {'_Gravado': 'ImporteGravado', '_Exento': 'ImporteExento'}
+
+
+def concept_columns(columns: Iterable[str], registry: ColumnRegistry) -> pd.DataFrame:
+    """
+    One row per concept column of a wide result, from the registry specs:
+    Columna, Seccion, Clave, Concepto (without the _Gravado/_Exento suffix) and Parte
+    (ImporteGravado, ImporteExento or Importe). SubsidioCausado is marked Informativo.
+    """
+    rows = []
+    for name in columns:
+        spec = registry.spec(name)
+        if spec is None or spec[1] not in CONCEPT_SECTIONS or spec[2] == 'Total':
+            continue
+        _, section, clave, subitem = spec
+        concepto, parte = name, 'Importe'
+        if section == 'Percepciones':
+            for suffix, value in _SUFFIXES.items():
+                if name.endswith(suffix):
+                    concepto, parte = name[:-len(suffix)], value
+        rows.append((name, section, clave, concepto, parte,
+                     section == 'OtrosPagos' and subitem == 1))
+    return pd.DataFrame(rows, columns=['Columna', 'Seccion', 'Clave', 'Concepto', 'Parte', 'Informativo'])
+
+
+def _wide_amounts(df: pd.DataFrame, registry: Optional[ColumnRegistry]) -> Tuple[np.ndarray, pd.DataFrame]:
+    """(receipts x concept columns) float matrix, missing values as 0, and its concept_columns()."""
+    registry = registry if registry is not None else ColumnRegistry()
+    concepts = concept_columns(df.columns, registry)
+    matrix = df[concepts['Columna'].tolist()].to_numpy(dtype=float, na_value=0.0)
+    return matrix, concepts
+
+
+def receipt_totals(result, registry: Optional[ColumnRegistry] = None,
+                   _amounts: Optional[Tuple[np.ndarray, pd.DataFrame]] = None) -> pd.DataFrame:
+    """
+    Per-receipt amounts (AMOUNT_COLUMNS) summed from the concept columns of a wide result
+    or the lines of a NominaLedger, aligned with its rows (headers for a ledger).
+    Neto = Percepciones + OtrosPagos - Deducciones; SubsidioCausado is not a payment
+    and is left out.
+    """
+    if isinstance(result, NominaLedger):
+        headers, lines = result.headers, result.lines
+        n = len(headers)
+        pos = headers.index.get_indexer(lines['Registro'])
+        seccion = lines['Seccion'].astype(str).to_numpy()
+        informativo = (seccion == 'OtrosPagos') & (lines['Concepto'].astype(str).to_numpy() == SUBSIDIO_CAUSADO)
+
+        def total(mask, column):
+            return np.bincount(pos[mask], weights=lines[column].to_numpy(dtype=float)[mask], minlength=n)
+
+        perc = seccion == 'Percepciones'
+        gravado = total(perc, 'ImporteGravado')
+        exento = total(perc, 'ImporteExento')
+        deducciones = total(seccion == 'Deducciones', 'Importe')
+        otros = total((seccion == 'OtrosPagos') & ~informativo, 'Importe')
+        index = headers.index
+    else:
+        matrix, concepts = _amounts or _wide_amounts(result, registry)
+
+        def total(mask):
+            return matrix[:, mask.to_numpy()].sum(axis=1)
+
+        perc = concepts['Seccion'] == 'Percepciones'
+        gravado = total(perc & (concepts['Parte'] == 'ImporteGravado'))
+        exento = total(perc & (concepts['Parte'] == 'ImporteExento'))
+        deducciones = total(concepts['Seccion'] == 'Deducciones')
+        otros = total((concepts['Seccion'] == 'OtrosPagos') & ~concepts['Informativo'])
+        index = result.index
+    percepciones = gravado + exento
+    return pd.DataFrame({
+        'PercepcionesGravado': gravado, 'PercepcionesExento': exento, 'Percepciones': percepciones,
+        'Deducciones': deducciones, 'OtrosPagos': otros, 'Neto': percepciones + otros - deducciones,
+    }, index=index)
+
+
+def concept_totals(result, registry: Optional[ColumnRegistry] = None,
+                   _amounts: Optional[Tuple[np.ndarray, pd.DataFrame]] = None) -> pd.DataFrame:
+    """
+    Totals per concept (Seccion, Clave, Concepto): gravado, exento and importe (gravado +
+    exento for percepciones) and Recibos, the receipts where the concept has an amount.
+    """
+    if isinstance(result, NominaLedger):
+        lines = result.lines
+        keys = {name: lines[name].astype(str) for name in ('Seccion', 'Clave', 'Concepto')}
+        gravado = lines['ImporteGravado'].to_numpy(dtype=float)
+        exento = lines['ImporteExento'].to_numpy(dtype=float)
+        importe = np.where(keys['Seccion'] == 'Percepciones', gravado + exento,
+                           lines['Importe'].to_numpy(dtype=float))
+        frame = pd.DataFrame({**keys, 'ImporteGravado': gravado, 'ImporteExento': exento, 'Importe': importe,
+                              'Registro': lines['Registro'].to_numpy()})
+        grouped = frame.groupby(['Seccion', 'Clave', 'Concepto'], sort=True)
+        table = grouped[['ImporteGravado', 'ImporteExento', 'Importe']].sum()
+        # A concept repeated in one receipt counts once
+        present = frame[(gravado != 0) | (exento != 0) | (importe != 0)]
+        table['Recibos'] = present.groupby(['Seccion', 'Clave', 'Concepto'])['Registro'].nunique()
+        table['Recibos'] = table['Recibos'].fillna(0).astype(np.int64)
+        return table.reset_index()[CONCEPT_COLUMNS]
+
+    matrix, concepts = _amounts or _wide_amounts(result, registry)
+    if concepts.empty:
+        return pd.DataFrame(columns=CONCEPT_COLUMNS)
+    sums = matrix.sum(axis=0)
+    # Receipts with an amount: one count per column, except concepts spread over several
+    # columns (gravado and exento), where a receipt with both parts counts once
+    concept_id = concepts.groupby(['Seccion', 'Clave', 'Concepto'], sort=True).ngroup().to_numpy()
+    nonzero = matrix != 0
+    sizes = np.bincount(concept_id)
+    recibos = np.zeros(len(sizes), dtype=np.int64)
+    single = sizes[concept_id] == 1
+    recibos[concept_id[single]] = np.count_nonzero(nonzero[:, single], axis=0)
+    for cid in np.flatnonzero(sizes > 1):
+        recibos[cid] = np.count_nonzero(nonzero[:, concept_id == cid].any(axis=1))
+
+    parts = concepts.assign(Valor=sums).pivot_table(
+        index=['Seccion', 'Clave', 'Concepto'], columns='Parte', values='Valor', aggfunc='sum', fill_value=0.0
+    )
+    table = pd.DataFrame(index=parts.index)
+    for parte in ('ImporteGravado', 'ImporteExento', 'Importe'):
+        table[parte] = parts[parte] if parte in parts else 0.0
+    perc = table.index.get_level_values('Seccion') == 'Percepciones'
+    table.loc[perc, 'Importe'] = table.loc[perc, 'ImporteGravado'] + table.loc[perc, 'ImporteExento']
+    table['Recibos'] = recibos
+    return table.reset_index()[CONCEPT_COLUMNS]
+
+
+def _receipt_frame(result, registry: Optional[ColumnRegistry], period: str, amounts) -> pd.DataFrame:
+    """Header keys, names and amounts of every receipt, plus its Periodo."""
+    headers = result.headers if isinstance(result, NominaLedger) else result
+    totals = receipt_totals(result, registry, amounts)
+    wanted = ['Receptor_RFC', 'Receptor_Nombre', 'Emisor_RFC', 'Emisor_Nombre']
+    frame = pd.DataFrame({name: headers[name] for name in wanted if name in headers}, index=totals.index)
+    if 'FechaPago' in headers:
+        frame['Periodo'] = headers['FechaPago'].astype(str).str.slice(0, PERIODS[period])
+    for name in AMOUNT_COLUMNS:
+        frame[name] = totals[name]
+    for name in HEADER_AMOUNTS:
+        if name in headers:
+            frame[name] = pd.to_numeric(headers[name], errors='coerce').fillna(0.0)
+    frame['Recibos'] = 1
+    return frame
+
+
+def _group(frame: pd.DataFrame, keys: List[str], names: List[str]) -> pd.DataFrame:
+    """Sum every amount (and Recibos) per keys; descriptive names come from the first receipt."""
+    names = [n for n in names if n in frame]
+    amounts = [c for c in frame.columns if c not in keys and c not in names and pd.api.types.is_numeric_dtype(frame[c])]
+    grouped = frame.groupby(keys, sort=True, dropna=False)
+    table = grouped[amounts].sum()
+    if names:
+        table = grouped[names].first().join(table)
+    return table.reset_index()
+
+
+def summarize(result, registry: Optional[ColumnRegistry] = None, period: str = 'month') -> Dict[str, pd.DataFrame]:
+    """
+    The SUMMARIES tables of a wide result or a NominaLedger, each from one groupby pass:
+    per receptor, per FechaPago period ('date', 'month' or 'year'), per concept and per
+    emisor. Tables whose key column the result lacks are left out.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"Unknown period: {period}")
+    # The concept matrix of a wide result is built once for every table
+    amounts = None if isinstance(result, NominaLedger) else _wide_amounts(result, registry)
+    frame = _receipt_frame(result, registry, period, amounts)
+    tables = {}
+    for title, (keys, names) in SUMMARIES.items():
+        if title == 'Resumen Concepto':
+            tables[title] = concept_totals(result, registry, amounts)
+        elif all(k in frame for k in keys):
+            tables[title] = _group(frame, keys, names)
+    return tables
+
+
+def merge(parts: Iterable[Dict[str, pd.DataFrame]]) -> Dict[str, pd.DataFrame]:
+    """Combine the summarize() tables of several batches (every amount is a sum)."""
+    collected: Dict[str, List[pd.DataFrame]] = {}
+    for tables in parts:
+        for title, table in tables.items():
+            collected.setdefault(title, []).append(table)
+    merged = {}
+    for title, tables in collected.items():
+        if len(tables) == 1:
+            merged[title] = tables[0]
+            continue
+        keys, names = SUMMARIES[title]
+        merged[title] = _group(pd.concat(tables, ignore_index=True), keys, names)[tables[0].columns]
+    return merged
+
+
+class SummaryBuilder:
+    """Accumulates summarize() over the batches of iter_dataframes()."""
+
+    def __init__(self, registry: Optional[ColumnRegistry] = None, period: str = 'month'):
+        self.registry = registry
+        self.period = period
+        self._parts: List[Dict[str, pd.DataFrame]] = []
+
+    def add(self, result):
+        self._parts.append(summarize(result, self.registry, self.period))
+        if len(self._parts) > 1:
+            self._parts = [merge(self._parts)]
+
+    def tables(self) -> Dict[str, pd.DataFrame]:
+        return merge(self._parts)
@@ -1,15 +1,78 @@
 import streamlit as st
 import pandas as pd
 from xml_handler import NominaXMLHandler
+from column_registry import ColumnRegistry
+from ledger import NominaLedger
+from zip_ingest import MemberFilter, MAX_DEPTH
+from incremental import FolderWatcher
+from payroll_store import PayrollStore
+from metrics import RunMetrics
+from results_browser import ResultsBrowser, PAGE_SIZES
+from chunked_run import ChunkedRun, DEFAULT_BATCH_SIZE
 import io
+import os
+import json
+import hashlib
+import zipfile
+import tempfile
+import time
+import importlib.util
 import estilos
+import exporters
+import result_cache
+import aggregations
+import validation
 
-def to_excel(df):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Nomina')
-    processed_data = output.getvalue()
-    return processed_data
+DOWNLOAD_FORMATS = {
+    "Excel (.xlsx)": ('xlsx', "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "CSV": ('csv', "text/csv"),
+    "Parquet": ('parquet', "application/octet-stream"),
+}
+
+def parquet_available():
+    return importlib.util.find_spec('pyarrow') is not None
+
+def export_download(result, fmt, registry=None):
+    """Exporta el resultado y devuelve (bytes, nombre_archivo, es_zip)."""
+    with tempfile.TemporaryDirectory(prefix="nomina_") as tmp_dir:
+        # En Excel los resúmenes van como hojas adicionales
+        paths = exporters.export(result, os.path.join(tmp_dir, f"Reporte_Nomina_V3.{fmt}"),
+                                 fmt=fmt, registry=registry, summaries=fmt == 'xlsx')
+        if len(paths) == 1:
+            with open(paths[0], 'rb') as f:
+                return f.read(), os.path.basename(paths[0]), False
+        # Libro de conceptos en CSV/Parquet: dos archivos dentro de un ZIP
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as z:
+            for path in paths:
+                z.write(path, arcname=os.path.basename(path))
+        return buffer.getvalue(), "Reporte_Nomina_V3.zip", True
+
+def show_metrics(metrics):
+    """Panel lateral con contadores, tiempos por etapa y archivos más lentos de la última ejecución."""
+    with st.sidebar.expander("📈 Métricas de la última ejecución"):
+        st.markdown(
+            f"**Archivos:** {metrics.files:,} · **Registros:** {metrics.records:,} · "
+            f"**Errores:** {metrics.errors:,}  \n"
+            f"**Leído:** {metrics.bytes / 1024 / 1024:,.1f} MB · **Tiempo:** {metrics.wall:,.2f} s"
+        )
+        stages = metrics.ordered_stages()
+        if stages:
+            st.caption("Tiempo por etapa (lectura y análisis suman todos los hilos/procesos)")
+            st.dataframe(
+                pd.DataFrame({'Etapa': list(stages), 'Segundos': [round(v, 3) for v in stages.values()]}),
+                hide_index=True, use_container_width=True
+            )
+        if metrics.slowest:
+            st.caption("Archivos más lentos")
+            st.dataframe(pd.DataFrame(metrics.slowest), hide_index=True, use_container_width=True)
+        if metrics.failed_files or metrics.unreadable:
+            st.caption("Archivos con error")
+            st.dataframe(pd.DataFrame({'Archivo': metrics.failed_files + metrics.unreadable}),
+                         hide_index=True, use_container_width=True)
+        if metrics.profile:
+            st.caption("Perfil")
+            st.code(metrics.profile, language=None)
 
 def main():
     # 1. Configuración de estilo corporativo
@@ -27,55 +90,434 @@ def main():
     # 3. Sidebar (Eliminada zona de carga lateral exclusiva, ahora es central/tabs)
     estilos.create_sidebar_header()
     st.sidebar.info("Versión 3.1 - Corporativa\n\nSoporte para Carpeta Local y ZIPs")
+
+    # Opciones de rendimiento
+    parallel = st.sidebar.toggle(
+        "⚡ Procesamiento paralelo",
+        value=False,
+        help="Procesa los XML en varios núcleos. Recomendado para lotes grandes."
+    )
+    max_workers = None
+    chunksize = 64
+    if parallel:
+        max_workers = st.sidebar.number_input(
+            "Procesos", min_value=1, max_value=64, value=os.cpu_count() or 1
+        )
+        chunksize = st.sidebar.number_input(
+            "Archivos por lote", min_value=1, max_value=5000, value=64
+        )
+    pipeline = st.sidebar.toggle(
+        "🔀 Procesamiento canalizado",
+        value=False,
+        help="Recorre la carpeta, lee y analiza los XML al mismo tiempo. "
+             "Recomendado para carpetas en red (SMB)."
+    )
+    process_options = dict(parallel=parallel, max_workers=max_workers, chunksize=chunksize,
+                           pipeline=pipeline)
+    batch_size = st.sidebar.number_input(
+        "📦 Recibos por lote", min_value=0, max_value=100000, value=DEFAULT_BATCH_SIZE, step=500,
+        help="Procesa en segundo plano por lotes: barra de progreso, vista previa desde el primer lote "
+             "y botón para detener conservando lo ya procesado. 0 = todo de una vez."
+    )
+
+    output_mode = st.sidebar.radio(
+        "Formato de resultado",
+        ["Ancho", "Libro de conceptos"],
+        help="Ancho: una columna por concepto. Libro de conceptos: una fila por concepto, "
+             "más ligero en lotes grandes con muchos conceptos distintos."
+    )
+    if output_mode == "Libro de conceptos":
+        process_options['output'] = 'ledger'
+
+    dedup_options = {"Conservar todos": None, "Primero": 'first', "Último": 'last', "Más reciente": 'latest'}
+    dedup_label = st.sidebar.selectbox(
+        "🧬 CFDI duplicados (mismo UUID)",
+        list(dedup_options),
+        help="Un mismo timbrado puede venir suelto y dentro de uno o varios ZIP. "
+             "Elige cuál conservar; el resto se descarta antes de analizarlo."
+    )
+    process_options['dedup'] = dedup_options[dedup_label]
+
+    use_cache = st.sidebar.toggle(
+        "🗃️ Caché de análisis",
+        value=False,
+        help="Guarda en disco los XML ya procesados para no volver a analizarlos."
+    )
+    cache_dir = None
+    if use_cache:
+        cache_dir = st.sidebar.text_input(
+            "Carpeta de caché", value=os.path.join(os.path.expanduser("~"), ".nomina_cache")
+        )
+
+    with st.sidebar.expander("🗜️ Opciones de ZIP"):
+        zip_depth = st.number_input(
+            "Niveles de ZIP anidados", min_value=0, max_value=10, value=MAX_DEPTH,
+            help="Cuántos niveles de ZIP dentro de ZIP se abren (0 = solo el ZIP principal)."
+        )
+        max_member_mb = st.number_input(
+            "Omitir XML mayores a (MB)", min_value=0.0, value=0.0, step=1.0,
+            help="0 = sin límite. Se decide con el índice del ZIP, sin descomprimir."
+        )
+        exclude_text = st.text_input(
+            "Omitir archivos que coincidan con",
+            placeholder="ej. *_cancelado.xml, acuse*",
+            help="Patrones separados por coma; aplican a XML y ZIP anidados."
+        )
+        io_threads = st.number_input(
+            "Hilos de lectura", min_value=1, max_value=32, value=1,
+            help="Descomprime varios ZIP a la vez mientras se analizan los XML."
+        )
+    exclude = [p.strip() for p in exclude_text.split(',') if p.strip()]
+    member_filter = None
+    if exclude or max_member_mb:
+        member_filter = MemberFilter(exclude=exclude, max_bytes=int(max_member_mb * 1024 * 1024) or None)
+
+    layout_file = st.sidebar.file_uploader(
+        "📐 Plantilla de columnas",
+        type=['json'],
+        help="Usa el orden y las columnas de un reporte anterior."
+    )
+    if layout_file is not None:
+        process_options['keep_layout'] = True
+
+    profile_options = {"Ninguno": None, "cProfile": 'cprofile', "tracemalloc": 'tracemalloc'}
+    profile_label = st.sidebar.selectbox(
+        "🔬 Perfilado", list(profile_options),
+        help="Perfila la siguiente ejecución (tiempo por función o memoria por línea)."
+    )
+    process_options['profile'] = profile_options[profile_label]
+
+    # Caché de resultados de la sesión: evita reprocesar y reexportar en cada interacción
+    max_mb = st.sidebar.number_input(
+        "Memoria para resultados (MB)", min_value=64, max_value=65536, value=1024,
+        help="Resultados y descargas se conservan en la sesión hasta este límite."
+    )
+    if 'results' not in st.session_state:
+        st.session_state['results'] = result_cache.ResultCache()
+    results = st.session_state['results']
+    results.max_bytes = int(max_mb) * 1024 * 1024
+    if st.sidebar.button("🧹 Limpiar resultados", disabled=len(results) == 0):
+        results.invalidate()
+        # También se olvida lo ya procesado en modo incremental
+        st.session_state.pop('watchers', None)
+
+    # Solo lo que cambia el resultado forma parte de la llave (no procesos ni caché en disco)
+    result_options = {
+        'output': process_options.get('output', 'wide'),
+        'dedup': process_options['dedup'],
+        'profile': process_options['profile'],
+        'zip': (zip_depth, max_member_mb, tuple(exclude)),
+        'layout': hashlib.sha256(layout_file.getvalue()).hexdigest() if layout_file is not None else None,
+    }
+
+    def new_handler(registry=None):
+        if layout_file is not None:
+            registry = ColumnRegistry.from_dict(json.loads(layout_file.getvalue()))
+        return NominaXMLHandler(cache_dir=cache_dir or None, registry=registry, member_filter=member_filter,
+                                max_zip_depth=zip_depth, io_threads=io_threads)
+
+    def store_result(key, handler, result):
+        results.put(key, result, handler.registry, {'metrics': handler.metrics})
+
+    def get_watcher(path):
+        """Vigilante incremental de la carpeta (uno por ruta y opciones), con su resultado acumulado."""
+        if process_options.get('output') == 'ledger':
+            estilos.warning_message("El modo incremental solo está disponible con el formato Ancho.")
+            return None, None
+        key = 'watch:' + hashlib.sha256(
+            f"{os.path.abspath(path)}\0{sorted(result_options.items())!r}".encode('utf-8', 'replace')
+        ).hexdigest()
+        watchers = st.session_state.setdefault('watchers', {})
+        if key not in watchers:
+            watchers[key] = FolderWatcher(path, new_handler())
+        watcher = watchers[key]
+        watcher.options = dict(process_options)
+        return key, watcher
+
+    def poll_watcher(key, watcher):
+        new = watcher.poll()
+        if not new.empty:
+            # Los recibos nuevos se agregan al resultado; las descargas se regeneran
+            store_result(key, watcher.handler, watcher.result)
+        elif key not in results and not watcher.result.empty:
+            store_result(key, watcher.handler, watcher.result)
+        else:
+            results.activate(key)
+        return new
+
+    def start_run(key, handler, files, discovery=0.0):
+        """Procesa por lotes en un hilo; follow_run() muestra el avance en cada rerun."""
+        run = ChunkedRun(handler, files, batch_size=int(batch_size), **process_options).start()
+        st.session_state['active_run'] = {'key': key, 'run': run, 'discovery': discovery}
+
+    def progress_text(progress):
+        done = f"{progress['files']:,} archivos"
+        if progress['total']:
+            done = f"{progress['files']:,} de {progress['total']:,} archivos"
+        text = f"{done} · {progress['records']:,} recibos · {progress['rate']:,.0f} archivos/s"
+        if progress['eta'] is not None and progress['fraction'] < 1:
+            text += f" · faltan ~{progress['eta']:,.0f} s"
+        return text
+
+    def follow_run(active):
+        """
+        Barra de avance y vista previa del último lote hasta que el hilo termina.
+        Detener (o cualquier otro control) provoca un rerun que interrumpe este ciclo;
+        el procesamiento sigue en su hilo y el siguiente rerun lo retoma aquí.
+        """
+        run = active['run']
+        st.markdown("---")
+        estilos.create_section_header("Procesando", "⏳")
+        if st.button("⏹️ Detener", key="stop_run", help="Conserva los recibos ya procesados."):
+            run.cancel()
+        if run.cancelled:
+            st.caption("Deteniendo: se terminan los archivos en curso...")
+        bar = st.empty()
+        preview = st.empty()
+        shown = 0
+        while True:
+            finished = run.wait(0.5)
+            progress = run.progress()
+            bar.progress(progress['fraction'] or 0.0, text=progress_text(progress))
+            if progress['batches'] != shown and not finished:
+                shown = progress['batches']
+                batch = run.batches[shown - 1]
+                with preview.container():
+                    st.caption(f"Vista previa del lote {shown} ({progress['records']:,} recibos hasta ahora)")
+                    st.dataframe((batch.headers if isinstance(batch, NominaLedger) else batch).head(100),
+                                 use_container_width=True)
+            if finished:
+                break
+
+        st.session_state.pop('active_run', None)
+        if run.error is not None:
+            estilos.error_message(f"❌ Error durante el procesamiento: {run.error}")
+            return
+        handler = run.handler
+        if active['discovery']:
+            handler.metrics.add_time('discovery', active['discovery'])
+        if not progress['files']:
+            estilos.warning_message("No se encontraron archivos XML o ZIPs válidos.")
+            return
+        if run.cancelled:
+            # El resultado parcial no reemplaza al de la carpeta completa
+            results.put(f"{active['key']}:parcial", run.result(), handler.registry,
+                        {'metrics': handler.metrics, 'partial': True})
+            st.toast(f"Procesamiento detenido: se conservan {progress['records']:,} recibos "
+                     f"de {progress['files']:,} archivos.", icon="⏹️")
+        else:
+            store_result(active['key'], handler, run.result())
+            st.toast(f"Se procesaron {progress['files']:,} archivos XML.", icon="✅")
+        st.rerun()
+
+    def get_store(path):
+        """Base de datos local abierta (una conexión por ruta durante la sesión)."""
+        stores = st.session_state.setdefault('stores', {})
+        path = os.path.abspath(os.path.expanduser(path))
+        if path not in stores:
+            stores[path] = PayrollStore(path)
+        return stores[path]
     
     # 4. Área Principal
     estilos.create_section_header("Carga y Procesamiento", "📥")
 
-    tab1, tab2 = st.tabs(["📂 Cargar Archivos", "💻 Carpeta Local"])
-    
-    df = pd.DataFrame() # Initialize empty DF
+    # Un procesamiento por lotes en curso deshabilita los botones hasta que termine
+    busy = 'active_run' in st.session_state
 
+    tab1, tab2, tab3 = st.tabs(["📂 Cargar Archivos", "💻 Carpeta Local", "🗄️ Base de Datos"])
+    
     with tab1:
         uploaded_files = st.file_uploader(
-            "Selecciona archivos XML", 
-            type=['xml'], 
+            "Selecciona archivos XML o ZIP", 
+            type=['xml', 'zip'], 
             accept_multiple_files=True,
-            help="Selecciona uno o más archivos XML de nómina."
+            help="Selecciona uno o más archivos XML de nómina, o ZIPs que los contengan."
         )
         if uploaded_files:
             estilos.info_message(f"📂 **{len(uploaded_files)}** archivos listos.")
-            if st.button("🚀 Procesar Archivos (Subida)", type="primary"):
-                with st.spinner("Procesando archivos subidos..."):
-                    handler = NominaXMLHandler()
-                    df = handler.process_files(uploaded_files)
+            if st.button("🚀 Procesar Archivos (Subida)", type="primary", disabled=busy):
+                key = result_cache.hash_uploads(uploaded_files, result_options)
+                if results.activate(key):
+                    st.toast("Estos archivos ya se procesaron; se reutiliza el resultado.", icon="♻️")
+                elif batch_size:
+                    handler = new_handler()
+                    start_run(key, handler, handler.iter_uploads(uploaded_files))
+                else:
+                    with st.spinner("Procesando archivos subidos..."):
+                        handler = new_handler()
+                        # Los ZIP subidos se leen desde su propio búfer, sin copiarlos
+                        files = handler.iter_uploads(uploaded_files)
+                        store_result(key, handler, handler.process_files(files, **process_options))
 
     with tab2:
         st.markdown("Ingresa la ruta absoluta de la carpeta que contiene tus archivos XML o ZIPs.")
         local_path = st.text_input("Ruta de la carpeta local", placeholder="ej. C:\\Documentos\\Nominas2024")
+        incremental = st.toggle(
+            "🔁 Solo archivos nuevos",
+            help="Recuerda lo ya procesado de esta carpeta (ruta, tamaño, fecha y UUID): cada escaneo "
+                 "solo lee lo nuevo y agrega sus recibos al resultado, sin reprocesar todo."
+        )
+        watch_every = 0
+        if incremental and hasattr(st, 'fragment'):
+            watch_every = st.number_input(
+                "Revisar la carpeta cada (segundos)", min_value=0, max_value=3600, value=0,
+                help="0 = solo al presionar el botón."
+            )
         
         if local_path:
-            import os
             if os.path.exists(local_path):
-                if st.button("🚀 Escanear y Procesar Carpeta", type="primary"):
-                    with st.spinner(f"Escaneando {local_path} (incluyendo ZIPs)..."):
-                        handler = NominaXMLHandler()
-                        # Scan
-                        found_files = handler.scan_directory(local_path)
-                        
-                        if found_files:
-                            st.toast(f"Se encontraron {len(found_files)} archivos XML.", icon="✅")
-                            df = handler.process_files(found_files)
+                if incremental and watch_every:
+                    @st.fragment(run_every=watch_every)
+                    def watch_folder():
+                        key, watcher = get_watcher(local_path)
+                        if watcher is not None and not poll_watcher(key, watcher).empty:
+                            st.rerun()
+                    watch_folder()
+
+                if st.button("🚀 Escanear y Procesar Carpeta", type="primary", disabled=busy):
+                    key = None if incremental else result_cache.hash_directory(local_path, result_options)
+                    if incremental:
+                        key, watcher = get_watcher(local_path)
+                        if watcher is not None:
+                            with st.spinner(f"Buscando archivos nuevos en {local_path}..."):
+                                new = poll_watcher(key, watcher)
+                            if new.empty:
+                                st.toast("No hay recibos nuevos en la carpeta.", icon="💤")
+                            else:
+                                st.toast(f"{len(new)} recibos nuevos agregados ({len(watcher.result)} en total).", icon="✅")
+                            if watcher.deferred:
+                                st.toast(f"{watcher.deferred} archivos se están copiando; se leerán en la siguiente revisión.", icon="⏳")
+                    elif results.activate(key):
+                        st.toast("La carpeta no ha cambiado; se reutiliza el resultado.", icon="♻️")
+                    elif batch_size:
+                        handler = new_handler()
+                        if pipeline:
+                            # El recorrido corre en su propio hilo; el total no se conoce de antemano
+                            start_run(key, handler, handler.iter_directory(local_path))
                         else:
-                            estilos.warning_message("No se encontraron archivos XML o ZIPs válidos en esta ruta.")
+                            with st.spinner(f"Buscando archivos en {local_path} (incluyendo ZIPs)..."):
+                                t = time.perf_counter()
+                                found_files = list(handler.iter_directory(local_path))
+                                discovery = time.perf_counter() - t
+                            if found_files:
+                                start_run(key, handler, found_files, discovery)
+                            else:
+                                estilos.warning_message("No se encontraron archivos XML o ZIPs válidos en esta ruta.")
+                    else:
+                        with st.spinner(f"Escaneando {local_path} (incluyendo ZIPs)..."):
+                            handler = new_handler()
+                            if pipeline:
+                                # El recorrido de la carpeta corre en su propio hilo mientras se procesa
+                                result = handler.process_files(handler.iter_directory(local_path), **process_options)
+                                found = handler.metrics.files + len(handler.metrics.unreadable) + len(handler.metrics.duplicates)
+                            else:
+                                # Scan (lazy handles: XML bytes are read while processing)
+                                t = time.perf_counter()
+                                found_files = list(handler.iter_directory(local_path))
+                                discovery = time.perf_counter() - t
+                                found = len(found_files)
+                                if found_files:
+                                    result = handler.process_files(found_files, **process_options)
+                                    handler.metrics.add_time('discovery', discovery)
+
+                            if found:
+                                st.toast(f"Se encontraron {found} archivos XML.", icon="✅")
+                                store_result(key, handler, result)
+                            else:
+                                estilos.warning_message("No se encontraron archivos XML o ZIPs válidos en esta ruta.")
             else:
                 estilos.error_message("❌ La ruta especificada no existe.")
+
+    with tab3:
+        st.markdown("Guarda los recibos en una base local (SQLite) y consúltalos al instante, sin reprocesar carpetas.")
+        store_path = st.text_input(
+            "Archivo de la base", value=os.path.join(os.path.expanduser("~"), ".nomina_store.sqlite")
+        )
+        if store_path:
+            # La base se abre solo si ya existe; se crea al agregar la primera carpeta
+            store = get_store(store_path) if os.path.exists(os.path.expanduser(store_path)) else None
+            summary = store.stats() if store is not None else {'receipts': 0}
+            if summary['receipts']:
+                st.caption(f"🗄️ {summary['receipts']:,} recibos y {summary['lines']:,} conceptos, "
+                           f"pagados del {summary['first']} al {summary['last']}")
+
+            with st.expander("📥 Agregar una carpeta a la base"):
+                store_folder = st.text_input("Carpeta con XML o ZIPs", key="store_folder")
+                replace = st.toggle(
+                    "Reemplazar recibos ya guardados",
+                    help="Si un UUID ya está en la base se sustituye; si no, se omite."
+                )
+                if st.button("📥 Agregar a la base", disabled=not store_folder):
+                    if os.path.exists(store_folder):
+                        with st.spinner(f"Guardando {store_folder} en la base..."):
+                            store = get_store(store_path)
+                            handler = new_handler(store.registry())
+                            counts = store.ingest(handler.iter_directory(store_folder), handler=handler,
+                                                  replace=replace, **process_options)
+                        st.toast(f"{counts['inserted']} recibos nuevos, {counts['replaced']} reemplazados, "
+                                 f"{counts['skipped']} ya estaban en la base.", icon="✅")
+                        st.rerun()
+                    else:
+                        estilos.error_message("❌ La ruta especificada no existe.")
+
+            col_rfc, col_year = st.columns(2)
+            with col_rfc:
+                rfc = st.text_input("RFC (emisor o receptor)", placeholder="Todos").strip().upper()
+            with col_year:
+                year = st.number_input("Año de pago", min_value=0, max_value=2100, value=0,
+                                       help="0 = todos los años.")
+            filters = {'rfc': rfc or None, 'year': int(year) or None}
+            if st.button("📤 Consultar la base", type="primary", disabled=not summary['receipts']):
+                # La llave cambia cuando la base recibe recibos nuevos
+                key = 'store:' + hashlib.sha256(
+                    f"{store.path}\0{sorted(filters.items())!r}\0{sorted(summary.items())!r}\0"
+                    f"{result_options['output']}".encode('utf-8', 'replace')
+                ).hexdigest()
+                if not results.activate(key):
+                    store_metrics = RunMetrics()
+                    with store_metrics.stage('query'):
+                        result = store.to_ledger(**filters)
+                        if result_options['output'] != 'ledger':
+                            result = result.to_wide()
+                    store_metrics.records = len(result)
+                    store_metrics.wall = store_metrics.stages['query']
+                    if store_metrics.records:
+                        results.put(key, result, store.registry(), {'metrics': store_metrics})
+                    else:
+                        estilos.warning_message("Ningún recibo coincide con la consulta.")
+
+            if summary['receipts'] and st.toggle("Totales por concepto y periodo"):
+                by = st.radio("Periodo", ["Mes", "Año", "Fecha de pago"], horizontal=True)
+                totals = store.concept_totals(by={'Mes': 'month', 'Año': 'year', 'Fecha de pago': 'date'}[by],
+                                              **filters)
+                st.dataframe(totals, hide_index=True, use_container_width=True)
                 
-    # Resultados compartidos
+    # Procesamiento por lotes en curso (sobrevive a los reruns de Streamlit)
+    if 'active_run' in st.session_state:
+        follow_run(st.session_state['active_run'])
+
+    # Resultados compartidos (sobreviven a los reruns de Streamlit)
+    entry = results.get()
+    result = entry['result'] if entry is not None else pd.DataFrame()
+    metrics = entry['info']['metrics'] if entry is not None else None
+    ledger = result if isinstance(result, NominaLedger) else None
+    df = ledger.headers if ledger is not None else result
     if not df.empty:
         st.markdown("---")
         estilos.create_section_header("Resultados", "📊")
-        estilos.success_message("✅ Procesamiento completado exitosamente")
+        if entry['info'].get('partial'):
+            estilos.warning_message("⏹️ Resultado parcial: el procesamiento se detuvo antes de terminar.")
+        else:
+            estilos.success_message("✅ Procesamiento completado exitosamente")
+        if metrics.cache is not None:
+            stats = metrics.cache
+            st.caption(f"🗃️ Caché: {stats['hits']} aciertos, {stats['misses']} fallos, {stats['entries']} registros guardados")
         
+        duplicates = metrics.duplicates
+        if duplicates:
+            with st.expander(f"🧬 {len(duplicates)} CFDI duplicados descartados"):
+                st.dataframe(pd.DataFrame(duplicates), use_container_width=True)
+
         # Estadísticas
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -90,18 +532,104 @@ def main():
 
         # Vista Previa
         st.subheader("Vista Previa de Datos")
-        st.dataframe(df.head(50), use_container_width=True)
+        # Índices de filtrado: se construyen una vez por resultado; al navegador solo va la página
+        if 'browser' not in entry['info']:
+            entry['info']['browser'] = ResultsBrowser(result, entry['registry'])
+        browser = entry['info']['browser']
+        col_rfc, col_uuid, col_fecha = st.columns(3)
+        with col_rfc:
+            rfc_filter = st.text_input("RFC", placeholder="Emisor o receptor", key="browse_rfc")
+        with col_uuid:
+            uuid_filter = st.text_input("UUID", placeholder="Inicio del UUID", key="browse_uuid")
+        with col_fecha:
+            dates = st.date_input("Fecha de pago", value=(), key="browse_dates")
+        sections = st.multiselect("Secciones", browser.sections, default=browser.sections, key="browse_sections")
+        found = browser.filter(rfc=rfc_filter, uuid=uuid_filter,
+                               start=dates[0] if len(dates) > 0 else None,
+                               end=dates[1] if len(dates) > 1 else None)
+        col_size, col_page = st.columns(2)
+        with col_size:
+            page_size = st.selectbox("Filas por página", PAGE_SIZES, index=1, key="browse_size")
+        with col_page:
+            # Un filtro más estrecho puede dejar la página actual fuera de rango
+            if st.session_state.get("browse_page", 1) > browser.pages(page_size):
+                st.session_state["browse_page"] = browser.pages(page_size)
+            page_number = st.number_input("Página", min_value=1, max_value=browser.pages(page_size),
+                                          value=1, key="browse_page")
+        page = browser.page(page_number, page_size, browser.columns(sections))
+        first = (page_number - 1) * page_size
+        st.caption(f"Mostrando {min(first + 1, found):,}–{first + len(page):,} de {found:,} registros"
+                   + (f" (filtrados de {len(df):,})" if found != len(df) else ""))
+        if ledger is not None:
+            tab_enc, tab_con = st.tabs(["Encabezados", "Conceptos"])
+            with tab_enc:
+                st.dataframe(page, use_container_width=True)
+            with tab_con:
+                st.dataframe(browser.lines(page), use_container_width=True)
+        else:
+            st.dataframe(page, use_container_width=True)
+
+        # Resúmenes: se calculan una vez por resultado y se guardan con él
+        st.subheader("Resúmenes")
+        if 'summaries' not in entry['info']:
+            with metrics.stage('summaries'):
+                entry['info']['summaries'] = aggregations.summarize(result, entry['registry'])
+        summaries = entry['info']['summaries']
+        for tab, (title, table) in zip(st.tabs(list(summaries)), summaries.items()):
+            with tab:
+                st.dataframe(table, hide_index=True, use_container_width=True)
+
+        # Validación aritmética de los totales declarados
+        if 'exceptions' not in entry['info']:
+            with metrics.stage('validate'):
+                entry['info']['exceptions'] = validation.validate(result, entry['registry'])
+        exceptions = entry['info']['exceptions']
+        if exceptions.empty:
+            estilos.success_message("🧮 Los totales de todos los recibos cuadran con sus conceptos.")
+        else:
+            counts = validation.summary(exceptions)
+            receipts = exceptions['UUID'].nunique()
+            estilos.warning_message(f"🧮 {receipts} recibos con totales que no cuadran ({len(exceptions)} diferencias).")
+            with st.expander("Ver diferencias"):
+                st.dataframe(
+                    pd.DataFrame({'Regla': list(validation.RULES.values()), 'Recibos': list(counts.values())}),
+                    hide_index=True, use_container_width=True
+                )
+                st.dataframe(exceptions, hide_index=True, use_container_width=True)
+                st.download_button(
+                    label="📥 Descargar diferencias (CSV)",
+                    data=exceptions.to_csv(index=False).encode('utf-8-sig'),
+                    file_name="Validacion_Nomina.csv",
+                    mime="text/csv"
+                )
         
         # Descarga
-        excel_data = to_excel(df)
+        formats = [f for f in DOWNLOAD_FORMATS if f != "Parquet" or parquet_available()]
+        fmt_label = st.selectbox("Formato de descarga", formats)
+        fmt, mime = DOWNLOAD_FORMATS[fmt_label]
+        with st.spinner("Generando archivo de descarga..."):
+            def timed_export(result, fmt, registry):
+                with metrics.stage('export'):
+                    return export_download(result, fmt, registry)
+            data, file_name, is_zip = results.export(fmt, timed_export)
         st.download_button(
-            label="📥 Descargar Reporte Excel",
-            data=excel_data,
-            file_name="Reporte_Nomina_V3.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            label=f"📥 Descargar Reporte {fmt_label}",
+            data=data,
+            file_name=file_name,
+            mime="application/zip" if is_zip else mime
         )
+        if entry['registry'] is not None:
+            st.download_button(
+                label="📐 Descargar Plantilla de Columnas",
+                data=json.dumps(entry['registry'].to_dict(), ensure_ascii=False),
+                file_name="Plantilla_Columnas_Nomina.json",
+                mime="application/json"
+            )
 
         
+    if metrics is not None:
+        show_metrics(metrics)
+
     # Footer
     estilos.create_footer(
         "Sistema de Nómina Corporativo",
@@ -0,0 +1,230 @@
+"""
+Throughput and memory benchmarks on a synthetic corpus (see synthetic_cfdi.py).
+
+    python benchmark.py                          # 1k, 10k and 100k documents
+    python benchmark.py --sizes 1000 10000 -o bench_$(git rev-parse --short HEAD).json
+    python benchmark.py --sizes 10000 --compare bench_old.json
+    python benchmark.py --sizes 10000 --cases large_files uploads --no-mmap   # copy-based I/O
+    python benchmark.py --sizes 10000 --backend stdlib -o stdlib.json
+    python benchmark.py --sizes 10000 --backend lxml --compare stdlib.json   # XML parser backends
+
+Each case runs in a fresh subprocess so its peak RSS is not inflated by earlier
+cases. Results are written as JSON so runs from different commits can be compared.
+large_files and uploads use size // LARGE_DOC_RATIO documents with a LARGE_DOC_KB Addenda,
+processed in pipelined mode (reader threads keep several runs of files in flight).
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from xml_backends import BACKENDS, DEFAULT_BACKEND
+
+CASES = ['parse_xml_content', 'scan_directory', 'process_files', 'to_excel', 'large_files', 'uploads']
+DEFAULT_SIZES = [1000, 10000, 100000]
+LARGE_DOC_KB = 4096
+LARGE_DOC_RATIO = 200
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _corpus_dir(workdir, size, seed):
+    """On-disk corpus for scan_directory: ZIP packages of 1000 plus some loose XML, built once."""
+    from synthetic_cfdi import SyntheticCFDI
+
+    path = os.path.join(workdir, f'corpus_{size}_{seed}')
+    marker = os.path.join(path, '.complete')
+    if os.path.exists(marker):
+        return path
+    generator = SyntheticCFDI(seed=seed)
+    loose = size // 10
+    generator.write(path, size - loose, per_zip=1000)
+    for i in range(size - loose, size):
+        with open(os.path.join(path, generator.filename(i)), 'wb') as f:
+            f.write(generator.document(i))
+    open(marker, 'w').close()
+    return path
+
+
+def _large_corpus_dir(workdir, size, seed):
+    """Loose XML files with a large Addenda, built once."""
+    from synthetic_cfdi import SyntheticCFDI
+
+    path = os.path.join(workdir, f'large_{size}_{seed}')
+    marker = os.path.join(path, '.complete')
+    if os.path.exists(marker):
+        return path
+    SyntheticCFDI(seed=seed, addenda_kb=LARGE_DOC_KB).write(path, max(1, size // LARGE_DOC_RATIO))
+    open(marker, 'w').close()
+    return path
+
+
+class _Upload(io.BytesIO):
+    """Stand-in for Streamlit's UploadedFile (a BytesIO with a name)."""
+
+    def __init__(self, content, name):
+        super().__init__(content)
+        self.name = name
+
+
+def run_case(case, size, seed, workdir, backend=None):
+    """Run one case in this process and return its measurements."""
+    import logging
+    logging.disable(logging.INFO)
+    from synthetic_cfdi import SyntheticCFDI
+    from xml_handler import NominaXMLHandler
+
+    handler = NominaXMLHandler(backend=backend)
+    if case == 'scan_directory':
+        path = _corpus_dir(workdir, size, seed)
+    elif case == 'large_files':
+        path = _large_corpus_dir(workdir, size, seed)
+    elif case == 'uploads':
+        generator = SyntheticCFDI(seed=seed, addenda_kb=LARGE_DOC_KB)
+        uploads = [_Upload(content, name) for content, name in generator.iter_documents(max(1, size // LARGE_DOC_RATIO))]
+    else:
+        corpus = list(SyntheticCFDI(seed=seed).iter_documents(size))
+    if case == 'to_excel':
+        df = handler.process_files(corpus)
+        del corpus
+    setup_rss = _peak_rss_mb()
+
+    start = time.perf_counter()
+    if case == 'parse_xml_content':
+        for content, name in corpus:
+            handler.parse_xml_content(content, name)
+        items = size
+    elif case == 'scan_directory':
+        items = len(handler.scan_directory(path))
+    elif case == 'process_files':
+        items = len(handler.process_files(corpus))
+    elif case == 'to_excel':
+        # Streaming writer behind exporters.export() (the app's Excel download), without Streamlit
+        import exporters
+        os.remove(exporters.write_excel(df, sheet_name='Nomina'))
+        items = len(df)
+    elif case == 'large_files':
+        items = len(handler.process_files(handler.iter_directory(path), pipeline=True))
+    elif case == 'uploads':
+        items = len(handler.process_files(uploads, pipeline=True))
+    else:
+        raise ValueError(f"Unknown case: {case}")
+    elapsed = time.perf_counter() - start
+
+    return {
+        'case': case,
+        'size': size,
+        'items': items,
+        'seconds': round(elapsed, 3),
+        'files_per_sec': round(items / elapsed, 1) if elapsed else None,
+        'setup_rss_mb': setup_rss,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        return out.stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['case'], r['size']): r for r in json.load(f)['results']}
+    print(f"\nvs {baseline_path}")
+    for r in results:
+        old = baseline.get((r['case'], r['size']))
+        if not old or not old.get('files_per_sec') or not r.get('files_per_sec'):
+            continue
+        speed = r['files_per_sec'] / old['files_per_sec']
+        rss = ''
+        if old.get('peak_rss_mb') and r.get('peak_rss_mb'):
+            rss = f", peak RSS {r['peak_rss_mb'] / old['peak_rss_mb']:.2f}x"
+        print(f"  {r['case']:<18} {r['size']:>7}: throughput {speed:.2f}x{rss}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=CASES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'nomina_bench'),
+                        help="Where on-disk corpora are generated (reused between runs)")
+    parser.add_argument('-o', '--output', default='benchmark_results.json')
+    parser.add_argument('--compare', default=None, help="Previous results JSON to compare against")
+    parser.add_argument('--no-mmap', action='store_true', help="Read files into bytes instead of mapping them")
+    parser.add_argument('--backend', choices=BACKENDS, default=None,
+                        help=f"XML parser backend (default: {DEFAULT_BACKEND})")
+    parser.add_argument('--run', nargs=2, metavar=('CASE', 'SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.no_mmap:
+        import io_buffers
+        io_buffers.MMAP_THRESHOLD = None
+
+    if args.run:
+        # Child process: one case, result as JSON on stdout
+        print(json.dumps(run_case(args.run[0], int(args.run[1]), args.seed, args.workdir,
+                                  args.backend)))
+        return
+
+    os.makedirs(args.workdir, exist_ok=True)
+    results = []
+    for size in args.sizes:
+        for case in args.cases:
+            cmd = [sys.executable, os.path.abspath(__file__), '--run', case, str(size),
+                   '--seed', str(args.seed), '--workdir', args.workdir]
+            if args.no_mmap:
+                cmd.append('--no-mmap')
+            if args.backend:
+                cmd += ['--backend', args.backend]
+            proc = subprocess.run(cmd, capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__)))
+            if proc.returncode != 0:
+                print(f"{case} @ {size}: FAILED\n{proc.stderr}", file=sys.stderr)
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(f"{case:<18} {size:>7}: {result['files_per_sec']:>10,.0f} files/s  "
+                  f"{result['seconds']:>8.2f} s  peak RSS {result['peak_rss_mb']} MB")
+
+    report = {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': args.seed,
+        'mmap': not args.no_mmap,
+        'backend': args.backend or DEFAULT_BACKEND,
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
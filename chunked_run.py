@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+from column_registry import ColumnRegistry
+from columnar import fill_missing
+from ledger import LINE_COLUMNS, NominaLedger
+
+logger = logging.getLogger(__name__)
+
+# Receipts per batch: small enough for a first preview within a second or two,
+# large enough that building the batches costs little next to parsing
+DEFAULT_BATCH_SIZE = 1000
+
+
+def merge_results(batches: List[Any], registry: ColumnRegistry):
+    """
+    One result from the batches of iter_dataframes(): the columns of every batch in the
+    registry layout, missing ones filled like ColumnarBuilder does ('' for header fields,
+    0.0 for amounts). The index (Registro) already counts across batches.
+    """
+    if len(batches) == 1:
+        return batches[0]
+    if isinstance(batches[0], NominaLedger):
+        headers = _concat([b.headers for b in batches], registry)
+        lines = pd.concat([b.lines for b in batches], ignore_index=True)
+        for name in ('UUID', 'Seccion', 'Clave', 'Concepto'):
+            lines[name] = pd.Categorical(lines[name].astype(str))
+        return NominaLedger(headers, lines[LINE_COLUMNS], registry, keep_layout=batches[0].keep_layout)
+    return _concat(batches, registry)
+
+
+def _concat(frames: List[pd.DataFrame], registry: ColumnRegistry) -> pd.DataFrame:
+    columns = registry.layout(set().union(*(f.columns for f in frames)))
+    return pd.concat([fill_missing(f, columns, registry)[columns] for f in frames])
+
+
+class ChunkedRun:
+    """
+    process_files() in batches of batch_size receipts on a background thread, so a UI can
+    follow it: progress() reports files done, throughput and ETA while it runs, batches
+    holds the results finished so far (the first one as soon as batch_size receipts are
+    parsed) and cancel() stops it cooperatively: no new file is handed to the handler,
+    the receipts already parsed are built into a last batch and result() returns them.
+    handler: a NominaXMLHandler used by this run only; its metrics follow the run.
+    total: number of input files when known (len(files) if it has one), for the ETA.
+    options: iter_dataframes() keyword arguments.
+    """
+
+    def __init__(self, handler: Any, files: Iterable[Any], batch_size: int = DEFAULT_BATCH_SIZE,
+                 total: Optional[int] = None, **options):
+        self.handler = handler
+        self.batch_size = batch_size
+        self.total = total if total is not None else (len(files) if hasattr(files, '__len__') else None)
+        self.options = options
+        self.batches: List[Any] = []
+        self.error: Optional[BaseException] = None
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._files = files
+        self._cancel = threading.Event()
+        self._merged = None
+        self._merged_count = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'ChunkedRun':
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='nomina-chunked', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            for batch in self.handler.iter_dataframes(self._until_cancelled(self._files),
+                                                      batch_size=self.batch_size, **self.options):
+                self.batches.append(batch)
+        except BaseException as e:
+            logger.exception("Chunked run failed")
+            self.error = e
+        finally:
+            self._files = None
+            self.finished = time.perf_counter()
+
+    def _until_cancelled(self, files: Iterable[Any]) -> Iterator[Any]:
+        it = iter(files)
+        try:
+            for item in it:
+                if self._cancel.is_set():
+                    return
+                yield item
+        finally:
+            # Lazy sources (iter_directory, iter_uploads) release their handles
+            close = getattr(it, 'close', None)
+            if close is not None:
+                close()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the run ends (or timeout seconds); True if it ended."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.done
+
+    def progress(self) -> Dict[str, Any]:
+        """
+        files (read so far, including unreadable ones), total, records, errors, batches,
+        elapsed seconds, rate (files per second), eta (seconds, None without a total)
+        and fraction (0..1, None without a total).
+        """
+        metrics = self.handler.metrics
+        files = metrics.files + len(metrics.unreadable)
+        end = self.finished if self.finished is not None else time.perf_counter()
+        elapsed = end - self.started if self.started is not None else 0.0
+        rate = files / elapsed if elapsed > 0 else 0.0
+        eta = fraction = None
+        if self.total:
+            fraction = 1.0 if self.done else min(files / self.total, 1.0)
+            eta = 0.0 if self.done else (max(self.total - files, 0) / rate if rate else None)
+        return {'files': files, 'total': self.total, 'records': metrics.records, 'errors': metrics.errors,
+                'batches': len(self.batches), 'elapsed': elapsed, 'rate': rate, 'eta': eta,
+                'fraction': fraction}
+
+    def result(self):
+        """
+        The batches as one result (None before the first one). Call it once the run is
+        done: while it runs the handler keeps registering columns; batches[-1] is the
+        latest batch for a preview.
+        """
+        count = len(self.batches)
+        if not count:
+            return None
+        if count != self._merged_count:
+            self._merged = merge_results(self.batches[:count], self.handler.registry)
+            self._merged_count = count
+        return self._merged
@@ -0,0 +1,217 @@
+"""
+Headless batch entry point (no Streamlit needed).
+
+    python cli.py /ruta/nominas extra.zip -o reporte.xlsx --workers 8 --cache-dir ~/.nomina_cache
+    python cli.py /mnt/pac/entregas -o reporte.csv --watch 60
+
+Prints a JSON summary (files, records, errors, elapsed seconds per stage) to stdout;
+logs go to stderr. With --manifest or --watch only files not ingested before are
+read, and their records are appended to the report (one summary line per poll).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+
+from xml_handler import NominaXMLHandler
+from xml_backends import BACKENDS
+from column_registry import ColumnRegistry
+from extraction_spec import load_spec
+from zip_ingest import MAX_DEPTH, MemberFilter
+from incremental import SETTLE_SECONDS, DirectoryManifest, FolderWatcher
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Procesa XML de nómina (CFDI) de carpetas, archivos XML o ZIP y exporta el reporte."
+    )
+    parser.add_argument('inputs', nargs='+', help="Carpetas, archivos .xml o .zip")
+    parser.add_argument('-o', '--output', required=True, help="Archivo de salida")
+    parser.add_argument('-f', '--format', choices=['xlsx', 'csv', 'parquet'],
+                        help="Formato de salida (por defecto, según la extensión de --output)")
+    parser.add_argument('--mode', choices=['wide', 'ledger'], default='wide',
+                        help="wide: una columna por concepto; ledger: encabezados + una fila por concepto")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="Procesos para analizar XML (1 = serial)")
+    parser.add_argument('--chunksize', type=int, default=64, help="Archivos por tarea en modo paralelo")
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help="Exporta por lotes de N recibos sin armar un DataFrame completo; "
+                             "en formato ancho los lotes se escriben con todas las columnas encontradas")
+    parser.add_argument('--resumen', action='store_true',
+                        help="Agrega resúmenes por trabajador, periodo, concepto y patrón (hojas o archivos _resumen_*)")
+    parser.add_argument('--validar', action='store_true',
+                        help="Revisa totales de percepciones, deducciones y Total; las diferencias van a <salida>_validacion")
+    parser.add_argument('--dedup', choices=['first', 'last', 'latest'], default=None,
+                        help="Descarta CFDI repetidos por UUID: conserva el primero, el último o el más reciente")
+    parser.add_argument('--zip-depth', type=int, default=MAX_DEPTH, help="Niveles de ZIP anidados a abrir")
+    parser.add_argument('--max-member-mb', type=float, default=None, help="Omite XML dentro de ZIP mayores a N MB")
+    parser.add_argument('--exclude', action='append', default=[], metavar='PATRÓN',
+                        help="Omite miembros de ZIP cuyo nombre coincida (repetible, ej. '*_cancelado.xml')")
+    parser.add_argument('--io-threads', type=int, default=1, help="Hilos que descomprimen ZIP por adelantado")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="Recorre, lee y analiza a la vez (útil en carpetas de red)")
+    parser.add_argument('--backend', choices=BACKENDS, default=None,
+                        help="Analizador XML (por defecto stdlib; lxml requiere pip install lxml)")
+    parser.add_argument('--cache-dir', default=None, help="Carpeta de la caché de análisis")
+    parser.add_argument('--layout', default=None, help="Plantilla de columnas (JSON) a respetar")
+    parser.add_argument('--save-layout', default=None, help="Guarda la plantilla de columnas resultante")
+    parser.add_argument('--spec', default=None,
+                        help="Campos de encabezado a extraer (JSON, ver extraction_spec.py)")
+    parser.add_argument('--profile', choices=['cprofile', 'tracemalloc'], default=None,
+                        help="Perfila la ejecución; el reporte se escribe en stderr")
+    parser.add_argument('--manifest', default=None,
+                        help="Modo incremental: registro de lo ya procesado (por defecto, <salida>.manifest)")
+    parser.add_argument('--watch', type=float, default=None, metavar='SEGUNDOS',
+                        help="Revisa las carpetas cada N segundos y agrega los recibos nuevos al reporte")
+    parser.add_argument('--settle', type=float, default=SETTLE_SECONDS,
+                        help="Espera a que un archivo tenga N segundos sin cambios antes de leerlo")
+    return parser
+
+
+def _output_format(args: argparse.Namespace) -> str:
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip('.').lower()
+    if fmt not in ('xlsx', 'csv', 'parquet'):
+        raise SystemExit(f"Formato de salida no soportado: '{fmt}' (usa --format)")
+    return fmt
+
+
+def _new_handler(args: argparse.Namespace, registry=None) -> NominaXMLHandler:
+    member_filter = None
+    if args.exclude or args.max_member_mb:
+        max_bytes = int(args.max_member_mb * 1024 * 1024) if args.max_member_mb else None
+        member_filter = MemberFilter(exclude=args.exclude, max_bytes=max_bytes)
+    return NominaXMLHandler(cache_dir=args.cache_dir, registry=registry, member_filter=member_filter,
+                            max_zip_depth=args.zip_depth, io_threads=args.io_threads,
+                            spec=load_spec(args.spec) if args.spec else None, backend=args.backend)
+
+
+def _summary(metrics) -> dict:
+    if metrics.profile:
+        sys.stderr.write(metrics.profile)
+    summary = metrics.to_dict()
+    del summary['profile']
+    summary['failed_files'] = summary['failed_files'][:100]
+    summary['unreadable'] = summary['unreadable'][:100]
+    return summary
+
+
+def run(args: argparse.Namespace) -> dict:
+    started = time.perf_counter()
+
+    fmt = _output_format(args)
+    registry = ColumnRegistry.load(args.layout) if args.layout else None
+    handler = _new_handler(args, registry)
+
+    if args.pipeline:
+        # Discovery runs in its own thread during processing and times itself
+        sources = handler.iter_paths(args.inputs)
+    else:
+        t = time.perf_counter()
+        sources = list(handler.iter_paths(args.inputs))
+        discovery = time.perf_counter() - t
+
+    options = dict(parallel=args.workers > 1, max_workers=args.workers, chunksize=args.chunksize,
+                   keep_layout=registry is not None, output=args.mode, dedup=args.dedup,
+                   profile=args.profile, pipeline=args.pipeline)
+
+    # Imported here: only needed once there is something to write
+    import exporters
+
+    results = handler.iter_dataframes(sources, batch_size=args.batch_size, **options)
+    exceptions = []
+    if args.validar:
+        import validation
+        results = validation.validate_batches(results, handler.registry, exceptions=exceptions)
+    t = time.perf_counter()
+    outputs = exporters.export(results, args.output, fmt=fmt, registry=handler.registry,
+                               summaries=args.resumen)
+    elapsed = time.perf_counter() - t
+    if args.validar:
+        found = pd.concat(exceptions, ignore_index=True) if exceptions else pd.DataFrame(columns=validation.EXCEPTION_COLUMNS)
+        outputs.append(exporters.write_table(found, exporters.companion_path(args.output, fmt, 'validacion'), fmt,
+                                             sheet_name='Validacion'))
+
+    # The handler's metrics are reset per run, so the CLI's own stages are added afterwards
+    metrics = handler.metrics
+    if not args.pipeline:
+        metrics.add_time('discovery', discovery)
+    metrics.add_time('export', elapsed - metrics.wall)
+
+    if args.save_layout:
+        handler.registry.save(args.save_layout)
+
+    summary = _summary(metrics)
+    if args.pipeline:
+        summary['discovered'] = metrics.files + len(metrics.unreadable) + len(metrics.duplicates)
+    else:
+        summary['discovered'] = len(sources)
+    summary['outputs'] = outputs
+    if args.validar:
+        summary['validation'] = validation.summary(found)
+    summary['stages']['total'] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def watch(args: argparse.Namespace) -> int:
+    """Incremental mode: one poll, or a poll every --watch seconds until interrupted."""
+    import exporters
+
+    fmt = _output_format(args)
+    if args.mode != 'wide':
+        raise SystemExit("El modo incremental solo admite --mode wide")
+    manifest = DirectoryManifest(args.manifest or f'{args.output}.manifest')
+    result = None
+    if len(manifest):
+        if os.path.exists(args.output):
+            # Records of earlier runs, to keep appending (the parsed XML are not read again)
+            result = exporters.read_export(args.output, fmt)
+        else:
+            print("No existe el reporte anterior; se procesa todo de nuevo.", file=sys.stderr)
+            manifest.reset()
+    registry = ColumnRegistry.load(args.layout) if args.layout else manifest.registry()
+    handler = _new_handler(args, registry)
+    options = dict(parallel=args.workers > 1, max_workers=args.workers, chunksize=args.chunksize,
+                   dedup=args.dedup, profile=args.profile, pipeline=args.pipeline)
+    watcher = FolderWatcher(args.inputs, handler, manifest, options=options, output=args.output,
+                            fmt=fmt, settle=args.settle, result=result)
+
+    def report(new):
+        if args.watch is not None and new.empty and not watcher.skipped:
+            return
+        summary = _summary(handler.metrics)
+        summary.update(new=len(new), skipped=watcher.skipped, deferred=watcher.deferred,
+                       total=len(watcher.result), outputs=[args.output])
+        json.dump(summary, sys.stdout, ensure_ascii=False)
+        sys.stdout.write('\n')
+        sys.stdout.flush()
+        if args.save_layout:
+            handler.registry.save(args.save_layout)
+
+    try:
+        if args.watch is None:
+            report(watcher.poll())
+        else:
+            watcher.watch(args.watch, on_poll=report)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manifest.close()
+    return 0
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.manifest or args.watch is not None:
+        return watch(args)
+    summary = run(args)
+    json.dump(summary, sys.stdout, ensure_ascii=False)
+    sys.stdout.write('\n')
+    return 1 if summary['discovered'] and not summary['records'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
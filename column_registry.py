@@ -0,0 +1,137 @@
+import json
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# SectionPriority: 0=Standard, 1=Percepciones, 2=Deducciones, 3=OtrosPagos, 4=Totals
+SECTION_PRIORITY = {
+    'Standard': 0,
+    'Percepciones': 1,
+    'Deducciones': 2,
+    'OtrosPagos': 3,
+    'Totals': 4
+}
+
+# Fallback clave for non-numeric keys ('Total' columns go to the end of their section)
+UNKNOWN_CLAVE = 99999
+
+# Column holding SubsidioAlEmpleo/SubsidioCausado (OtrosPagos, subitem 1)
+SUBSIDIO_CAUSADO = 'SubsidioCausado'
+
+# (name, section, clave, subitem)
+ColumnSpec = Tuple[str, str, str, int]
+
+
+def _clave_int(clave: str) -> int:
+    try:
+        return int(clave)
+    except (ValueError, TypeError):
+        return UNKNOWN_CLAVE
+
+
+class ColumnRegistry:
+    """
+    Column schema registry.
+    Every column is interned once as (name, section, clave, subitem) and gets a
+    stable integer ID. Re-registering an identical spec is a single dict lookup;
+    registering a name with a different spec replaces it (last one wins).
+    The registry can be saved and loaded so reports keep the same columns
+    from period to period.
+    """
+
+    def __init__(self, specs: Iterable[ColumnSpec] = ()):
+        self._ids: Dict[str, int] = {}                  # name -> column ID
+        self._specs: List[ColumnSpec] = []              # column ID -> current spec
+        self._interned: Dict[ColumnSpec, int] = {}      # spec -> column ID
+        # name -> (SectionPriority, ClaveInt, SubitemPriority, name); used for sorting
+        self.metadata: Dict[str, tuple] = {}
+        self._sorted: Optional[List[str]] = None
+        self._journal: Optional[List[ColumnSpec]] = None
+        for spec in specs:
+            self.register(*spec)
+
+    def register(self, name: str, section: str, clave: str, subitem: int = 0) -> int:
+        spec = (name, section, clave, subitem)
+        if self._journal is not None:
+            self._journal.append(spec)
+        cid = self._interned.get(spec)
+        if cid is not None and self._specs[cid] == spec:
+            return cid
+        return self._register_slow(spec)
+
+    def _register_slow(self, spec: ColumnSpec) -> int:
+        name, section, clave, subitem = spec
+        cid = self._ids.get(name)
+        if cid is None:
+            cid = len(self._specs)
+            self._ids[name] = cid
+            self._specs.append(spec)
+        else:
+            self._specs[cid] = spec
+        self._interned[spec] = cid
+        self.metadata[name] = (SECTION_PRIORITY.get(section, 99), _clave_int(clave), subitem, name)
+        self._sorted = None
+        return cid
+
+    def register_all(self, specs: Iterable[ColumnSpec]):
+        for spec in specs:
+            self.register(*spec)
+
+    @contextmanager
+    def recording(self):
+        """Collect the specs registered inside the block (e.g. for one document)."""
+        previous = self._journal
+        journal = []
+        self._journal = journal
+        try:
+            yield journal
+        finally:
+            self._journal = previous
+
+    def id_of(self, name: str) -> Optional[int]:
+        return self._ids.get(name)
+
+    def spec(self, name: str) -> Optional[ColumnSpec]:
+        cid = self._ids.get(name)
+        return None if cid is None else self._specs[cid]
+
+    def sort_key(self, name: str) -> tuple:
+        # Defaults for unknown columns: Standard, High int key, 0
+        return self.metadata.get(name, (0, UNKNOWN_CLAVE, 0, name))
+
+    def layout(self, columns: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Sorted column layout. With columns, only those are returned (unknown
+        names are placed by the default key); without, every registered column.
+        """
+        if self._sorted is None:
+            self._sorted = sorted(self.metadata, key=self.metadata.__getitem__)
+        if columns is None:
+            return list(self._sorted)
+        present = set(columns)
+        ordered = [c for c in self._sorted if c in present]
+        unknown = [c for c in present if c not in self._ids]
+        if unknown:
+            ordered = sorted(ordered + unknown, key=self.sort_key)
+        return ordered
+
+    def __len__(self):
+        return len(self._specs)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._ids
+
+    def to_dict(self) -> dict:
+        return {'version': 1, 'columns': [list(spec) for spec in self._specs]}
+
+    @classmethod
+    def from_dict(cls, payload: dict) -> 'ColumnRegistry':
+        return cls(tuple(spec) for spec in payload.get('columns', []))
+
+    def save(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=1)
+
+    @classmethod
+    def load(cls, path: str) -> 'ColumnRegistry':
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,113 @@
+from array import array
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from column_registry import ColumnRegistry
+
+
+class ColumnarBuilder:
+    """
+    Accumulates parsed records straight into per-column buffers keyed by the
+    registry's column IDs: array('d') for amounts (missing values are 0.0)
+    and plain lists for text (missing values are None). build() creates the
+    DataFrame once, in layout order and with final dtypes, so no fillna pass
+    is needed.
+    """
+
+    def __init__(self, registry: ColumnRegistry):
+        self.registry = registry
+        self.rows = 0
+        self._floats: Dict[int, array] = {}
+        self._objects: Dict[int, List[Any]] = {}
+        self._names: Dict[int, str] = {}
+
+    def append(self, record: Dict[str, Any]):
+        n = self.rows
+        id_of = self.registry.id_of
+        floats = self._floats
+        objects = self._objects
+        for name, value in record.items():
+            cid = id_of(name)
+            if cid is None:
+                # Unknown columns sort like before: Standard, non-numeric clave
+                cid = self.registry.register(name, 'Standard', '')
+            if cid not in self._names:
+                self._names[cid] = name
+
+            buf = floats.get(cid)
+            if buf is not None:
+                if isinstance(value, float):
+                    if len(buf) < n:
+                        buf.frombytes(bytes(8 * (n - len(buf))))
+                    buf.append(value)
+                    continue
+                # Text in an amount column: keep everything as objects
+                objects[cid] = buf.tolist()
+                del floats[cid]
+
+            values = objects.get(cid)
+            if values is None:
+                if isinstance(value, float):
+                    buf = floats[cid] = array('d', bytes(8 * n))
+                    buf.append(value)
+                    continue
+                values = objects[cid] = []
+            if len(values) < n:
+                values.extend([None] * (n - len(values)))
+            values.append(value)
+        self.rows = n + 1
+
+    def build(self, keep_layout: bool = False, start: int = 0) -> pd.DataFrame:
+        """
+        Build the DataFrame in the registry's sorted layout.
+        keep_layout: include every registered column, even without values.
+        start: first index value (for batches of a larger run).
+        """
+        n = self.rows
+        if n == 0:
+            return pd.DataFrame()
+
+        by_name = {name: cid for cid, name in self._names.items()}
+        if keep_layout:
+            cols = self.registry.layout(set(self.registry.layout()) | set(by_name))
+        else:
+            cols = self.registry.layout(by_name)
+
+        data = {}
+        for name in cols:
+            cid = by_name.get(name)
+            if cid is None:
+                # Header columns absent in this batch stay empty, amounts are zero
+                if self.registry.spec(name)[1] == 'Standard':
+                    data[name] = [''] * n
+                else:
+                    data[name] = np.zeros(n)
+            elif cid in self._floats:
+                buf = self._floats[cid]
+                if len(buf) < n:
+                    buf.frombytes(bytes(8 * (n - len(buf))))
+                data[name] = np.frombuffer(buf, dtype=np.float64)
+            else:
+                values = self._objects[cid]
+                if len(values) < n:
+                    values.extend([None] * (n - len(values)))
+                data[name] = values
+        index = pd.RangeIndex(start, start + n) if start else None
+        return pd.DataFrame(data, columns=cols, index=index)
+
+
+def fill_missing(df: pd.DataFrame, columns: Iterable[str], registry: ColumnRegistry) -> pd.DataFrame:
+    """
+    Add the columns df lacks the way build() does: '' for header fields, 0.0 for amounts,
+    so results built apart (batches, incremental polls) line up under one layout.
+    """
+    missing = [c for c in columns if c not in df.columns]
+    if not missing:
+        return df
+    df = df.copy()
+    for name in missing:
+        spec = registry.spec(name)
+        df[name] = '' if spec is None or spec[1] == 'Standard' else 0.0
+    return df
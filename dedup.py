@@ -0,0 +1,75 @@
+import re
+import hashlib
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+# UUID attribute of the TimbreFiscalDigital element (any prefix, any attribute order)
+UUID_PATTERN = re.compile(
+    rb'TimbreFiscalDigital\b[^>]*?\sUUID\s*=\s*["\']([0-9A-Fa-f]{8}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{12})["\']',
+    re.IGNORECASE
+)
+
+# The TFD lives at the end of Complemento: usually found in the last few KB of the file
+TAIL_BYTES = 16 * 1024
+
+# ZIP members inflated to find their key are kept for the parse up to this many bytes,
+# so dedup does not decompress them twice; past it, the rest are read again
+KEEP_BYTES = 256 * 1024 * 1024
+
+# first: keep the first occurrence in input order
+# last: keep the last occurrence in input order
+# latest: keep the newest file (mtime, or ZIP entry date); ties go to the later one
+POLICIES = ('first', 'last', 'latest')
+
+
+def peek_uuid(content: bytes) -> Optional[str]:
+    """UUID of the TimbreFiscalDigital, found with a regex scan (no XML parse)."""
+    m = UUID_PATTERN.search(content)
+    return m.group(1).decode('ascii').upper() if m else None
+
+
+def content_key(content: bytes) -> Optional[str]:
+    """Dedup key: the TFD UUID, or a SHA-256 of the bytes for documents without one."""
+    if not content:
+        return None
+    uuid = peek_uuid(content)
+    if uuid is not None:
+        return uuid
+    return 'sha256:' + hashlib.sha256(content).hexdigest()
+
+
+def split_duplicates(items: Iterable[Any], key_of: Callable[[Any], Optional[str]], policy: str = 'first',
+                timestamp_of: Optional[Callable[[Any], float]] = None) -> Tuple[List[Any], List[Tuple[Any, str, Any]]]:
+    """
+    Split items into (kept, duplicates) using a hash index on key_of(item).
+    Items whose key is None (unreadable) are always kept so the parser reports them.
+    kept preserves input order; duplicates is a list of (item, key, kept_item).
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown dedup policy: {policy}")
+
+    items = list(items)
+    keys = []
+    winners = {}  # key -> (rank, position)
+    for position, item in enumerate(items):
+        key = key_of(item)
+        keys.append(key)
+        if key is None:
+            continue
+        if policy == 'first':
+            rank = (-position,)
+        elif policy == 'last':
+            rank = (position,)
+        else:
+            rank = (timestamp_of(item) if timestamp_of else 0.0, position)
+        best = winners.get(key)
+        if best is None or rank > best[0]:
+            winners[key] = (rank, position)
+
+    kept = []
+    duplicates = []
+    for position, (item, key) in enumerate(zip(items, keys)):
+        if key is None or winners[key][1] == position:
+            kept.append(item)
+        else:
+            duplicates.append((item, key, items[winners[key][1]]))
+    return kept, duplicates
@@ -0,0 +1,451 @@
+import os
+import json
+import itertools
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+import pandas as pd
+
+from column_registry import ColumnRegistry
+from columnar import fill_missing
+from ledger import NominaLedger
+
+Frames = Union[pd.DataFrame, Iterable[pd.DataFrame]]
+Result = Union[pd.DataFrame, NominaLedger]
+
+# Excel hard limit (including the header row)
+EXCEL_MAX_ROWS = 1048576
+# Rows converted to Python objects at a time while writing
+ROW_BATCH = 10000
+# Ledger text columns stored dictionary-encoded in Parquet (besides *_RFC columns)
+DICTIONARY_COLUMNS = ['Seccion', 'Clave', 'Concepto']
+# Key of the column layout in the Parquet file metadata
+PARQUET_LAYOUT_KEY = b'nomina.layout'
+
+FORMATS = ('xlsx', 'csv', 'parquet')
+
+
+def _as_chunks(frames) -> Iterator:
+    if isinstance(frames, (pd.DataFrame, NominaLedger)):
+        yield frames
+    else:
+        yield from frames
+
+
+def _conform(chunk: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    """Align a chunk to the columns fixed by the first chunk (or given by the caller)."""
+    if list(chunk.columns) == columns:
+        return chunk
+    known = set(columns)
+    extra = [c for c in chunk.columns if c not in known]
+    if extra:
+        raise ValueError(
+            f"Chunk has columns not present in the output header: {extra[:5]}. "
+            "Pass columns= (e.g. registry.layout()) or export the ledger output."
+        )
+    return chunk.reindex(columns=columns)
+
+
+def _widened(chunks: Iterator[pd.DataFrame], registry: Optional[ColumnRegistry]) -> Iterator[pd.DataFrame]:
+    """
+    Wide batches of iter_dataframes() under one header. Each batch only has the concept
+    columns it saw, so the header (registry.layout() of every column seen, or first-seen
+    order without a registry) is known after the last one: the batches are spilled to a
+    temp dir and read back one at a time with the missing columns filled, '' for header
+    fields and 0.0 for amounts.
+    """
+    with tempfile.TemporaryDirectory(prefix='nomina_spill_') as spill:
+        paths = []
+        numeric: Dict[str, bool] = {}   # column -> amount, in first-seen order
+        for chunk in chunks:
+            for name in chunk.columns:
+                if name not in numeric:
+                    numeric[name] = pd.api.types.is_numeric_dtype(chunk[name])
+            path = os.path.join(spill, f'{len(paths)}.pkl')
+            chunk.to_pickle(path)
+            paths.append(path)
+        columns = registry.layout(numeric) if registry is not None else list(numeric)
+        for path in paths:
+            chunk = pd.read_pickle(path)
+            os.remove(path)
+            if registry is not None:
+                chunk = fill_missing(chunk, columns, registry)
+            else:
+                for name in columns:
+                    if name not in chunk.columns:
+                        chunk[name] = 0.0 if numeric[name] else ''
+            yield chunk[columns]
+
+
+def _iter_rows(df: pd.DataFrame, index: bool = False) -> Iterator[tuple]:
+    """Yield rows as tuples of plain Python values, missing values as None."""
+    for start in range(0, len(df), ROW_BATCH):
+        part = df.iloc[start:start + ROW_BATCH]
+        columns = []
+        if index:
+            columns.append(part.index.tolist())
+        for name in part.columns:
+            series = part[name]
+            values = series.tolist()
+            missing = series.isna()
+            if missing.any():
+                values = [None if m else v for v, m in zip(values, missing.tolist())]
+            columns.append(values)
+        yield from zip(*columns)
+
+
+def _temp_path(suffix: str) -> str:
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix='nomina_')
+    os.close(fd)
+    return path
+
+
+class XlsxStreamWriter:
+    """
+    Incremental .xlsx writer on openpyxl's write-only workbook: rows are
+    streamed to disk, so memory does not grow with the report size.
+    Sheets are created on first write; each sheet's header is fixed by its
+    first chunk unless columns are given.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        from openpyxl import Workbook
+        from openpyxl.styles import Font
+        self.path = path or _temp_path('.xlsx')
+        self._wb = Workbook(write_only=True)
+        self._bold = Font(bold=True)
+        self._sheets = {}
+
+    def write(self, chunk: pd.DataFrame, sheet_name: str = 'Nomina', index: bool = False,
+              columns: Optional[List[str]] = None):
+        state = self._sheets.get(sheet_name)
+        if state is None:
+            ws = self._wb.create_sheet(title=sheet_name)
+            columns = list(columns) if columns is not None else list(chunk.columns)
+            header = [str(c) for c in columns]
+            if index:
+                header.insert(0, chunk.index.name or '')
+            ws.append(self._header_cells(ws, header))
+            state = self._sheets[sheet_name] = {'ws': ws, 'columns': columns, 'rows': 0}
+
+        chunk = _conform(chunk, state['columns'])
+        state['rows'] += len(chunk)
+        if state['rows'] + 1 > EXCEL_MAX_ROWS:
+            raise ValueError(f"Sheet '{sheet_name}' exceeds Excel's limit of {EXCEL_MAX_ROWS} rows")
+        ws = state['ws']
+        for row in _iter_rows(chunk, index=index):
+            ws.append(row)
+
+    def _header_cells(self, ws, header: List[str]) -> list:
+        from openpyxl.cell import WriteOnlyCell
+        cells = []
+        for value in header:
+            cell = WriteOnlyCell(ws, value=value)
+            cell.font = self._bold
+            cells.append(cell)
+        return cells
+
+    def close(self) -> str:
+        if not self._sheets:
+            self._wb.create_sheet(title='Nomina')
+        self._wb.save(self.path)
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CsvStreamWriter:
+    """
+    Chunked CSV writer: header from the first chunk, later chunks are appended.
+    append=True adds rows to an existing file whose header matches columns.
+    """
+
+    def __init__(self, path: Optional[str] = None, columns: Optional[List[str]] = None,
+                 index: bool = False, encoding: str = 'utf-8-sig', append: bool = False):
+        self.path = path or _temp_path('.csv')
+        self.columns = list(columns) if columns is not None else None
+        self.index = index
+        if append:
+            # The BOM is only written at the start of the file
+            self._file = open(self.path, 'a', encoding='utf-8' if encoding == 'utf-8-sig' else encoding, newline='')
+        else:
+            # utf-8-sig so Excel opens accents correctly
+            self._file = open(self.path, 'w', encoding=encoding, newline='')
+        self._header_written = append
+
+    def write(self, chunk: pd.DataFrame):
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+        chunk = _conform(chunk, self.columns)
+        chunk.to_csv(self._file, index=self.index, header=not self._header_written)
+        self._header_written = True
+
+    def close(self) -> str:
+        if not self._header_written and self.columns:
+            pd.DataFrame(columns=self.columns).to_csv(self._file, index=self.index)
+        self._file.close()
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ParquetStreamWriter:
+    """
+    Chunked Parquet writer (requires pyarrow).
+    RFC columns and the ledger's Seccion/Clave/Concepto are dictionary-encoded.
+    The column layout (order plus the registry specs) is stored in the file
+    metadata under 'nomina.layout'.
+    """
+
+    def __init__(self, path: Optional[str] = None, registry: Optional[ColumnRegistry] = None,
+                 index: bool = False, dictionary_columns: Optional[List[str]] = None):
+        try:
+            import pyarrow  # noqa: F401
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise ImportError("Parquet export requires pyarrow: pip install pyarrow")
+        self.path = path or _temp_path('.parquet')
+        self.registry = registry
+        self.index = index
+        self.dictionary_columns = dictionary_columns
+        self.columns = None
+        self._schema = None
+        self._writer = None
+
+    def _is_dictionary(self, name: str) -> bool:
+        if self.dictionary_columns is not None:
+            return name in self.dictionary_columns
+        return name.endswith('_RFC') or name in DICTIONARY_COLUMNS
+
+    def _to_table(self, chunk: pd.DataFrame):
+        import pyarrow as pa
+        if self.index:
+            chunk = chunk.reset_index()
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        for i, name in enumerate(table.column_names):
+            if self._is_dictionary(name):
+                column = table.column(i).cast(pa.string()).dictionary_encode()
+                table = table.set_column(i, pa.field(name, column.type), column)
+        return table.replace_schema_metadata(None)
+
+    def write(self, chunk: pd.DataFrame):
+        import pyarrow.parquet as pq
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+        chunk = _conform(chunk, self.columns)
+        table = self._to_table(chunk)
+        if self._writer is None:
+            self._schema = table.schema
+            self._writer = pq.ParquetWriter(self.path, self._schema)
+        else:
+            # Later chunks may infer other types (e.g. an all-empty text column)
+            table = table.cast(self._schema)
+        self._writer.write_table(table)
+
+    def close(self) -> str:
+        import pyarrow.parquet as pq
+        if self._writer is None:
+            import pyarrow as pa
+            self._writer = pq.ParquetWriter(self.path, pa.schema([(c, pa.string()) for c in self.columns or []]))
+        layout = {'columns': [str(c) for c in self.columns or []]}
+        if self.registry is not None:
+            layout['registry'] = self.registry.to_dict()
+        self._writer.add_key_value_metadata({PARQUET_LAYOUT_KEY: json.dumps(layout, ensure_ascii=False)})
+        self._writer.close()
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_parquet_layout(path: str) -> dict:
+    """Column layout stored by ParquetStreamWriter ({'columns': [...], 'registry': {...}})."""
+    import pyarrow.parquet as pq
+    metadata = pq.read_metadata(path).metadata or {}
+    return json.loads(metadata.get(PARQUET_LAYOUT_KEY, b'{}'))
+
+
+def write_excel(frames: Frames, path: Optional[str] = None, sheet_name: str = 'Nomina',
+                columns: Optional[List[str]] = None, index: bool = False) -> str:
+    """
+    Write a DataFrame, or an iterable of DataFrame chunks, to an .xlsx file.
+    Without path the file is spooled to a temp file. Returns the path written.
+    """
+    with XlsxStreamWriter(path) as writer:
+        for chunk in _as_chunks(frames):
+            writer.write(chunk, sheet_name=sheet_name, index=index, columns=columns)
+    return writer.path
+
+
+def write_excel_sheets(sheets: Dict[str, Frames], path: Optional[str] = None,
+                       index: Optional[Dict[str, bool]] = None) -> str:
+    """Same as write_excel for several sheets, written in the given order."""
+    index = index or {}
+    with XlsxStreamWriter(path) as writer:
+        for sheet_name, frames in sheets.items():
+            for chunk in _as_chunks(frames):
+                writer.write(chunk, sheet_name=sheet_name, index=index.get(sheet_name, False))
+    return writer.path
+
+
+def write_csv(frames: Frames, path: Optional[str] = None,
+              columns: Optional[List[str]] = None, index: bool = False) -> str:
+    """Write a DataFrame or an iterable of chunks to one CSV file. Returns the path."""
+    with CsvStreamWriter(path, columns=columns, index=index) as writer:
+        for chunk in _as_chunks(frames):
+            writer.write(chunk)
+    return writer.path
+
+
+def append_csv(frames: Frames, path: str, columns: Optional[List[str]] = None, index: bool = False) -> str:
+    """Append a DataFrame or chunks to a CSV written by write_csv (same columns). Returns the path."""
+    with CsvStreamWriter(path, columns=columns, index=index, append=True) as writer:
+        for chunk in _as_chunks(frames):
+            writer.write(chunk)
+    return writer.path
+
+
+def write_parquet(frames: Frames, path: Optional[str] = None,
+                  registry: Optional[ColumnRegistry] = None, index: bool = False) -> str:
+    """Write a DataFrame or an iterable of chunks to one Parquet file. Returns the path."""
+    with ParquetStreamWriter(path, registry=registry, index=index) as writer:
+        for chunk in _as_chunks(frames):
+            writer.write(chunk)
+    return writer.path
+
+
+def read_export(path: str, fmt: str) -> pd.DataFrame:
+    """
+    Read back a wide report written by export() (e.g. to keep appending to it).
+    CSV values are kept as the text that was written, so rewriting them is lossless.
+    """
+    if fmt == 'parquet':
+        return pd.read_parquet(path)
+    if fmt == 'csv':
+        return pd.read_csv(path, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+    if fmt == 'xlsx':
+        return pd.read_excel(path, sheet_name='Nomina')
+    raise ValueError(f"Unknown format: {fmt}")
+
+
+def _base_path(path: str, fmt: str) -> str:
+    return path[:-len(fmt) - 1] if path.endswith('.' + fmt) else path
+
+
+def _ledger_paths(path: str, fmt: str) -> Dict[str, str]:
+    base = _base_path(path, fmt)
+    return {'headers': f'{base}_encabezados.{fmt}', 'lines': f'{base}_conceptos.{fmt}'}
+
+
+def companion_path(path: str, fmt: str, title: str) -> str:
+    """Path of a table written next to a report: reporte.csv + 'Resumen Periodo' -> reporte_resumen_periodo.csv"""
+    return f"{_base_path(path, fmt)}_{title.lower().replace(' ', '_')}.{fmt}"
+
+
+def write_table(table: pd.DataFrame, path: str, fmt: str, sheet_name: str = 'Nomina') -> str:
+    """Write one small table in any of FORMATS. Returns the path."""
+    if fmt == 'xlsx':
+        return write_excel(table, path, sheet_name=sheet_name)
+    if fmt == 'csv':
+        return write_csv(table, path)
+    if fmt == 'parquet':
+        return write_parquet(table, path)
+    raise ValueError(f"Unknown format: {fmt}")
+
+
+def _write_summaries(tables: Dict[str, pd.DataFrame], path: str, fmt: str) -> List[str]:
+    """Summary tables as one file each (csv, parquet)."""
+    return [write_table(table, companion_path(path, fmt, title), fmt) for title, table in tables.items()]
+
+
+def export(results: Union[Result, Iterable[Result]], path: Optional[str] = None,
+           fmt: str = 'xlsx', registry: Optional[ColumnRegistry] = None,
+           summaries: bool = False) -> List[str]:
+    """
+    Write process_files() output, or the batches of iter_dataframes(), in
+    'xlsx', 'csv' or 'parquet' format. Ledger results go to two sheets (xlsx)
+    or to two files ending in _encabezados/_conceptos (csv, parquet).
+    summaries: also write the aggregations.summarize() tables (per receptor, period,
+    concept and emisor), accumulated batch by batch, as extra sheets (xlsx) or
+    files ending in _resumen_* (csv, parquet).
+    Wide batches may differ in columns; they are written under one header (see _widened).
+    Returns the written paths.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    chunks = _as_chunks(results)
+    first = next(chunks, None)
+    if first is None:
+        first = pd.DataFrame()
+    is_ledger = isinstance(first, NominaLedger)
+
+    builder = None
+    if summaries:
+        from aggregations import SummaryBuilder
+        builder = SummaryBuilder(registry)
+
+    def all_chunks():
+        for chunk in itertools.chain([first], chunks):
+            if builder is not None:
+                builder.add(chunk)
+            yield chunk
+
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(prefix='nomina_'), f'Reporte_Nomina.{fmt}')
+
+    batches = all_chunks()
+    if not is_ledger and not isinstance(results, pd.DataFrame):
+        batches = _widened(batches, registry)
+
+    if fmt == 'xlsx':
+        with XlsxStreamWriter(path) as writer:
+            for chunk in batches:
+                if is_ledger:
+                    writer.write(chunk.headers, sheet_name='Encabezados', index=True)
+                    writer.write(chunk.lines, sheet_name='Conceptos')
+                else:
+                    writer.write(chunk, sheet_name='Nomina')
+            if builder is not None:
+                for title, table in builder.tables().items():
+                    writer.write(table, sheet_name=title)
+        return [path]
+
+    if not is_ledger:
+        writer = CsvStreamWriter(path) if fmt == 'csv' else ParquetStreamWriter(path, registry=registry)
+        with writer:
+            for chunk in batches:
+                writer.write(chunk)
+        paths = [path]
+    else:
+        paths = _export_ledger(batches, path, fmt, registry)
+    if builder is not None:
+        paths += _write_summaries(builder.tables(), path, fmt)
+    return paths
+
+
+def _export_ledger(chunks: Iterable[NominaLedger], path: str, fmt: str,
+                   registry: Optional[ColumnRegistry]) -> List[str]:
+    """Ledger batches as _encabezados/_conceptos files (csv, parquet)."""
+    paths = _ledger_paths(path, fmt)
+    if fmt == 'csv':
+        headers = CsvStreamWriter(paths['headers'], index=True)
+        lines = CsvStreamWriter(paths['lines'])
+    else:
+        headers = ParquetStreamWriter(paths['headers'], registry=registry, index=True)
+        lines = ParquetStreamWriter(paths['lines'])
+    with headers, lines:
+        for chunk in chunks:
+            headers.write(chunk.headers)
+            lines.write(chunk.lines)
+    return [paths['headers'], paths['lines']]
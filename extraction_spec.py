@@ -0,0 +1,163 @@
+import json
+import hashlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Header nodes an extraction spec can read, as stream-engine token paths
+NODE_PATHS = {
+    'Comprobante': ('Comprobante',),
+    'Emisor': ('Comprobante', 'Emisor'),
+    'Receptor': ('Comprobante', 'Receptor'),
+    'TimbreFiscalDigital': ('Comprobante', 'Complemento', 'TFD'),
+    'Nomina': ('Comprobante', 'Complemento', 'Nomina'),
+    'Nomina/Emisor': ('Comprobante', 'Complemento', 'Nomina', 'Emisor'),
+    'Nomina/Receptor': ('Comprobante', 'Complemento', 'Nomina', 'Receptor'),
+}
+
+# (node, attribute, type, column, section, clave)
+FieldSpec = Tuple[str, str, str, str, str, str]
+
+
+def to_amount(val: str) -> float:
+    try:
+        return float(val) if val else 0.0
+    except ValueError:
+        return 0.0
+
+
+# type -> (converter applied to the attribute value, value when the attribute is missing)
+FIELD_TYPES: Dict[str, Tuple[Optional[Callable[[str], Any]], Any]] = {
+    'text': (None, ''),
+    'amount': (to_amount, 0.0),
+}
+
+# Header columns of the report. Section/clave place them in the layout (see ColumnRegistry):
+# Standard 0 comprobante, 1 patrón, 2 trabajador, 3 periodo, 4 días; the Total* columns
+# close their concept section and Total/SubTotal go after OtrosPagos.
+DEFAULT_SPEC: List[FieldSpec] = [
+    ('Comprobante', 'Serie', 'text', 'Serie', 'Standard', '0'),
+    ('Comprobante', 'Folio', 'text', 'Folio', 'Standard', '0'),
+    ('Comprobante', 'Fecha', 'text', 'Fecha', 'Standard', '0'),
+    ('Comprobante', 'Moneda', 'text', 'Moneda', 'Standard', '0'),
+    ('Comprobante', 'Sello', 'text', 'Sello', 'Standard', '0'),
+    ('Comprobante', 'Total', 'amount', 'Total', 'Totals', '0'),
+    ('Comprobante', 'SubTotal', 'amount', 'SubTotal', 'Totals', '0'),
+    ('TimbreFiscalDigital', 'UUID', 'text', 'UUID', 'Standard', '0'),
+    ('TimbreFiscalDigital', 'FechaTimbrado', 'text', 'FechaTimbrado', 'Standard', '0'),
+    ('Emisor', 'Rfc', 'text', 'Emisor_RFC', 'Standard', '1'),
+    ('Emisor', 'Nombre', 'text', 'Emisor_Nombre', 'Standard', '1'),
+    ('Emisor', 'RegimenFiscal', 'text', 'Emisor_RegimenFiscal', 'Standard', '1'),
+    ('Nomina/Emisor', 'RegistroPatronal', 'text', 'Emisor_RegistroPatronal', 'Standard', '1'),
+    ('Receptor', 'Rfc', 'text', 'Receptor_RFC', 'Standard', '2'),
+    ('Receptor', 'Nombre', 'text', 'Receptor_Nombre', 'Standard', '2'),
+    ('Receptor', 'UsoCFDI', 'text', 'Receptor_UsoCFDI', 'Standard', '2'),
+    ('Nomina/Receptor', 'Curp', 'text', 'Receptor_CURP', 'Standard', '2'),
+    ('Nomina/Receptor', 'NumSeguridadSocial', 'text', 'Receptor_NSS', 'Standard', '2'),
+    ('Nomina/Receptor', 'NumEmpleado', 'text', 'Receptor_NumEmpleado', 'Standard', '2'),
+    ('Nomina/Receptor', 'Departamento', 'text', 'Receptor_Departamento', 'Standard', '2'),
+    ('Nomina/Receptor', 'Puesto', 'text', 'Receptor_Puesto', 'Standard', '2'),
+    ('Nomina/Receptor', 'FechaInicioRelLaboral', 'text', 'Receptor_FechaInicioRelLaboral', 'Standard', '2'),
+    ('Nomina/Receptor', 'Antigüedad', 'text', 'Receptor_Antiguedad', 'Standard', '2'),
+    ('Nomina/Receptor', 'TipoContrato', 'text', 'Receptor_TipoContrato', 'Standard', '2'),
+    ('Nomina/Receptor', 'TipoJornada', 'text', 'Receptor_TipoJornada', 'Standard', '2'),
+    ('Nomina/Receptor', 'TipoRegimen', 'text', 'Receptor_TipoRegimen', 'Standard', '2'),
+    ('Nomina/Receptor', 'RiesgoPuesto', 'text', 'Receptor_RiesgoPuesto', 'Standard', '2'),
+    ('Nomina/Receptor', 'PeriodicidadPago', 'text', 'Receptor_PeriodicidadPago', 'Standard', '2'),
+    ('Nomina/Receptor', 'ClaveEntFed', 'text', 'Receptor_ClaveEntFed', 'Standard', '2'),
+    ('Nomina/Receptor', 'SalarioBaseCotApor', 'amount', 'Receptor_SalarioBaseCotApor', 'Standard', '2'),
+    ('Nomina/Receptor', 'SalarioDiarioIntegrado', 'amount', 'Receptor_SalarioDiarioIntegrado', 'Standard', '2'),
+    ('Nomina', 'TipoNomina', 'text', 'TipoNomina', 'Standard', '3'),
+    ('Nomina', 'FechaPago', 'text', 'FechaPago', 'Standard', '3'),
+    ('Nomina', 'FechaInicialPago', 'text', 'FechaInicialPago', 'Standard', '3'),
+    ('Nomina', 'FechaFinalPago', 'text', 'FechaFinalPago', 'Standard', '3'),
+    ('Nomina', 'NumDiasPagados', 'amount', 'NumDiasPagados', 'Standard', '4'),
+    ('Nomina', 'TotalPercepciones', 'amount', 'TotalPercepciones', 'Percepciones', 'Total'),
+    ('Nomina', 'TotalDeducciones', 'amount', 'TotalDeducciones', 'Deducciones', 'Total'),
+    ('Nomina', 'TotalOtrosPagos', 'amount', 'TotalOtrosPagos', 'OtrosPagos', 'Total'),
+]
+
+_UNRESOLVED = object()
+
+
+class NodeExtractor:
+    """
+    Extracts the spec'd attributes of one node into a record.
+    Attribute names are matched case-insensitively (PACs are not consistent), but each
+    spelling is resolved once and memoized, so extract() is one dict lookup per attribute.
+    An exact-case attribute wins over a differently-cased duplicate, as in _lookup_attr.
+    """
+    __slots__ = ('defaults', '_exact', '_lower', '_resolved')
+
+    def __init__(self, fields: Iterable[Tuple[str, str, Optional[Callable[[str], Any]], Any]]):
+        self.defaults: Dict[str, Any] = {}
+        self._exact: Dict[str, tuple] = {}
+        self._lower: Dict[str, tuple] = {}
+        for attribute, column, convert, default in fields:
+            self.defaults[column] = default
+            self._exact[attribute] = (column, convert, None)
+            # Non-exact spellings remember the canonical name to let it take precedence
+            self._lower.setdefault(attribute.lower(), (column, convert, attribute))
+        self._resolved: Dict[str, Optional[tuple]] = dict(self._exact)
+
+    def _resolve(self, name: str) -> Optional[tuple]:
+        target = self._lower.get(name.lower())
+        self._resolved[name] = target
+        return target
+
+    def extract(self, attrib: Dict[str, str], record: Dict[str, Any]):
+        record.update(self.defaults)
+        resolved = self._resolved
+        for name, value in attrib.items():
+            target = resolved.get(name, _UNRESOLVED)
+            if target is _UNRESOLVED:
+                target = self._resolve(name)
+            if target is None:
+                continue
+            column, convert, canonical = target
+            if canonical is not None and canonical in attrib:
+                continue
+            record[column] = convert(value) if convert is not None else value
+
+
+class CompiledSpec:
+    """
+    An extraction spec compiled for the parsers: one NodeExtractor per node path,
+    plus the (name, section, clave, subitem) column specs to register in the layout.
+    """
+
+    def __init__(self, spec: Iterable[FieldSpec]):
+        self.spec: List[FieldSpec] = [tuple(field) for field in spec]
+        by_node: Dict[str, list] = {}
+        self.columns = []
+        for node, attribute, kind, column, section, clave in self.spec:
+            if node not in NODE_PATHS:
+                raise ValueError(f"Unknown node in extraction spec: {node}")
+            if kind not in FIELD_TYPES:
+                raise ValueError(f"Unknown field type in extraction spec: {kind}")
+            convert, default = FIELD_TYPES[kind]
+            by_node.setdefault(node, []).append((attribute, column, convert, default))
+            self.columns.append((column, section, clave, 0))
+        self.by_name = {node: NodeExtractor(fields) for node, fields in by_node.items()}
+        self.by_path = {NODE_PATHS[node]: extractor for node, extractor in self.by_name.items()}
+        self.digest = hashlib.sha256(json.dumps(self.spec, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+
+def load_spec(path: str) -> List[FieldSpec]:
+    """
+    Read a spec from JSON: a list of objects with node, attribute, type, column,
+    section and clave (or of 6-item lists in that order).
+    """
+    with open(path, encoding='utf-8') as f:
+        raw = json.load(f)
+    spec = []
+    for item in raw:
+        if isinstance(item, dict):
+            item = (item['node'], item['attribute'], item.get('type', 'text'), item['column'],
+                    item.get('section', 'Standard'), str(item.get('clave', '0')))
+        spec.append(tuple(item))
+    return spec
+
+
+def save_spec(spec: Iterable[FieldSpec], path: str):
+    keys = ('node', 'attribute', 'type', 'column', 'section', 'clave')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump([dict(zip(keys, field)) for field in spec], f, ensure_ascii=False, indent=2)
@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from column_registry import ColumnRegistry
+from columnar import fill_missing
+from dedup import content_key
+from zip_ingest import XMLSource
+
+logger = logging.getLogger(__name__)
+
+INPUT_EXTENSIONS = ('.xml', '.zip')
+
+# Files modified less than this many seconds ago are left for the next poll
+# (the PAC may still be writing them)
+SETTLE_SECONDS = 2.0
+
+
+class DirectoryManifest:
+    """
+    What has already been ingested from a folder, in a SQLite file (':memory:' if path is None).
+    files: path, size and mtime of every XML/ZIP seen, so unchanged files are skipped on stat alone.
+    documents: content key of every ingested CFDI (TFD UUID, or SHA-256 of the bytes; see
+    dedup.content_key) and where it came from, so a touched, renamed or re-delivered
+    document is not ingested twice.
+    Everything is held in memory while running; changes are staged and only written by
+    commit(), once the records they produced have been kept.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._conn = sqlite3.connect(path or ':memory:', timeout=30, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime INTEGER NOT NULL, ingested REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents (key TEXT PRIMARY KEY, origin TEXT NOT NULL, ingested REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS info (name TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        self.files: Dict[str, Tuple[int, int]] = {
+            path: (size, mtime) for path, size, mtime in self._conn.execute("SELECT path, size, mtime FROM files")
+        }
+        self.documents = {key for (key,) in self._conn.execute("SELECT key FROM documents")}
+        self._staged_files: List[tuple] = []
+        self._staged_documents: List[tuple] = []
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def unchanged(self, path: str, size: int, mtime: int) -> bool:
+        return self.files.get(path) == (size, mtime)
+
+    def add_document(self, key: str, origin: str) -> bool:
+        """Stage a document; False if its key was already ingested (or staged)."""
+        with self._lock:
+            if key in self.documents:
+                return False
+            self.documents.add(key)
+            self._staged_documents.append((key, origin, time.time()))
+            return True
+
+    def add_file(self, path: str, size: int, mtime: int):
+        with self._lock:
+            self.files[path] = (size, mtime)
+            self._staged_files.append((path, size, mtime, time.time()))
+
+    def commit(self, registry: Optional[ColumnRegistry] = None):
+        """Write the staged changes (and the column layout, to keep it across restarts)."""
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO files (path, size, mtime, ingested) VALUES (?, ?, ?, ?)",
+                                   self._staged_files)
+            self._conn.executemany("INSERT OR REPLACE INTO documents (key, origin, ingested) VALUES (?, ?, ?)",
+                                   self._staged_documents)
+            if registry is not None:
+                self._conn.execute("INSERT OR REPLACE INTO info (name, value) VALUES ('registry', ?)",
+                                   (json.dumps(registry.to_dict(), ensure_ascii=False),))
+            self._conn.commit()
+            self._staged_files = []
+            self._staged_documents = []
+
+    def rollback(self):
+        """Forget the staged changes, e.g. when processing failed."""
+        with self._lock:
+            self._load()
+
+    def registry(self) -> Optional[ColumnRegistry]:
+        row = self._conn.execute("SELECT value FROM info WHERE name = 'registry'").fetchone()
+        return ColumnRegistry.from_dict(json.loads(row[0])) if row else None
+
+    def reset(self):
+        """Forget everything (the next poll ingests the whole folder again)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM files")
+            self._conn.execute("DELETE FROM documents")
+            self._conn.execute("DELETE FROM info")
+            self._conn.commit()
+            self._load()
+
+    def close(self):
+        self._conn.close()
+
+
+def _walk(root: str) -> Iterator[Tuple[str, os.stat_result]]:
+    """(path, stat) of every XML/ZIP below root. DirEntry.stat() is free on Windows shares."""
+    if os.path.isfile(root):
+        if root.lower().endswith(INPUT_EXTENSIONS):
+            yield root, os.stat(root)
+        return
+    try:
+        entries = list(os.scandir(root))
+    except OSError as e:
+        logger.error(f"Cannot list {root}: {e}")
+        return
+    for entry in entries:
+        try:
+            if entry.is_dir():
+                yield from _walk(entry.path)
+            elif entry.name.lower().endswith(INPUT_EXTENSIONS):
+                yield entry.path, entry.stat()
+        except OSError as e:
+            logger.error(f"Cannot stat {entry.path}: {e}")
+
+
+class FolderWatcher:
+    """
+    Incremental ingestion of one or more folders (or XML/ZIP files).
+    Each poll() walks the folders with stat only, reads just the files that are new or
+    changed since the manifest, skips documents whose content key was already ingested,
+    and appends the new records to the running result (and to the export, if output is set)
+    without parsing anything again. watch() polls until stopped.
+    handler: a NominaXMLHandler reused across polls, so the column layout stays coherent;
+    options: process_files() keyword arguments (wide output only).
+    """
+
+    def __init__(self, roots: Iterable[str], handler: Any, manifest: Optional[DirectoryManifest] = None,
+                 options: Optional[Dict[str, Any]] = None, output: Optional[str] = None,
+                 fmt: Optional[str] = None, settle: float = SETTLE_SECONDS,
+                 result: Optional[pd.DataFrame] = None):
+        self.roots = [roots] if isinstance(roots, str) else list(roots)
+        self.handler = handler
+        self.manifest = manifest if manifest is not None else DirectoryManifest()
+        self.options = dict(options or {})
+        if self.options.get('output', 'wide') != 'wide':
+            raise ValueError("Incremental mode supports the wide output only")
+        self.output = output
+        self.fmt = fmt
+        self.settle = settle
+        self.result = result if result is not None else pd.DataFrame()
+        self.polls = 0
+        self.skipped = 0    # documents already ingested (touched, renamed or re-delivered)
+        self.deferred = 0   # files too recent, left for the next poll
+
+    def _iter_new(self) -> Iterator[Tuple[Any, str]]:
+        """(content, name) of the documents not ingested yet; stages them in the manifest."""
+        manifest = self.manifest
+        now = time.time()
+        for root in self.roots:
+            for path, st in _walk(root):
+                if manifest.unchanged(path, st.st_size, st.st_mtime_ns):
+                    continue
+                if now - st.st_mtime < self.settle:
+                    self.deferred += 1
+                    continue
+                if path.lower().endswith('.zip'):
+                    sources = self.handler.iter_paths([path])
+                else:
+                    sources = [XMLSource(path)]
+                for source in sources:
+                    content = source.read()
+                    if content:
+                        key = content_key(content)
+                        if not manifest.add_document(key, repr(source)):
+                            self.skipped += 1
+                            continue
+                    # Empty content is counted as unreadable by the handler
+                    yield content, source.name
+                manifest.add_file(path, st.st_size, st.st_mtime_ns)
+
+    def poll(self) -> pd.DataFrame:
+        """Ingest what changed; returns the new records (empty if nothing new)."""
+        self.polls += 1
+        self.skipped = self.deferred = 0
+        try:
+            new = self.handler.process_files(self._iter_new(), **self.options)
+            if not new.empty:
+                columns_changed = self._append(new)
+                if self.output:
+                    self._export(new, columns_changed)
+        except BaseException:
+            self.manifest.rollback()
+            raise
+        self.manifest.commit(self.handler.registry)
+        return new
+
+    def _append(self, new: pd.DataFrame) -> bool:
+        """Append new to the running result in the registry layout; True if columns were added."""
+        start = len(self.result)
+        new.index = pd.RangeIndex(start, start + len(new))
+        if self.result.empty:
+            self.result = new
+            return True
+        columns = self.handler.registry.layout(set(self.result.columns) | set(new.columns))
+        changed = columns != list(self.result.columns)
+        registry = self.handler.registry
+        old = fill_missing(self.result, columns, registry)
+        new = fill_missing(new, columns, registry)
+        self.result = pd.concat([old[columns], new[columns]])
+        return changed
+
+    def _export(self, new: pd.DataFrame, columns_changed: bool):
+        import exporters
+        if self.fmt == 'csv' and not columns_changed and os.path.exists(self.output):
+            # The tail of the result has the new rows aligned and filled like the rest
+            exporters.append_csv(self.result.iloc[len(self.result) - len(new):], self.output)
+        else:
+            # Formats without append (or a new column) are rewritten from the records in memory
+            exporters.export(self.result, self.output, fmt=self.fmt, registry=self.handler.registry)
+
+    def watch(self, interval: float, stop: Optional[threading.Event] = None, on_poll=None):
+        """Poll every interval seconds until stop is set; on_poll(new records) after each poll."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            new = self.poll()
+            if on_poll is not None:
+                on_poll(new)
+            stop.wait(interval)
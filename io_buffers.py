@@ -0,0 +1,104 @@
+import io
+import os
+import mmap
+import struct
+import logging
+import zipfile
+from typing import Any, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Files at least this large are memory-mapped instead of read into a bytes copy.
+# Small files stay on read(): mapping costs a few syscalls and keeps a file descriptor
+# open while the buffer is alive. None disables mapping.
+MMAP_THRESHOLD: Optional[int] = 1024 * 1024
+
+# Anything the parsers, hashes and the dedup scan accept as document content
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+_LOCAL_HEADER = struct.Struct('<4s22xHH')   # signature, ..., name length, extra length
+_LOCAL_SIGNATURE = b'PK\x03\x04'
+
+
+class _MappedFile(mmap.mmap):
+    """Read-only mapping usable as ZipFile's file object (mmap lacks seekable())."""
+
+    def seekable(self) -> bool:
+        return True
+
+
+def read_file(path: str) -> Buffer:
+    """
+    Content of a file: a read-only mmap when the file is at least MMAP_THRESHOLD bytes,
+    bytes otherwise (empty files cannot be mapped).
+    """
+    with open(path, 'rb') as f:
+        if MMAP_THRESHOLD is not None and os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(mapped, 'madvise'):
+                # Start the read now (reader threads read ahead); pages count toward
+                # the process only once the parser touches them
+                mapped.madvise(mmap.MADV_WILLNEED)
+            return mapped
+        return f.read()
+
+
+def open_zip(origin: Union[str, bytes]) -> zipfile.ZipFile:
+    """
+    ZipFile over a path or the bytes of an upload. Large archives on disk are opened over
+    an mmap, so stored members can be handed out as views (see read_member).
+    """
+    if not isinstance(origin, str):
+        # BytesIO over bytes shares the buffer, no copy is made
+        return zipfile.ZipFile(io.BytesIO(origin), 'r')
+    if MMAP_THRESHOLD is not None and os.path.getsize(origin) >= MMAP_THRESHOLD:
+        with open(origin, 'rb') as f:
+            mapped = _MappedFile(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return zipfile.ZipFile(mapped, 'r')
+    return zipfile.ZipFile(origin, 'r')
+
+
+def _backing(z: zipfile.ZipFile) -> Optional[Buffer]:
+    """The in-memory buffer a ZipFile reads from, if any."""
+    fp = z.fp
+    if isinstance(fp, mmap.mmap):
+        return fp
+    if isinstance(fp, io.BytesIO):
+        return fp.getbuffer()
+    return None
+
+
+def read_member(z: zipfile.ZipFile, member: str) -> Buffer:
+    """
+    Content of a ZIP member. Stored (uncompressed, unencrypted) members of archives held
+    in memory or mapped are returned as a memoryview into the archive, without a copy;
+    anything else goes through ZipFile.read (which also checks the CRC).
+    """
+    info = z.getinfo(member)
+    if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+        backing = _backing(z)
+        if backing is not None:
+            start = info.header_offset
+            signature, name_len, extra_len = _LOCAL_HEADER.unpack_from(backing, start)
+            if signature == _LOCAL_SIGNATURE:
+                start += _LOCAL_HEADER.size + name_len + extra_len
+                return memoryview(backing)[start:start + info.file_size]
+    return z.read(member)
+
+
+def upload_buffer(upload: Any) -> Buffer:
+    """
+    Content of an uploaded file (Streamlit UploadedFile is a BytesIO) as a view of its
+    own buffer, instead of the read() + seek(0) copy. Other file-likes are read.
+    """
+    getbuffer = getattr(upload, 'getbuffer', None)
+    if getbuffer is not None:
+        return getbuffer()
+    content = upload.read()
+    upload.seek(0)
+    return content
+
+
+def to_bytes(content: Buffer) -> bytes:
+    """bytes for content that has to be pickled (worker processes) or stored."""
+    return content if isinstance(content, bytes) else bytes(content)
@@ -0,0 +1,161 @@
+from array import array
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from column_registry import ColumnRegistry, SUBSIDIO_CAUSADO
+from columnar import ColumnarBuilder
+
+LINE_COLUMNS = ['Registro', 'UUID', 'Seccion', 'Clave', 'Concepto',
+                'ImporteGravado', 'ImporteExento', 'Importe']
+
+
+class NominaLedger:
+    """
+    Tidy result of process_files(output='ledger').
+    headers: one row per receipt (index 'Registro'), same header columns as the wide sheet.
+    lines: one row per concept (Registro, UUID, Seccion, Clave, Concepto,
+    ImporteGravado, ImporteExento, Importe) with categorical text columns.
+    The wide sheet is only built when to_wide() is called.
+    """
+
+    def __init__(self, headers: pd.DataFrame, lines: pd.DataFrame,
+                 registry: ColumnRegistry, keep_layout: bool = False):
+        self.headers = headers
+        self.lines = lines
+        self.registry = registry
+        self.keep_layout = keep_layout
+        self._wide: Optional[pd.DataFrame] = None
+
+    def __len__(self):
+        return len(self.headers)
+
+    @property
+    def empty(self) -> bool:
+        return self.headers.empty
+
+    def to_wide(self) -> pd.DataFrame:
+        """Pivot to the wide layout of process_files(output='wide'); cached after the first call."""
+        if self._wide is None:
+            self._wide = self._pivot()
+        return self._wide
+
+    def _long_form(self) -> pd.DataFrame:
+        """One row per wide cell: Registro, Columna, Valor plus the column spec."""
+        lines = self.lines
+        pos = np.arange(len(lines))
+        seccion = lines['Seccion'].astype(str)
+        concepto = lines['Concepto'].astype(str)
+        clave = lines['Clave'].astype(str)
+        perc = (seccion == 'Percepciones').to_numpy()
+
+        parts = []
+        for suffix, value_col, subitem in [('_Gravado', 'ImporteGravado', 0), ('_Exento', 'ImporteExento', 1)]:
+            parts.append(pd.DataFrame({
+                'pos': pos[perc], 'part': subitem,
+                'Registro': lines['Registro'].to_numpy()[perc],
+                'Columna': (concepto[perc] + suffix).to_numpy(),
+                'Seccion': seccion[perc].to_numpy(), 'Clave': clave[perc].to_numpy(),
+                'Subitem': subitem,
+                'Valor': lines[value_col].to_numpy()[perc],
+            }))
+        other = ~perc
+        subsidio = ((seccion == 'OtrosPagos') & (concepto == SUBSIDIO_CAUSADO)).to_numpy()[other]
+        parts.append(pd.DataFrame({
+            'pos': pos[other], 'part': 0,
+            'Registro': lines['Registro'].to_numpy()[other],
+            'Columna': concepto[other].to_numpy(),
+            'Seccion': seccion[other].to_numpy(), 'Clave': clave[other].to_numpy(),
+            'Subitem': subsidio.astype(int),
+            'Valor': lines['Importe'].to_numpy()[other],
+        }))
+        # Document order: later values and specs win, as in the wide parser
+        return pd.concat(parts, ignore_index=True).sort_values(['pos', 'part'], kind='stable')
+
+    def _pivot(self) -> pd.DataFrame:
+        start = self.headers.index[0] if len(self.headers) else 0
+        headers = self.headers.reset_index(drop=True)
+        n = len(headers)
+        if n == 0:
+            return pd.DataFrame()
+
+        cells = self._long_form()
+        cells = cells[~cells['Columna'].isin(headers.columns)]
+
+        # Register each concept column with the spec of its last occurrence
+        specs = cells.drop_duplicates('Columna', keep='last')
+        self.registry.register_all(zip(specs['Columna'], specs['Seccion'], specs['Clave'],
+                                       specs['Subitem'].astype(int)))
+
+        cells = cells.drop_duplicates(['Registro', 'Columna'], keep='last')
+        codes, names = pd.factorize(cells['Columna'])
+        matrix = np.zeros((n, len(names)))
+        matrix[cells['Registro'].to_numpy() - start, codes] = cells['Valor'].to_numpy()
+
+        concepts = pd.DataFrame(matrix, columns=list(names))
+        wide = pd.concat([headers, concepts], axis=1)
+        wide.index = self.headers.index.rename(None)
+
+        if self.keep_layout:
+            cols = self.registry.layout(set(self.registry.layout()) | set(wide.columns))
+            missing = [c for c in cols if c not in wide.columns]
+            wide = wide.reindex(columns=cols)
+            for col in missing:
+                if self.registry.spec(col)[1] == 'Standard':
+                    wide[col] = ''
+                else:
+                    wide[col] = 0.0
+            return wide
+        return wide[self.registry.layout(wide.columns)]
+
+
+class LedgerBuilder:
+    """Accumulates (header, lines) pairs from parse_xml_ledger into a NominaLedger."""
+
+    def __init__(self, registry: ColumnRegistry):
+        self.registry = registry
+        self.headers = ColumnarBuilder(registry)
+        self._registro = array('q')
+        self._uuid: List[str] = []
+        self._seccion: List[str] = []
+        self._clave: List[str] = []
+        self._concepto: List[str] = []
+        self._gravado = array('d')
+        self._exento = array('d')
+        self._importe = array('d')
+
+    @property
+    def rows(self) -> int:
+        return self.headers.rows
+
+    def append(self, header: Dict[str, Any], lines: Sequence[Sequence[Any]]):
+        registro = self.headers.rows
+        self.headers.append(header)
+        uuid = header.get('UUID', '')
+        for seccion, clave, concepto, gravado, exento, importe in lines:
+            self._registro.append(registro)
+            self._uuid.append(uuid)
+            self._seccion.append(seccion)
+            self._clave.append(clave)
+            self._concepto.append(concepto)
+            self._gravado.append(gravado)
+            self._exento.append(exento)
+            self._importe.append(importe)
+
+    def build(self, keep_layout: bool = False, start: int = 0) -> NominaLedger:
+        """start: first Registro value (for batches of a larger run)."""
+        headers = self.headers.build(start=start)
+        headers.index.name = 'Registro'
+        registro = np.frombuffer(self._registro, dtype=np.int64)
+        lines = pd.DataFrame({
+            'Registro': registro + start if start else registro,
+            'UUID': pd.Categorical(self._uuid),
+            'Seccion': pd.Categorical(self._seccion),
+            'Clave': pd.Categorical(self._clave),
+            'Concepto': pd.Categorical(self._concepto),
+            'ImporteGravado': np.frombuffer(self._gravado, dtype=np.float64),
+            'ImporteExento': np.frombuffer(self._exento, dtype=np.float64),
+            'Importe': np.frombuffer(self._importe, dtype=np.float64),
+        }, columns=LINE_COLUMNS)
+        return NominaLedger(headers, lines, self.registry, keep_layout=keep_layout)
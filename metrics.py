@@ -0,0 +1,135 @@
+import io
+import heapq
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+PROFILERS = ('cprofile', 'tracemalloc')
+
+# Stages in pipeline order, used to present the timings consistently
+STAGE_ORDER = ['discovery', 'dedup', 'read', 'decompress', 'parse', 'assemble', 'build', 'export']
+
+
+class RunMetrics:
+    """
+    Counters and timers of one processing run.
+    stages: seconds per stage. read/decompress/parse are summed per file, so with
+    reader threads or worker processes they are CPU-seconds and can exceed the wall time.
+    slowest: the slowest_n files by parse time.
+    """
+
+    def __init__(self, slowest_n: int = 10):
+        self.slowest_n = slowest_n
+        self.stages: Dict[str, float] = {}
+        self.files = 0
+        self.records = 0
+        self.errors = 0
+        self.bytes = 0
+        self.failed_files: List[str] = []
+        self.unreadable: List[str] = []
+        self.duplicates: List[Dict[str, Any]] = []
+        self.cache: Optional[Dict[str, int]] = None
+        self.wall = 0.0
+        self.profile: Optional[str] = None
+        self._slowest: List[tuple] = []  # min-heap of (seconds, seq, name, nbytes)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._profiler = None
+
+    def add_time(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def record_file(self, name: str, nbytes: int, seconds: float):
+        """Account one parsed file (parse time goes to the 'parse' stage)."""
+        self.bytes += nbytes
+        self.add_time('parse', seconds)
+        self._seq += 1
+        entry = (seconds, self._seq, name, nbytes)
+        if len(self._slowest) < self.slowest_n:
+            heapq.heappush(self._slowest, entry)
+        elif seconds > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    @property
+    def slowest(self) -> List[Dict[str, Any]]:
+        return [{'Archivo': name, 'Segundos': round(seconds, 4), 'Bytes': nbytes}
+                for seconds, _, name, nbytes in sorted(self._slowest, reverse=True)]
+
+    def ordered_stages(self) -> Dict[str, float]:
+        known = [s for s in STAGE_ORDER if s in self.stages]
+        other = sorted(s for s in self.stages if s not in STAGE_ORDER)
+        return {s: self.stages[s] for s in known + other}
+
+    # Optional profiling of a run
+    def start_profile(self, kind: Optional[str]):
+        if not kind:
+            return
+        if kind not in PROFILERS:
+            raise ValueError(f"Unknown profiler: {kind}")
+        if kind == 'cprofile':
+            import cProfile
+            self._profiler = ('cprofile', cProfile.Profile())
+            self._profiler[1].enable()
+        else:
+            import tracemalloc
+            self._profiler = ('tracemalloc', not tracemalloc.is_tracing())
+            if self._profiler[1]:
+                tracemalloc.start()
+            if hasattr(tracemalloc, "reset_peak"):  # Python 3.9+
+                tracemalloc.reset_peak()
+
+    def pause_profile(self):
+        """cProfile only samples the run itself, not the caller between batches."""
+        if self._profiler and self._profiler[0] == 'cprofile':
+            self._profiler[1].disable()
+
+    def resume_profile(self):
+        if self._profiler and self._profiler[0] == 'cprofile':
+            self._profiler[1].enable()
+
+    def stop_profile(self, top: int = 25):
+        if not self._profiler:
+            return
+        kind, state = self._profiler
+        self._profiler = None
+        out = io.StringIO()
+        if kind == 'cprofile':
+            import pstats
+            state.disable()
+            pstats.Stats(state, stream=out).sort_stats('cumulative').print_stats(top)
+        else:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if state:
+                tracemalloc.stop()
+            out.write(f"Peak traced memory: {peak / 1024 / 1024:,.1f} MB (current {current / 1024 / 1024:,.1f} MB)\n")
+            for stat in snapshot.statistics('lineno')[:top]:
+                out.write(f"{stat}\n")
+        self.profile = out.getvalue()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'files': self.files,
+            'records': self.records,
+            'errors': self.errors,
+            'bytes': self.bytes,
+            'failed_files': list(self.failed_files),
+            'unreadable': list(self.unreadable),
+            'duplicates': len(self.duplicates),
+            'wall_seconds': round(self.wall, 3),
+            'stages': {k: round(v, 3) for k, v in self.ordered_stages().items()},
+            'slowest': self.slowest,
+            'cache': self.cache,
+            'profile': self.profile,
+        }
@@ -0,0 +1,118 @@
+import sqlite3
+import hashlib
+import json
+import time
+import zlib
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ParseCache:
+    """
+    Persistent content-addressed cache of parsed CFDI records.
+    Each entry stores the parsed record and the column specs it registered, keyed by the SHA-256 of the XML bytes. Stored in a single
+    SQLite file with LRU eviction once max_bytes is exceeded.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024, version: str = ''):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._pending_writes = 0
+
+        # A run may be handed to a background thread (chunked_run); one thread uses it at a time
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, payload BLOB NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS info (name TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+        row = self._conn.execute("SELECT value FROM info WHERE name = 'version'").fetchone()
+        if row is None or row[0] != version:
+            if row is not None:
+                logger.info(f"Parse cache version changed ({row[0]} -> {version}), invalidating")
+            self.invalidate()
+
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    @staticmethod
+    def key(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[Dict[str, Any], List[tuple]]]:
+        """Return (record, column specs) or None."""
+        row = self._conn.execute("SELECT payload FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._maybe_commit()
+        record, specs = json.loads(zlib.decompress(row[0]))
+        return record, [tuple(spec) for spec in specs]
+
+    def put(self, key: str, record: Dict[str, Any], specs: List[tuple]):
+        payload = zlib.compress(json.dumps([record, specs]).encode('utf-8'), 1)
+        old = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        if old is not None:
+            self._total_bytes -= old[0]
+        self._conn.execute(
+            "INSERT OR REPLACE INTO entries (key, payload, size, last_used) VALUES (?, ?, ?, ?)",
+            (key, payload, len(payload), time.time())
+        )
+        self._total_bytes += len(payload)
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+        self._maybe_commit()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is under 90% of max_bytes."""
+        target = int(self.max_bytes * 0.9)
+        while self._total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY last_used LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+            for key, size in rows:
+                if self._total_bytes <= target:
+                    break
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._total_bytes -= size
+
+    def invalidate(self):
+        """Drop every entry, e.g. when the extractor version changes."""
+        self._conn.execute("DELETE FROM entries")
+        self._conn.execute("INSERT OR REPLACE INTO info (name, value) VALUES ('version', ?)", (self.version,))
+        self._conn.commit()
+        self._total_bytes = 0
+
+    def _maybe_commit(self):
+        self._pending_writes += 1
+        if self._pending_writes >= 500:
+            self.flush()
+
+    def flush(self):
+        self._conn.commit()
+        self._pending_writes = 0
+
+    def stats(self) -> Dict[str, int]:
+        entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'bytes': self._total_bytes}
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        self.flush()
+        self._conn.close()
@@ -0,0 +1,316 @@
+import json
+import itertools
+import time
+import sqlite3
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from column_registry import ColumnRegistry
+from ledger import LINE_COLUMNS, NominaLedger
+
+logger = logging.getLogger(__name__)
+
+STORE_VERSION = '1'
+
+# Header columns with their own index (besides the unique UUID)
+INDEXED_COLUMNS = ['Emisor_RFC', 'Receptor_RFC', 'FechaPago']
+
+# Concept line columns stored per receipt (Registro becomes the receipt id)
+_LINE_FIELDS = LINE_COLUMNS[2:]
+
+# Period granularity for concept_totals: SQL expression over FechaPago ('YYYY-MM-DD')
+PERIODS = {
+    'date': 'h.FechaPago',
+    'month': 'substr(h.FechaPago, 1, 7)',
+    'year': 'substr(h.FechaPago, 1, 4)',
+}
+
+# SQLite allows 999 parameters per statement in older builds
+_MAX_PARAMS = 900
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _records(df: pd.DataFrame) -> Iterable[tuple]:
+    """Rows of plain Python values (None for missing) that sqlite3 can bind."""
+    columns = []
+    for name in df.columns:
+        values = df[name].tolist()
+        missing = df[name].isna()
+        if missing.any():
+            values = [None if m else v for v, m in zip(values, missing.tolist())]
+        columns.append(values)
+    return zip(*columns)
+
+
+class PayrollStore:
+    """
+    Persistent, indexed SQLite store of parsed receipts, fed by NominaXMLHandler.
+    headers: one row per receipt (every header column of the extraction spec; new ones are
+    added as columns when they first appear), unique by UUID and indexed by Emisor_RFC,
+    Receptor_RFC and FechaPago.
+    lines: one row per concept line (Seccion, Clave, Concepto and the three amounts),
+    linked to headers.id.
+    Each ingested batch is one transaction: it is stored completely or not at all.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS headers ("
+                " id INTEGER PRIMARY KEY, UUID TEXT UNIQUE, ingested REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS lines ("
+                " receipt_id INTEGER NOT NULL REFERENCES headers(id) ON DELETE CASCADE,"
+                " Seccion TEXT, Clave TEXT, Concepto TEXT,"
+                " ImporteGravado REAL, ImporteExento REAL, Importe REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_lines_receipt ON lines(receipt_id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_lines_concept ON lines(Seccion, Clave)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS info (name TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute("INSERT OR IGNORE INTO info (name, value) VALUES ('version', ?)", (STORE_VERSION,))
+        self._columns = self._header_columns()
+        self._registry = self.registry()
+        self._ensure_columns({name: 'TEXT' for name in INDEXED_COLUMNS})
+
+    def _header_columns(self) -> List[str]:
+        return [row[1] for row in self._conn.execute("PRAGMA table_info(headers)")]
+
+    def _ensure_columns(self, types: Dict[str, str]):
+        """Add missing header columns (and the indexes of INDEXED_COLUMNS)."""
+        for name, sql_type in types.items():
+            if name in self._columns:
+                continue
+            self._conn.execute(f"ALTER TABLE headers ADD COLUMN {_quote(name)} {sql_type}")
+            self._columns.append(name)
+            if name in INDEXED_COLUMNS:
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS {_quote('idx_headers_' + name)} "
+                                   f"ON headers({_quote(name)})")
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM headers").fetchone()[0]
+
+    # Ingestion
+    def ingest(self, files: Iterable[Any], handler: Any = None, batch_size: int = 5000,
+               replace: bool = False, **options) -> Dict[str, int]:
+        """
+        Parse files with handler (a new NominaXMLHandler if None) and store them in
+        batches of batch_size receipts. files: anything process_files() accepts; paths
+        (folders, .xml, .zip) are expanded with iter_paths(). options go to
+        handler.iter_dataframes().
+        Receipts whose UUID is already stored are skipped, or replaced with replace=True.
+        Returns the counts of inserted, replaced and skipped receipts.
+        """
+        if handler is None:
+            from xml_handler import NominaXMLHandler
+            handler = NominaXMLHandler(registry=self.registry())
+        if isinstance(files, str):
+            files = [files]
+        sources = itertools.chain.from_iterable(
+            handler.iter_paths([f]) if isinstance(f, str) else [f] for f in files
+        )
+        counts = {'inserted': 0, 'replaced': 0, 'skipped': 0}
+        options['output'] = 'ledger'
+        for ledger in handler.iter_dataframes(sources, batch_size=batch_size, **options):
+            for name, value in self.add(ledger, replace=replace).items():
+                counts[name] += value
+        return counts
+
+    def add(self, ledger: NominaLedger, replace: bool = False) -> Dict[str, int]:
+        """Store one ledger batch in a single transaction."""
+        headers = ledger.headers
+        if headers.empty:
+            return {'inserted': 0, 'replaced': 0, 'skipped': 0}
+        uuids = headers['UUID'].where(headers['UUID'].astype(bool), None) if 'UUID' in headers else None
+
+        # A UUID repeated inside the batch keeps its first (or, when replacing, last) receipt
+        keep = np.ones(len(headers), dtype=bool)
+        if uuids is not None:
+            repeated = uuids.notna() & uuids.duplicated(keep='last' if replace else 'first')
+            keep &= ~repeated.to_numpy()
+
+        self._ensure_columns({
+            name: 'REAL' if pd.api.types.is_float_dtype(headers[name].dtype) else 'TEXT'
+            for name in headers.columns
+        })
+        counts = {'inserted': 0, 'replaced': 0, 'skipped': 0}
+        with self._conn:
+            if uuids is not None:
+                stored = self._ids_of([u for u in uuids[keep] if u is not None])
+                if stored:
+                    known = uuids.isin(stored.keys()).to_numpy()
+                    if replace:
+                        ids = list(stored.values())
+                        for start in range(0, len(ids), _MAX_PARAMS):
+                            part = ids[start:start + _MAX_PARAMS]
+                            self._conn.execute(f"DELETE FROM headers WHERE id IN ({','.join('?' * len(part))})", part)
+                        counts['replaced'] = int((known & keep).sum())
+                    else:
+                        counts['skipped'] = int((known & keep).sum())
+                        keep &= ~known
+            counts['skipped'] += int(len(headers) - keep.sum() - counts['skipped'])
+
+            kept = headers[keep]
+            if kept.empty:
+                return counts
+            base = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM headers").fetchone()[0] + 1
+            ids = np.arange(base, base + len(kept))
+            rows = kept.copy()
+            if uuids is not None:
+                rows['UUID'] = uuids[keep]
+            rows.insert(0, 'id', ids.tolist())
+            rows.insert(1, 'ingested', time.time())
+            names = ', '.join(_quote(c) for c in rows.columns)
+            marks = ', '.join('?' * len(rows.columns))
+            self._conn.executemany(f"INSERT INTO headers ({names}) VALUES ({marks})", _records(rows))
+
+            # Registro (the batch's header index) -> receipt id
+            lines = ledger.lines
+            registro = pd.Series(ids, index=kept.index)
+            lines = lines[lines['Registro'].isin(registro.index)]
+            if len(lines):
+                line_rows = pd.DataFrame({'receipt_id': registro.loc[lines['Registro']].to_numpy().tolist()})
+                for name in _LINE_FIELDS:
+                    line_rows[name] = lines[name].astype(object if name in ('Seccion', 'Clave', 'Concepto') else float).to_numpy()
+                self._conn.executemany(
+                    f"INSERT INTO lines (receipt_id, {', '.join(_LINE_FIELDS)}) VALUES (?{', ?' * len(_LINE_FIELDS)})",
+                    _records(line_rows)
+                )
+            self._save_registry(ledger.registry)
+            counts['inserted'] = len(kept) - counts['replaced']
+        return counts
+
+    def _ids_of(self, uuids: Sequence[str]) -> Dict[str, int]:
+        found = {}
+        for start in range(0, len(uuids), _MAX_PARAMS):
+            part = list(uuids[start:start + _MAX_PARAMS])
+            found.update(self._conn.execute(
+                f"SELECT UUID, id FROM headers WHERE UUID IN ({','.join('?' * len(part))})", part
+            ).fetchall())
+        return found
+
+    def _save_registry(self, registry: Optional[ColumnRegistry]):
+        """Merge the batch's column specs into the stored layout (used to rebuild the wide sheet)."""
+        if registry is None:
+            return
+        if self._registry is None:
+            self._registry = ColumnRegistry()
+        self._registry.register_all(tuple(spec) for spec in registry.to_dict()['columns'])
+        self._conn.execute("INSERT OR REPLACE INTO info (name, value) VALUES ('registry', ?)",
+                           (json.dumps(self._registry.to_dict(), ensure_ascii=False),))
+
+    def registry(self) -> Optional[ColumnRegistry]:
+        row = self._conn.execute("SELECT value FROM info WHERE name = 'registry'").fetchone()
+        return ColumnRegistry.from_dict(json.loads(row[0])) if row else None
+
+    # Queries
+    def _where(self, rfc: Optional[str] = None, emisor_rfc: Optional[str] = None,
+               receptor_rfc: Optional[str] = None, year: Optional[int] = None,
+               start: Optional[str] = None, end: Optional[str] = None,
+               uuid: Optional[str] = None) -> Tuple[str, list]:
+        """
+        WHERE clause over headers (alias h). rfc matches the emisor or the receptor;
+        year, start and end filter FechaPago (start/end inclusive, 'YYYY-MM-DD').
+        """
+        clauses, params = [], []
+        if rfc:
+            clauses.append("(h.Emisor_RFC = ? OR h.Receptor_RFC = ?)")
+            params += [rfc, rfc]
+        if emisor_rfc:
+            clauses.append("h.Emisor_RFC = ?")
+            params.append(emisor_rfc)
+        if receptor_rfc:
+            clauses.append("h.Receptor_RFC = ?")
+            params.append(receptor_rfc)
+        if year:
+            # Range instead of substr() so the FechaPago index is used
+            clauses.append("h.FechaPago >= ? AND h.FechaPago < ?")
+            params += [f"{int(year):04d}-01-01", f"{int(year) + 1:04d}-01-01"]
+        if start:
+            clauses.append("h.FechaPago >= ?")
+            params.append(start)
+        if end:
+            clauses.append("h.FechaPago <= ?")
+            params.append(end)
+        if uuid:
+            clauses.append("h.UUID = ?")
+            params.append(uuid.upper())
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, sql: str, params: Sequence[Any] = ()) -> pd.DataFrame:
+        """Run any SELECT on the store (tables headers and lines)."""
+        return pd.read_sql_query(sql, self._conn, params=list(params))
+
+    def receipts(self, **filters) -> pd.DataFrame:
+        """Header rows matching the filters of _where(), in layout order, indexed by receipt id."""
+        where, params = self._where(**filters)
+        df = self.query(f"SELECT h.* FROM headers h{where} ORDER BY h.id", params).set_index('id')
+        df.index.name = 'Registro'
+        df = df.drop(columns=['ingested'])
+        registry = self.registry()
+        if registry is not None:
+            df = df[registry.layout(df.columns)]
+        return df
+
+    def lines(self, **filters) -> pd.DataFrame:
+        """Concept lines of the matching receipts, with the receipt's UUID."""
+        where, params = self._where(**filters)
+        return self.query(
+            f"SELECT l.receipt_id AS Registro, h.UUID, l.Seccion, l.Clave, l.Concepto, "
+            f"l.ImporteGravado, l.ImporteExento, l.Importe "
+            f"FROM lines l JOIN headers h ON h.id = l.receipt_id{where} ORDER BY l.rowid", params
+        )
+
+    def concept_totals(self, by: str = 'month', **filters) -> pd.DataFrame:
+        """
+        Totals per concept per period: by is 'date' (FechaPago), 'month' or 'year'.
+        One row per (Periodo, Seccion, Clave, Concepto) with summed amounts and receipt count.
+        """
+        if by not in PERIODS:
+            raise ValueError(f"Unknown period: {by}")
+        where, params = self._where(**filters)
+        return self.query(
+            f"SELECT {PERIODS[by]} AS Periodo, l.Seccion, l.Clave, l.Concepto, "
+            f"SUM(l.ImporteGravado) AS ImporteGravado, SUM(l.ImporteExento) AS ImporteExento, "
+            f"SUM(l.Importe) AS Importe, COUNT(DISTINCT l.receipt_id) AS Recibos "
+            f"FROM lines l JOIN headers h ON h.id = l.receipt_id{where} "
+            f"GROUP BY Periodo, l.Seccion, l.Clave, l.Concepto "
+            f"ORDER BY Periodo, l.Seccion, l.Clave, l.Concepto", params
+        )
+
+    def to_ledger(self, **filters) -> NominaLedger:
+        """
+        The matching receipts as a NominaLedger (Registro renumbered from 0), ready for the
+        app's results view and exports; .to_wide() gives the usual wide sheet.
+        """
+        headers = self.receipts(**filters)
+        lines = self.lines(**filters)
+        positions = headers.index.get_indexer(lines['Registro'])
+        headers = headers.reset_index(drop=True)
+        headers.index.name = 'Registro'
+        lines['Registro'] = positions.astype(np.int64)
+        for name in ('UUID', 'Seccion', 'Clave', 'Concepto'):
+            lines[name] = pd.Categorical(lines[name])
+        registry = self.registry() or ColumnRegistry()
+        return NominaLedger(headers, lines[LINE_COLUMNS], registry)
+
+    def stats(self) -> Dict[str, Any]:
+        receipts, first, last = self._conn.execute(
+            "SELECT COUNT(*), MIN(FechaPago), MAX(FechaPago) FROM headers"
+        ).fetchone()
+        lines = self._conn.execute("SELECT COUNT(*) FROM lines").fetchone()[0]
+        return {'receipts': receipts, 'lines': lines, 'first': first, 'last': last}
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,77 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+# Bounded queue between discovery and the readers. Handles are small, so this mostly
+# lets a slow walk (network shares) run ahead of parsing without holding any file content.
+DISCOVERY_QUEUE = 4096
+
+# Reader threads used in pipelined mode when io_threads is not set higher
+PIPELINE_READERS = 2
+
+_DONE = object()
+
+
+class _Failure:
+    __slots__ = ('error',)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def background(items: Iterable[Any], maxsize: int = DISCOVERY_QUEUE,
+               on_time: Optional[Callable[[float], None]] = None) -> Iterator[Any]:
+    """
+    Iterate items in a producer thread and yield them here, in order, through a bounded
+    queue: the producer blocks when the consumer falls maxsize items behind (backpressure).
+    Exceptions raised by the producer are re-raised in the consumer. on_time receives the
+    seconds spent producing items, excluding the time blocked on a full queue.
+    Closing the generator early stops the producer.
+    """
+    q: "queue.Queue[Any]" = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(value) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        busy = 0.0
+        try:
+            it = iter(items)
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    break
+                finally:
+                    busy += time.perf_counter() - start
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            if on_time is not None:
+                on_time(busy)
+
+    thread = threading.Thread(target=produce, name='nomina-discovery', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,160 @@
+import os
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+INPUT_EXTENSIONS = ('.xml', '.zip')
+
+
+def hash_uploads(files: Iterable[Any], options: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Key for a set of uploaded files: SHA-256 over each file's name and bytes, plus the
+    processing options that change the result (output mode, layout).
+    """
+    h = hashlib.sha256()
+    for f in files:
+        h.update(f.name.encode('utf-8', 'replace'))
+        h.update(b'\0')
+        h.update(f.getbuffer())
+        h.update(b'\0')
+    _update_options(h, options)
+    return 'upload:' + h.hexdigest()
+
+
+def hash_directory(path: str, options: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Key for a directory: manifest of (relative path, size, mtime) of every XML/ZIP below it.
+    Cheap to compute (stat only); any added, removed or rewritten file changes the key.
+    """
+    h = hashlib.sha256()
+    h.update(os.path.abspath(path).encode('utf-8', 'replace'))
+    entries = []
+    for root, _, names in os.walk(path):
+        for name in names:
+            if not name.lower().endswith(INPUT_EXTENSIONS):
+                continue
+            full = os.path.join(root, name)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            entries.append((os.path.relpath(full, path), st.st_size, st.st_mtime_ns))
+    for rel, size, mtime in sorted(entries):
+        h.update(f"{rel}\0{size}\0{mtime}\n".encode('utf-8', 'replace'))
+    _update_options(h, options)
+    return 'dir:' + h.hexdigest()
+
+
+def _update_options(h, options: Optional[Dict[str, Any]]):
+    for name, value in sorted((options or {}).items()):
+        h.update(f"{name}={value!r}\n".encode('utf-8', 'replace'))
+
+
+def result_nbytes(result: Any) -> int:
+    """Approximate in-memory size of a DataFrame or NominaLedger."""
+    if isinstance(result, pd.DataFrame):
+        return int(result.memory_usage(index=True, deep=True).sum())
+    headers = getattr(result, 'headers', None)
+    lines = getattr(result, 'lines', None)
+    if headers is not None and lines is not None:
+        return result_nbytes(headers) + result_nbytes(lines)
+    return 0
+
+
+class ResultCache:
+    """
+    Per-session cache of processing results and their exported files.
+    Entries are keyed by the input hash (see hash_uploads / hash_directory); each holds the
+    result, the column registry used to build it and the export bytes per format. Least
+    recently used entries are evicted once max_bytes is exceeded; the active entry is never
+    evicted, but its exports are dropped if it alone does not fit.
+    """
+
+    def __init__(self, max_bytes: int = 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.active: Optional[str] = None
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def put(self, key: str, result: Any, registry: Any = None, info: Optional[Dict[str, Any]] = None):
+        self._entries[key] = {
+            'result': result,
+            'registry': registry,
+            'info': info or {},
+            'exports': {},
+            'nbytes': result_nbytes(result),
+        }
+        self._entries.move_to_end(key)
+        self.active = key
+        self._evict()
+
+    def get(self, key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Entry for key (default: the active one), or None."""
+        key = self.active if key is None else key
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def activate(self, key: str) -> bool:
+        if key not in self._entries:
+            return False
+        self.active = key
+        self._entries.move_to_end(key)
+        return True
+
+    def export(self, fmt: str, build: Callable[[Any, str, Any], Tuple[bytes, str, bool]],
+               key: Optional[str] = None) -> Tuple[bytes, str, bool]:
+        """Export bytes for fmt, built once with build(result, fmt, registry) and reused afterwards."""
+        key = self.active if key is None else key
+        entry = self._entries[key]
+        exported = entry['exports'].get(fmt)
+        if exported is None:
+            exported = build(entry['result'], fmt, entry['registry'])
+            entry['exports'][fmt] = exported
+            entry['nbytes'] += len(exported[0])
+            self._entries.move_to_end(key)
+            self._evict()
+        return exported
+
+    def invalidate(self, key: Optional[str] = None):
+        """Drop one entry, or everything when key is None."""
+        if key is None:
+            self._entries.clear()
+            self.active = None
+            return
+        self._entries.pop(key, None)
+        if self.active == key:
+            self.active = None
+
+    @property
+    def nbytes(self) -> int:
+        return sum(e['nbytes'] for e in self._entries.values())
+
+    def _evict(self):
+        total = self.nbytes
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                return
+            if key == self.active:
+                continue
+            total -= self._entries.pop(key)['nbytes']
+            logger.info(f"Result cache: evicted {key[:20]}")
+        if total > self.max_bytes and self.active in self._entries:
+            entry = self._entries[self.active]
+            for fmt, exported in list(entry['exports'].items()):
+                if total <= self.max_bytes:
+                    break
+                del entry['exports'][fmt]
+                entry['nbytes'] -= len(exported[0])
+                total -= len(exported[0])
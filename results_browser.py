@@ -0,0 +1,193 @@
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from column_registry import ColumnRegistry, SECTION_PRIORITY
+from ledger import NominaLedger
+
+# Column groups offered to the viewer, in layout order
+SECTIONS = list(SECTION_PRIORITY)
+
+RFC_COLUMNS = ['Emisor_RFC', 'Receptor_RFC']
+DATE_COLUMN = 'FechaPago'
+
+PAGE_SIZES = [25, 50, 100, 250, 500]
+
+
+class _SortedKey:
+    """
+    A column's values sorted once, with the row position of each, so an exact value,
+    a prefix or a range is two binary searches and a slice of positions.
+    """
+
+    def __init__(self, values: np.ndarray, positions: Optional[np.ndarray] = None):
+        order = np.argsort(values, kind='stable')
+        self.values = values[order]
+        self.order = order if positions is None else positions[order]
+
+    def between(self, low, high) -> np.ndarray:
+        """Positions with low <= value <= high (None = unbounded)."""
+        start = 0 if low is None else np.searchsorted(self.values, low, side='left')
+        stop = len(self.values) if high is None else np.searchsorted(self.values, high, side='right')
+        return self.order[start:stop]
+
+    def prefix(self, text: str) -> np.ndarray:
+        """Positions whose value starts with text."""
+        start = np.searchsorted(self.values, text, side='left')
+        stop = np.searchsorted(self.values, text + '\U0010ffff', side='left')
+        return self.order[start:stop]
+
+
+def _contiguous(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    df with its Arrow-backed text columns in a single chunk. Results appended batch by
+    batch (pd.concat) keep one chunk per batch, and Arrow's take() joins the chunks on
+    every call, which would make each page cost a copy of the whole column.
+    """
+    arrow = [name for name in df.columns if _arrow_backed(df[name].dtype)]
+    if not arrow:
+        return df
+    # Only here: Arrow-backed columns mean pyarrow is installed
+    import pyarrow as pa
+
+    df = df.copy(deep=False)
+    for name in arrow:
+        chunks = pa.chunked_array(df[name])
+        if chunks.num_chunks > 1:
+            df[name] = pd.Series(pd.array(chunks.combine_chunks(), dtype=df[name].dtype),
+                                 index=df.index, name=name)
+    return df
+
+
+def _arrow_backed(dtype) -> bool:
+    return isinstance(dtype, pd.ArrowDtype) or (isinstance(dtype, pd.StringDtype) and dtype.storage == 'pyarrow')
+
+
+class ResultsBrowser:
+    """
+    Paged, filtered view of a processing result (the wide sheet, or the headers of a
+    NominaLedger), so the app only sends one page to the browser.
+    The filter keys are indexed once when the browser is built: RFCs as categorical codes
+    sorted by code, FechaPago as sorted datetime64 values, UUID as sorted upper-case text
+    (prefix search). A filter is a few binary searches plus a boolean mask over the rows;
+    the last filtered positions are kept, so paging is a slice.
+    """
+
+    def __init__(self, result, registry: Optional[ColumnRegistry] = None):
+        self.ledger = result if isinstance(result, NominaLedger) else None
+        self.df = _contiguous(self.ledger.headers if self.ledger is not None else result)
+        self.registry = registry if registry is not None else ColumnRegistry()
+        n = len(self.df)
+
+        self._rfc: Dict[str, tuple] = {}
+        for name in RFC_COLUMNS:
+            if name in self.df:
+                codes, categories = pd.factorize(self.df[name].astype(str).str.upper(), sort=True)
+                self._rfc[name] = (pd.Index(categories), _SortedKey(codes))
+        self._dates = None
+        if DATE_COLUMN in self.df:
+            dates = pd.to_datetime(self.df[DATE_COLUMN], errors='coerce', format='mixed').to_numpy()
+            dates = dates.astype('datetime64[D]')
+            # Receipts without a valid date never match a date range
+            valid = np.flatnonzero(~np.isnat(dates))
+            self._dates = _SortedKey(dates[valid], valid)
+        self._uuid = None
+        if 'UUID' in self.df:
+            self._uuid = _SortedKey(self.df['UUID'].astype(str).str.upper().to_numpy(dtype=str))
+
+        self._sections = {}
+        for name in self.df.columns:
+            spec = self.registry.spec(name)
+            self._sections.setdefault(spec[1] if spec is not None else 'Standard', []).append(name)
+
+        self._line_starts = None
+        if self.ledger is not None:
+            registro = self.ledger.lines['Registro'].to_numpy()
+            self._line_order = None
+            if len(registro) and (np.diff(registro) < 0).any():
+                self._line_order = np.argsort(registro, kind='stable')
+                registro = registro[self._line_order]
+            index = self.df.index.to_numpy()
+            self._line_starts = (np.searchsorted(registro, index, side='left'),
+                                 np.searchsorted(registro, index, side='right'))
+
+        self._filter_key = None
+        self.positions = np.arange(n)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    @property
+    def sections(self) -> List[str]:
+        """Sections with at least one column, in layout order."""
+        return [s for s in SECTIONS if s in self._sections] + \
+               [s for s in self._sections if s not in SECTIONS]
+
+    def columns(self, sections: Optional[Sequence[str]] = None) -> List[str]:
+        """Columns of the given sections (all when None), in the result's order."""
+        if sections is None:
+            return list(self.df.columns)
+        wanted = {c for s in sections for c in self._sections.get(s, [])}
+        return [c for c in self.df.columns if c in wanted]
+
+    def filter(self, rfc: Optional[str] = None, start=None, end=None,
+               uuid: Optional[str] = None) -> int:
+        """
+        Keep the rows matching every filter given: rfc (emisor or receptor, exact),
+        FechaPago between start and end (dates, inclusive) and uuid (prefix).
+        Returns the number of rows kept.
+        """
+        rfc = (rfc or '').strip().upper() or None
+        uuid = (uuid or '').strip().upper() or None
+        start = None if start is None else np.datetime64(pd.Timestamp(start).date(), 'D')
+        end = None if end is None else np.datetime64(pd.Timestamp(end).date(), 'D')
+        key = (rfc, start, end, uuid)
+        if key == self._filter_key:
+            return len(self.positions)
+
+        n = len(self.df)
+        mask = None
+
+        def keep(positions):
+            nonlocal mask
+            selected = np.zeros(n, dtype=bool)
+            selected[positions] = True
+            mask = selected if mask is None else mask & selected
+
+        if rfc is not None:
+            matched = [np.empty(0, dtype=np.int64)]
+            for categories, codes in self._rfc.values():
+                code = categories.get_indexer([rfc])[0]
+                if code >= 0:
+                    matched.append(codes.between(code, code))
+            keep(np.concatenate(matched))
+        if (start is not None or end is not None) and self._dates is not None:
+            keep(self._dates.between(start, end))
+        if uuid is not None:
+            keep(self._uuid.prefix(uuid) if self._uuid is not None else np.empty(0, dtype=np.int64))
+
+        self.positions = np.arange(n) if mask is None else np.flatnonzero(mask)
+        self._filter_key = key
+        return len(self.positions)
+
+    def pages(self, page_size: int) -> int:
+        return max(1, -(-len(self.positions) // page_size))
+
+    def page(self, number: int, page_size: int, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Rows of page number (from 1) of the filtered result, only the given columns."""
+        start = (max(1, number) - 1) * page_size
+        rows = self.positions[start:start + page_size]
+        frame = self.df.iloc[rows]
+        return frame if columns is None else frame[list(columns)]
+
+    def lines(self, page: pd.DataFrame) -> pd.DataFrame:
+        """Concept lines of the receipts on a page (ledger results only)."""
+        if self.ledger is None:
+            return pd.DataFrame()
+        positions = self.df.index.get_indexer(page.index)
+        starts, stops = self._line_starts[0][positions], self._line_starts[1][positions]
+        rows = np.concatenate([np.arange(a, b) for a, b in zip(starts, stops)]) if len(positions) else []
+        if self._line_order is not None:
+            rows = self._line_order[rows]
+        return self.ledger.lines.iloc[rows]
@@ -0,0 +1,254 @@
+"""
+Deterministic generator of synthetic CFDI 3.3/4.0 + Nómina 1.2 documents for benchmarks.
+
+    python synthetic_cfdi.py /tmp/corpus -n 10000 --per-zip 1000
+
+Document i depends only on (seed, i), so any slice of a corpus can be rebuilt
+independently and two runs with the same options produce identical bytes.
+"""
+import argparse
+import base64
+import os
+import random
+import uuid
+import zipfile
+from typing import Iterator, Optional, Tuple
+
+NS_CFDI3 = 'http://www.sat.gob.mx/cfd/3'
+NS_CFDI4 = 'http://www.sat.gob.mx/cfd/4'
+NS_NOMINA = 'http://www.sat.gob.mx/nomina12'
+NS_TFD = 'http://www.sat.gob.mx/TimbreFiscalDigital'
+
+SCHEMA_LOCATION = {
+    '3.3': f'{NS_CFDI3} http://www.sat.gob.mx/sitio_internet/cfd/3/cfdv33.xsd',
+    '4.0': f'{NS_CFDI4} http://www.sat.gob.mx/sitio_internet/cfd/4/cfdv40.xsd',
+}
+
+# (Tipo, Concepto) from the SAT catalogs c_TipoPercepcion / c_TipoDeduccion / c_TipoOtroPago
+PERCEPCIONES = [
+    ('001', 'Sueldos, Salarios Rayas y Jornales'),
+    ('002', 'Gratificación Anual (Aguinaldo)'),
+    ('003', 'Participación de los Trabajadores en las Utilidades PTU'),
+    ('010', 'Premios por puntualidad'),
+    ('019', 'Horas extra'),
+    ('020', 'Prima dominical'),
+    ('021', 'Prima vacacional'),
+    ('028', 'Comisiones'),
+    ('029', 'Vales de despensa'),
+    ('038', 'Otros ingresos por salarios'),
+    ('049', 'Premios por asistencia'),
+]
+DEDUCCIONES = [
+    ('001', 'Seguridad social'),
+    ('002', 'ISR'),
+    ('004', 'Otros'),
+    ('006', 'Descuento por incapacidad'),
+    ('007', 'Pensión alimenticia'),
+    ('010', 'Pago por crédito de vivienda'),
+    ('011', 'Pago de abonos INFONACOT'),
+    ('012', 'Anticipo de salarios'),
+]
+OTROS_PAGOS = [
+    ('002', 'Subsidio para el empleo'),
+    ('001', 'Reintegro de ISR pagado en exceso'),
+    ('003', 'Viáticos'),
+    ('999', 'Pagos distintos a los listados'),
+]
+DEPARTAMENTOS = ['Administración', 'Ventas', 'Producción', 'Almacén', 'Sistemas', 'Recursos Humanos']
+PUESTOS = ['Auxiliar', 'Analista', 'Supervisor', 'Gerente', 'Operador', 'Vendedor']
+
+
+class SyntheticCFDI:
+    """
+    Generator of payroll CFDIs.
+    percepciones/deducciones/otros_pagos: (min, max) concept lines per document.
+    cfdi4_ratio: share of CFDI 4.0 documents, the rest are 3.3 (different namespace).
+    employers: number of distinct issuing companies (and Certificado/Sello blobs).
+    employees: size of the workforce; receptors repeat across periods.
+    addenda_kb: size of an Addenda with an embedded (base64) document, as some PACs and
+    ERPs attach the PDF; 0 for none.
+    """
+
+    def __init__(self, seed: int = 0, percepciones: Tuple[int, int] = (2, 6),
+                 deducciones: Tuple[int, int] = (1, 4), otros_pagos: Tuple[int, int] = (0, 1),
+                 cfdi4_ratio: float = 0.7, employers: int = 3, employees: int = 500,
+                 addenda_kb: int = 0):
+        self.seed = seed
+        self.percepciones = percepciones
+        self.deducciones = deducciones
+        self.otros_pagos = otros_pagos
+        self.cfdi4_ratio = cfdi4_ratio
+        self.employers = employers
+        self.employees = max(1, employees)
+        rnd = random.Random(seed)
+        # Sello and Certificado make up most of a real CFDI's size
+        self._certs = [base64.b64encode(bytes(rnd.getrandbits(8) for _ in range(1300))).decode() for _ in range(employers)]
+        self._addenda = ''
+        if addenda_kb > 0:
+            blob = (self._certs[0] * (addenda_kb * 1024 // len(self._certs[0]) + 1))[:addenda_kb * 1024]
+            self._addenda = f'<cfdi:Addenda><Documento Tipo="PDF">{blob}</Documento></cfdi:Addenda>'
+
+    def document(self, i: int) -> bytes:
+        rnd = random.Random(self.seed * 1_000_003 + i)
+        version = '4.0' if rnd.random() < self.cfdi4_ratio else '3.3'
+        ns = NS_CFDI4 if version == '4.0' else NS_CFDI3
+        emp = rnd.randrange(self.employers)
+        worker = rnd.randrange(self.employees)
+        period = i // self.employees
+        month = period // 2 % 12 + 1
+        first_half = period % 2 == 0
+        year = 2024 + period // 24
+        start, end = (1, 15) if first_half else (16, 28)
+        fecha_pago = f'{year}-{month:02d}-{end:02d}'
+        salary = round(300 + (worker * 37 % 1700) + rnd.random(), 2)
+        days = end - start + 1
+
+        # Sueldos always comes first; the rest are sampled from the catalog
+        perc_lines = []
+        n_perc = self._count(rnd, self.percepciones, len(PERCEPCIONES))
+        if n_perc:
+            perc_lines.append(('001', PERCEPCIONES[0][1], round(salary * days, 2), 0.0))
+        for tipo, concepto in rnd.sample(PERCEPCIONES[1:], n_perc - 1 if n_perc else 0):
+            gravado = round(rnd.uniform(50, 3000), 2)
+            exento = round(rnd.uniform(0, 500), 2) if rnd.random() < 0.3 else 0.0
+            perc_lines.append((tipo, concepto, gravado, exento))
+        ded_lines = [(tipo, concepto, round(rnd.uniform(20, 1500), 2))
+                     for tipo, concepto in rnd.sample(DEDUCCIONES, self._count(rnd, self.deducciones, len(DEDUCCIONES)))]
+        otro_lines = [(tipo, concepto, round(rnd.uniform(1, 400), 2))
+                      for tipo, concepto in rnd.sample(OTROS_PAGOS, self._count(rnd, self.otros_pagos, len(OTROS_PAGOS)))]
+
+        total_gravado = round(sum(p[2] for p in perc_lines), 2)
+        total_exento = round(sum(p[3] for p in perc_lines), 2)
+        total_perc = round(total_gravado + total_exento, 2)
+        total_ded = round(sum(d[2] for d in ded_lines), 2)
+        total_otros = round(sum(o[2] for o in otro_lines), 2)
+        subtotal = round(total_perc + total_otros, 2)
+        total = round(subtotal - total_ded, 2)
+
+        emisor_rfc = f'EMP{emp:02d}0101AB{emp % 10}'
+        receptor_rfc = f'{"ABCDEFGHIJKLMNOPQRSTUVWXYZ"[worker % 26]}XX{worker:06d}H{worker % 10}A'
+        curp = f'{receptor_rfc[:10]}HDFRRN{worker % 100:02d}'
+        uid = str(uuid.UUID(int=rnd.getrandbits(128), version=4)).upper()
+        sello = self._certs[emp][rnd.randrange(0, 900):][:344]
+
+        perc_xml = ''.join(
+            f'<nomina12:Percepcion TipoPercepcion="{tipo}" Clave="P{tipo}" Concepto="{concepto}" '
+            f'ImporteGravado="{gravado:.2f}" ImporteExento="{exento:.2f}"/>'
+            for tipo, concepto, gravado, exento in perc_lines
+        )
+        ded_xml = ''.join(
+            f'<nomina12:Deduccion TipoDeduccion="{tipo}" Clave="D{tipo}" Concepto="{concepto}" Importe="{importe:.2f}"/>'
+            for tipo, concepto, importe in ded_lines
+        )
+        otros_xml = ''
+        for tipo, concepto, importe in otro_lines:
+            inner = f'<nomina12:SubsidioAlEmpleo SubsidioCausado="{importe:.2f}"/>' if tipo == '002' else ''
+            otros_xml += (f'<nomina12:OtroPago TipoOtroPago="{tipo}" Clave="O{tipo}" Concepto="{concepto}" '
+                          f'Importe="{importe:.2f}">{inner}</nomina12:OtroPago>')
+
+        if version == '4.0':
+            extra_comprobante = f' Exportacion="01" LugarExpedicion="0{6000 + emp}"'
+            receptor = (f'<cfdi:Receptor Rfc="{receptor_rfc}" Nombre="EMPLEADO {worker}" UsoCFDI="CN01" '
+                        f'DomicilioFiscalReceptor="0{6100 + worker % 800}" RegimenFiscalReceptor="605"/>')
+            concepto_xml = ('<cfdi:Concepto ClaveProdServ="84111505" Cantidad="1" ClaveUnidad="ACT" '
+                            f'Descripcion="Pago de nómina" ValorUnitario="{subtotal:.2f}" Importe="{subtotal:.2f}" '
+                            f'Descuento="{total_ded:.2f}" ObjetoImp="01"/>')
+        else:
+            extra_comprobante = f' LugarExpedicion="0{6000 + emp}"'
+            receptor = f'<cfdi:Receptor Rfc="{receptor_rfc}" Nombre="EMPLEADO {worker}" UsoCFDI="P01"/>'
+            concepto_xml = ('<cfdi:Concepto ClaveProdServ="84111505" Cantidad="1" ClaveUnidad="ACT" '
+                            f'Descripcion="Pago de nómina" ValorUnitario="{subtotal:.2f}" Importe="{subtotal:.2f}" '
+                            f'Descuento="{total_ded:.2f}"/>')
+
+        doc = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<cfdi:Comprobante xmlns:cfdi="{ns}" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+            f'xmlns:nomina12="{NS_NOMINA}" xsi:schemaLocation="{SCHEMA_LOCATION[version]} '
+            f'{NS_NOMINA} http://www.sat.gob.mx/sitio_internet/cfd/nomina/nomina12.xsd" '
+            f'Version="{version}" Serie="N" Folio="{i + 1}" Fecha="{fecha_pago}T10:00:00" '
+            f'Sello="{sello}" NoCertificado="3000100000040000{emp:04d}" Certificado="{self._certs[emp]}" '
+            f'SubTotal="{subtotal:.2f}" Descuento="{total_ded:.2f}" Moneda="MXN" Total="{total:.2f}" '
+            f'TipoDeComprobante="N" MetodoPago="PUE"{extra_comprobante}>'
+            f'<cfdi:Emisor Rfc="{emisor_rfc}" Nombre="EMPRESA {emp} SA DE CV" RegimenFiscal="601"/>'
+            f'{receptor}<cfdi:Conceptos>{concepto_xml}</cfdi:Conceptos>'
+            '<cfdi:Complemento>'
+            f'<nomina12:Nomina Version="1.2" TipoNomina="O" FechaPago="{fecha_pago}" '
+            f'FechaInicialPago="{year}-{month:02d}-{start:02d}" FechaFinalPago="{fecha_pago}" '
+            f'NumDiasPagados="{days}" TotalPercepciones="{total_perc:.2f}"'
+            + (f' TotalDeducciones="{total_ded:.2f}"' if ded_lines else '')
+            + (f' TotalOtrosPagos="{total_otros:.2f}"' if otro_lines else '')
+            + '>'
+            f'<nomina12:Emisor RegistroPatronal="Y{emp:02d}12345{emp % 10}"/>'
+            f'<nomina12:Receptor Curp="{curp}" NumSeguridadSocial="{worker:011d}" '
+            f'FechaInicioRelLaboral="2020-01-{worker % 28 + 1:02d}" Antigüedad="P{200 + worker % 100}W" '
+            f'TipoContrato="01" TipoJornada="01" TipoRegimen="02" NumEmpleado="{worker}" '
+            f'Departamento="{DEPARTAMENTOS[worker % len(DEPARTAMENTOS)]}" Puesto="{PUESTOS[worker % len(PUESTOS)]}" '
+            f'RiesgoPuesto="1" PeriodicidadPago="04" SalarioBaseCotApor="{salary:.2f}" '
+            f'SalarioDiarioIntegrado="{salary * 1.0452:.2f}" ClaveEntFed="CMX"/>'
+            f'<nomina12:Percepciones TotalSueldos="{total_perc:.2f}" TotalGravado="{total_gravado:.2f}" '
+            f'TotalExento="{total_exento:.2f}">{perc_xml}</nomina12:Percepciones>'
+            + (f'<nomina12:Deducciones TotalImpuestosRetenidos="0.00" TotalOtrasDeducciones="{total_ded:.2f}">'
+               f'{ded_xml}</nomina12:Deducciones>' if ded_lines else '')
+            + (f'<nomina12:OtrosPagos>{otros_xml}</nomina12:OtrosPagos>' if otro_lines else '')
+            + '</nomina12:Nomina>'
+            f'<tfd:TimbreFiscalDigital xmlns:tfd="{NS_TFD}" Version="1.1" UUID="{uid}" '
+            f'FechaTimbrado="{fecha_pago}T11:00:00" RfcProvCertif="SAT970701NN3" SelloCFD="{sello}" '
+            f'NoCertificadoSAT="00001000000505211329" SelloSAT="{sello[::-1]}"/>'
+            '</cfdi:Complemento>'
+            + self._addenda
+            + '</cfdi:Comprobante>'
+        )
+        return doc.encode('utf-8')
+
+    @staticmethod
+    def _count(rnd: random.Random, bounds: Tuple[int, int], available: int) -> int:
+        return min(rnd.randint(bounds[0], bounds[1]), available)
+
+    def filename(self, i: int) -> str:
+        return f'nomina_{i:07d}.xml'
+
+    def iter_documents(self, n: int, start: int = 0) -> Iterator[Tuple[bytes, str]]:
+        """(content, filename) for documents start .. start + n - 1."""
+        for i in range(start, start + n):
+            yield self.document(i), self.filename(i)
+
+    def write(self, path: str, n: int, per_zip: Optional[int] = None) -> str:
+        """
+        Write n documents under path: loose XML files, or ZIP packages of per_zip
+        documents each (like a PAC delivery). Returns path.
+        """
+        os.makedirs(path, exist_ok=True)
+        if not per_zip:
+            for content, name in self.iter_documents(n):
+                with open(os.path.join(path, name), 'wb') as f:
+                    f.write(content)
+            return path
+        for part, start in enumerate(range(0, n, per_zip)):
+            zip_path = os.path.join(path, f'paquete_{part:04d}.zip')
+            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as z:
+                for content, name in self.iter_documents(min(per_zip, n - start), start):
+                    z.writestr(name, content)
+        return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera CFDI de nómina sintéticos y deterministas.")
+    parser.add_argument('output', help="Carpeta de salida")
+    parser.add_argument('-n', type=int, default=1000, help="Número de documentos")
+    parser.add_argument('--per-zip', type=int, default=None, help="Empaqueta en ZIPs de N documentos")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--percepciones', type=int, nargs=2, default=(2, 6), metavar=('MIN', 'MAX'))
+    parser.add_argument('--deducciones', type=int, nargs=2, default=(1, 4), metavar=('MIN', 'MAX'))
+    parser.add_argument('--otros-pagos', type=int, nargs=2, default=(0, 1), metavar=('MIN', 'MAX'))
+    parser.add_argument('--cfdi4-ratio', type=float, default=0.7, help="Proporción de CFDI 4.0 (resto 3.3)")
+    parser.add_argument('--addenda-kb', type=int, default=0, help="Addenda con un documento embebido de N KB")
+    args = parser.parse_args(argv)
+    generator = SyntheticCFDI(seed=args.seed, percepciones=tuple(args.percepciones),
+                              deducciones=tuple(args.deducciones), otros_pagos=tuple(args.otros_pagos),
+                              cfdi4_ratio=args.cfdi4_ratio, addenda_kb=args.addenda_kb)
+    generator.write(args.output, args.n, args.per_zip)
+    print(f"{args.n} documentos en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
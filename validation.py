@@ -0,0 +1,84 @@
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from aggregations import receipt_totals
+from column_registry import ColumnRegistry
+from ledger import NominaLedger
+
+# Largest difference (in pesos) accepted between a declared total and the computed one;
+# the SAT rounds each importe to two decimals
+TOLERANCE = 0.01
+
+# Rule -> description shown with the summary
+RULES = {
+    'TotalPercepciones': 'TotalPercepciones = suma de gravado + exento de las percepciones',
+    'TotalDeducciones': 'TotalDeducciones = suma de las deducciones',
+    'Total': 'Total = SubTotal - deducciones',
+}
+
+EXCEPTION_COLUMNS = ['UUID', 'NombreArchivo', 'Regla', 'Esperado', 'Actual', 'Diferencia']
+
+
+def _amount(headers: pd.DataFrame, name: str) -> np.ndarray:
+    return pd.to_numeric(headers[name], errors='coerce').fillna(0.0).to_numpy(dtype=float)
+
+
+def validate(result, registry: Optional[ColumnRegistry] = None, tolerance: float = TOLERANCE) -> pd.DataFrame:
+    """
+    Arithmetic checks of every receipt of a wide result or a NominaLedger, as whole-column
+    operations: the declared TotalPercepciones and TotalDeducciones against the sums of
+    their concepts (classified with the registry specs), and Total against SubTotal minus
+    the deductions. Returns one row per failed check (EXCEPTION_COLUMNS): Esperado is the
+    computed amount, Actual the declared one. Rules whose header columns are missing are skipped.
+    """
+    headers = result.headers if isinstance(result, NominaLedger) else result
+    if headers.empty:
+        return pd.DataFrame(columns=EXCEPTION_COLUMNS)
+    totals = receipt_totals(result, registry)
+
+    checks = {}
+    if 'TotalPercepciones' in headers:
+        checks['TotalPercepciones'] = (totals['Percepciones'].to_numpy(), _amount(headers, 'TotalPercepciones'))
+    if 'TotalDeducciones' in headers:
+        checks['TotalDeducciones'] = (totals['Deducciones'].to_numpy(), _amount(headers, 'TotalDeducciones'))
+    if 'Total' in headers and 'SubTotal' in headers:
+        checks['Total'] = (_amount(headers, 'SubTotal') - totals['Deducciones'].to_numpy(), _amount(headers, 'Total'))
+
+    parts = []
+    for rule, (expected, actual) in checks.items():
+        failed = np.abs(expected - actual) > tolerance + 1e-9
+        if not failed.any():
+            continue
+        part = pd.DataFrame({
+            name: headers[name].to_numpy()[failed] if name in headers else ''
+            for name in ('UUID', 'NombreArchivo')
+        })
+        part['Regla'] = rule
+        part['Esperado'] = expected[failed].round(2)
+        part['Actual'] = actual[failed]
+        part['Diferencia'] = (actual[failed] - expected[failed]).round(2)
+        parts.append(part)
+    if not parts:
+        return pd.DataFrame(columns=EXCEPTION_COLUMNS)
+    return pd.concat(parts, ignore_index=True)[EXCEPTION_COLUMNS]
+
+
+def summary(exceptions: pd.DataFrame) -> Dict[str, int]:
+    """Failed checks per rule (every rule listed, 0 when it passed)."""
+    counts = exceptions['Regla'].value_counts()
+    return {rule: int(counts.get(rule, 0)) for rule in RULES}
+
+
+def validate_batches(results: Iterable, registry: Optional[ColumnRegistry] = None,
+                     tolerance: float = TOLERANCE, exceptions: Optional[list] = None):
+    """
+    Pass the batches of iter_dataframes() through unchanged, validating each one;
+    the exceptions of every batch are appended to the exceptions list.
+    """
+    for batch in results:
+        found = validate(batch, registry, tolerance)
+        if exceptions is not None and not found.empty:
+            exceptions.append(found)
+        yield batch
@@ -0,0 +1,62 @@
+import io
+import os
+import sys
+import logging
+import tempfile
+import importlib.util
+from contextlib import redirect_stdout
+
+import cli
+import exporters
+from verify_parser_parity import build_corpus
+
+BATCH_SIZE = 20
+
+
+def write_corpus(path, n):
+    """Parity corpus on disk: concepts are sampled per document, so later files add columns."""
+    for content, name in build_corpus(n)[:n]:
+        with open(os.path.join(path, name), 'wb') as f:
+            f.write(content)
+
+
+def run_cli(args):
+    with redirect_stdout(io.StringIO()):
+        return cli.main(args)
+
+
+def test_batched_export(corpus, out, fmt):
+    """The CLI with a small --batch-size must write the same report as one unbatched run."""
+    batched = os.path.join(out, f'batched.{fmt}')
+    single = os.path.join(out, f'single.{fmt}')
+    try:
+        run_cli([corpus, '-o', batched, '--batch-size', str(BATCH_SIZE)])
+    except Exception as e:
+        print(f"FAIL: {fmt} batched export raised {type(e).__name__}: {e}")
+        return False
+    run_cli([corpus, '-o', single])
+    a = exporters.read_export(batched, fmt)
+    b = exporters.read_export(single, fmt)
+    if list(a.columns) != list(b.columns) or not a.equals(b):
+        print(f"FAIL: {fmt} batched export differs from the unbatched one")
+        return False
+    print(f"{fmt}: {a.shape[0]} rows x {a.shape[1]} columns, same as unbatched")
+    return True
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    logging.disable(logging.ERROR)
+    formats = ['xlsx', 'csv']
+    if importlib.util.find_spec('pyarrow') is not None:
+        formats.append('parquet')
+    with tempfile.TemporaryDirectory(prefix='nomina_verify_') as tmp:
+        corpus = os.path.join(tmp, 'corpus')
+        out = os.path.join(tmp, 'out')
+        os.makedirs(corpus)
+        os.makedirs(out)
+        write_corpus(corpus, n)
+        ok = all([test_batched_export(corpus, out, fmt) for fmt in formats])
+    print("\nALL CHECKS PASSED" if ok else "\nSOME CHECKS FAILED")
+    if not ok:
+        sys.exit(1)
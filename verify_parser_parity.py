@@ -0,0 +1,142 @@
+import sys
+import time
+import random
+import tracemalloc
+
+from xml_backends import lxml_available
+from xml_handler import NominaXMLHandler
+
+NS_CFDI4 = 'http://www.sat.gob.mx/cfd/4'
+NS_CFDI3 = 'http://www.sat.gob.mx/cfd/3'
+
+
+def build_doc(i, rnd):
+    """Small CFDI + nomina12 document with the variations seen in PAC output."""
+    ns = NS_CFDI4 if i % 2 else NS_CFDI3
+    perc = ''.join(
+        f'<nomina12:Percepcion TipoPercepcion="{c:03d}" Clave="{c:03d}" Concepto="Percepcion {c}" '
+        f'ImporteGravado="{rnd.randint(1, 9999)}.{rnd.randint(0, 99):02d}" ImporteExento="{rnd.randint(0, 99)}"/>'
+        for c in rnd.sample(range(1, 50), rnd.randint(1, 8))
+    )
+    ded = ''.join(
+        f'<nomina12:Deduccion TipoDeduccion="{c:03d}" Concepto="Deduccion {c}" Importe="{rnd.randint(1, 999)}"/>'
+        for c in rnd.sample(range(1, 20), rnd.randint(0, 5))
+    )
+    otros = ''
+    if i % 3 == 0:
+        # OtroPago without Clave: falls back to TipoOtroPago
+        otros = ('<nomina12:OtrosPagos><nomina12:OtroPago TipoOtroPago="002" Concepto="Subsidio" Importe="10">'
+                 '<nomina12:SubsidioAlEmpleo SubsidioCausado="12.50"/></nomina12:OtroPago></nomina12:OtrosPagos>')
+    # Lower-case attribute names exercise the case-insensitive lookup
+    rfc_attr = 'rfc' if i % 7 == 0 else 'Rfc'
+    tfd = f'<tfd:TimbreFiscalDigital UUID="0000-{i:08d}" FechaTimbrado="2025-01-15T11:00:00"/>'
+    return f'''<?xml version="1.0" encoding="UTF-8"?>
+<cfdi:Comprobante xmlns:cfdi="{ns}" xmlns:nomina12="http://www.sat.gob.mx/nomina12"
+ xmlns:tfd="http://www.sat.gob.mx/TimbreFiscalDigital" Serie="A" Folio="{i}" Fecha="2025-01-15T10:00:00"
+ Moneda="MXN" Sello="abc" Total="1000.00" SubTotal="1100.00">
+<cfdi:Emisor {rfc_attr}="EMI{i % 3}0101AAA" Nombre="Empresa {i % 3}" RegimenFiscal="601"/>
+<cfdi:Receptor Rfc="REC{i:04d}01AAA" Nombre="Empleado {i}" UsoCFDI="CN01"/>
+<cfdi:Complemento>
+{tfd if i % 2 else ''}
+<nomina12:Nomina FechaPago="2025-01-15" FechaInicialPago="2025-01-01" FechaFinalPago="2025-01-15"
+ NumDiasPagados="15" TotalPercepciones="1100" TotalDeducciones="100" TotalOtrosPagos="10">
+<nomina12:Percepciones>{perc}</nomina12:Percepciones>
+{'<nomina12:Deducciones>' + ded + '</nomina12:Deducciones>' if ded else ''}
+{otros}
+</nomina12:Nomina>
+{'' if i % 2 else tfd}
+</cfdi:Complemento>
+</cfdi:Comprobante>'''.encode('utf-8')
+
+
+def build_corpus(n, seed=42):
+    rnd = random.Random(seed)
+    corpus = [(build_doc(i, rnd), f'doc_{i}.xml') for i in range(n)]
+    # Edge cases: malformed document and a CFDI without nomina complement
+    corpus.append((b'<cfdi:Comprobante', 'broken.xml'))
+    corpus.append((f'<Comprobante xmlns="{NS_CFDI4}" Total="5"><Emisor Rfc="X"/></Comprobante>'.encode(), 'plain.xml'))
+    return corpus
+
+
+def test_parity(corpus):
+    mismatches = 0
+    for content, name in corpus:
+        tree = NominaXMLHandler(engine='tree')
+        stream = NominaXMLHandler(engine='stream', backend='stdlib')
+        a = tree.parse_xml_content(content, name)
+        b = stream.parse_xml_content(content, name)
+        if a != b or tree.column_metadata != stream.column_metadata:
+            print(f"FAIL: {name} differs between engines")
+            mismatches += 1
+
+    df_tree = NominaXMLHandler(engine='tree').process_files(corpus)
+    df_stream = NominaXMLHandler(engine='stream', backend='stdlib').process_files(corpus)
+    if not df_tree.equals(df_stream):
+        print("FAIL: process_files output differs between engines")
+        mismatches += 1
+    return mismatches == 0
+
+
+def test_backend_parity(corpus, backend='lxml'):
+    """Every stream backend must produce what the stdlib one does (records, metadata, ledger)."""
+    mismatches = 0
+    for content, name in corpus:
+        reference = NominaXMLHandler(backend='stdlib')
+        other = NominaXMLHandler(backend=backend)
+        a = reference.parse_xml_content(content, name)
+        b = other.parse_xml_content(content, name)
+        if a != b or reference.column_metadata != other.column_metadata:
+            print(f"FAIL: {name} differs between stdlib and {backend}")
+            mismatches += 1
+        if reference.parse_xml_ledger(content, name) != other.parse_xml_ledger(content, name):
+            print(f"FAIL: {name} ledger differs between stdlib and {backend}")
+            mismatches += 1
+
+    df_reference = NominaXMLHandler(backend='stdlib').process_files(corpus)
+    df_other = NominaXMLHandler(backend=backend).process_files(corpus)
+    if not df_reference.equals(df_other):
+        print(f"FAIL: process_files output differs between stdlib and {backend}")
+        mismatches += 1
+    return mismatches == 0
+
+
+def report_recovery(corpus):
+    """Malformed documents: rejected by stdlib and lxml, partly read by lxml-recover."""
+    # Unescaped '&' in an attribute, as some PACs emit in names
+    content, _ = corpus[1]
+    malformed = content.replace(b'Empleado 1"', b'Empleado 1 & Hijos"')
+    for content, name in [(malformed, 'ampersand.xml'), (corpus[-2][0], 'broken.xml')]:
+        parsed = {backend: NominaXMLHandler(backend=backend).parse_xml_content(content, name)
+                  for backend in ['stdlib', 'lxml', 'lxml-recover']}
+        print(f"{name}: " + ', '.join(f"{b} {len(r)} fields" for b, r in parsed.items()))
+
+
+def benchmark(corpus):
+    runs = [('tree', 'stdlib'), ('stream', 'stdlib')]
+    if lxml_available():
+        runs.append(('stream', 'lxml'))
+    for engine, backend in runs:
+        handler = NominaXMLHandler(engine=engine, backend=backend)
+        tracemalloc.start()
+        start = time.perf_counter()
+        for content, name in corpus:
+            handler.parse_xml_content(content, name)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{engine:>6} ({backend:>6}): {len(corpus) / elapsed:,.0f} docs/s, peak {peak / 1024:,.0f} KiB")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    corpus = build_corpus(n)
+    ok = test_parity(corpus)
+    if lxml_available():
+        ok = test_backend_parity(corpus) and ok
+        report_recovery(corpus)
+    else:
+        print("lxml not installed: backend parity skipped")
+    print("\nALL CHECKS PASSED" if ok else "\nSOME CHECKS FAILED")
+    if not ok:
+        sys.exit(1)
+    benchmark(corpus)
@@ -0,0 +1,110 @@
+import importlib.util
+import xml.etree.ElementTree as ET
+from typing import Any, Optional
+
+# A backend parses one document and drives a parser target (start(tag, attrib) / end(tag),
+# as in ElementTree.XMLParser, tags in '{namespace}local' form), so every backend shares
+# the extraction logic of the stream engine and produces the same output.
+# 'lxml-recover' also reads documents the others reject, see LxmlBackend.
+BACKENDS = ('stdlib', 'lxml', 'lxml-recover')
+
+# lxml is opt-in (backend='lxml' or --backend lxml): it is not faster on every corpus
+DEFAULT_BACKEND = 'stdlib'
+
+# Bytes handed to lxml per feed() when the content is a view (mmap, memoryview),
+# so large mapped documents are not copied whole into a bytes object
+FEED_CHUNK = 1024 * 1024
+
+
+def lxml_available() -> bool:
+    return importlib.util.find_spec('lxml') is not None
+
+
+class StdlibBackend:
+    """expat through ElementTree.XMLParser: one Python callback per element of the document."""
+
+    name = 'stdlib'
+    # Cache entries are shared with every backend that produces the same output
+    cache_tag = ''
+
+    def feed(self, content: Any, target: Any) -> bool:
+        """Parse content into target; False if the document is not well-formed."""
+        parser = ET.XMLParser(target=target)
+        try:
+            parser.feed(content)
+            parser.close()
+        except ET.ParseError:
+            return False
+        return True
+
+
+class LxmlBackend:
+    """
+    libxml2 (pip install lxml) builds the tree in C and only the branches the target
+    follows are replayed, so subtrees it ignores (Conceptos, Impuestos, Addenda, ...)
+    cost no Python call. Malformed documents are rejected like expat does, unless
+    recover=True: libxml2 then keeps what it can read of slightly malformed PAC output
+    (an unescaped '&' is dropped, a truncated document keeps its complete nodes).
+    """
+
+    def __init__(self, recover: bool = False):
+        from lxml import etree
+        self._etree = etree
+        self.recover = recover
+        self.name = 'lxml-recover' if recover else 'lxml'
+        # Recovered documents parse where the other backends fail, so they are cached apart
+        self.cache_tag = self.name if recover else ''
+        self._options = dict(recover=recover, resolve_entities=False, no_network=True,
+                             huge_tree=True, remove_comments=True, remove_pis=True)
+
+    def _parse(self, content: Any):
+        parser = self._etree.XMLParser(**self._options)
+        if isinstance(content, bytes):
+            parser.feed(content)
+        else:
+            view = memoryview(content)
+            for start in range(0, len(view), FEED_CHUNK):
+                parser.feed(bytes(view[start:start + FEED_CHUNK]))
+        return parser.close()
+
+    def feed(self, content: Any, target: Any) -> bool:
+        """Parse content and replay the elements target follows; False if nothing could be parsed."""
+        try:
+            root = self._parse(content)
+        except self._etree.XMLSyntaxError:
+            return False
+        if root is None:
+            return False
+        _replay(root, target)
+        return True
+
+
+def _replay(root: Any, target: Any):
+    """
+    start/end for root and its descendants, in document order, pruning every subtree
+    under an element the target ignores (target.stack holds None for it): a stream
+    parser would pass those elements through the target without effect.
+    """
+    start, end, stack = target.start, target.end, target.stack
+
+    def walk(element):
+        start(element.tag, element.attrib)
+        if stack[-1] is not None:
+            for child in element:
+                if isinstance(child.tag, str):
+                    walk(child)
+        end(element.tag)
+
+    walk(root)
+
+
+def get_backend(name: Optional[str] = None):
+    """Backend instance by name (BACKENDS); None picks DEFAULT_BACKEND."""
+    name = name or DEFAULT_BACKEND
+    if name == 'stdlib':
+        return StdlibBackend()
+    if name in ('lxml', 'lxml-recover'):
+        if not lxml_available():
+            raise ImportError("The lxml backend requires lxml: pip install lxml")
+        return LxmlBackend(recover=name == 'lxml-recover')
+    raise ValueError(f"Unknown parser backend: {name}")
@@ -1,41 +1,111 @@
 import xml.etree.ElementTree as ET
-import pandas as pd
-import io
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Iterable, Iterator
 import logging
-import re
 import os
-import zipfile
-from io import BytesIO
+import itertools
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from parse_cache import ParseCache
+from column_registry import ColumnRegistry, SUBSIDIO_CAUSADO
+from columnar import ColumnarBuilder
+from ledger import LedgerBuilder
+from dedup import KEEP_BYTES, TAIL_BYTES, content_key, peek_uuid, split_duplicates
+from metrics import RunMetrics
+from pipeline import PIPELINE_READERS, background
+from io_buffers import read_file, to_bytes, upload_buffer
+from extraction_spec import DEFAULT_SPEC, NODE_PATHS, CompiledSpec, FieldSpec
+from xml_backends import get_backend
+from zip_ingest import MAX_DEPTH, MemberFilter, XMLSource, iter_archive, prefetch, _close_zip_cache
+
+# Bump whenever parse_xml_content output changes; invalidates the parse cache
+EXTRACTOR_VERSION = '3.2.0'
+
+# Fixed header columns (name, section, clave, subitem): the file name plus every
+# column of the default extraction spec (see extraction_spec.DEFAULT_SPEC).
+_DEFAULT_SPEC = CompiledSpec(DEFAULT_SPEC)
+STANDARD_COLUMNS = [('NombreArchivo', 'Standard', '0', 0)] + _DEFAULT_SPEC.columns
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _lookup_attr(attrib: Dict[str, str], name: str, default: str = '') -> str:
+    """Case-insensitive lookup on an attribute dict."""
+    val = attrib.get(name)
+    if val is not None:
+        return val
+    name_lower = name.lower()
+    for k, v in attrib.items():
+        if k.lower() == name_lower:
+            return v
+    return default
+
+
 class NominaXMLHandler:
-    def __init__(self):
+    def __init__(self, engine: str = 'stream', cache_dir: Optional[str] = None,
+                 cache_max_mb: int = 512, registry: Optional[ColumnRegistry] = None,
+                 member_filter: Optional[MemberFilter] = None, max_zip_depth: int = MAX_DEPTH,
+                 io_threads: int = 1, spec: Optional[List[FieldSpec]] = None,
+                 backend: Optional[str] = None):
+        """
+        engine: 'stream' (single-pass expat callbacks, default) or 'tree'
+        (full ElementTree with find lookups, kept as the reference parser).
+        cache_dir: directory for the persistent parse cache (disabled if None).
+        cache_max_mb: size cap of the parse cache before LRU eviction.
+        registry: column schema to start from, e.g. ColumnRegistry.load() of a previous period.
+        member_filter: skips ZIP members by name or size before decompressing them.
+        max_zip_depth: levels of ZIPs inside ZIPs to follow.
+        io_threads: reader threads that decompress/read ahead while parsing (1 = inline).
+        Pays off with many archives on multi-core machines or slow (network) drives.
+        spec: header fields to extract (extraction_spec format); DEFAULT_SPEC if None.
+        backend: XML parser of the stream engine, 'stdlib', 'lxml' or 'lxml-recover'
+        (see xml_backends); None picks 'stdlib'.
+        """
+        if engine not in ('stream', 'tree'):
+            raise ValueError(f"Unknown engine: {engine}")
+        self.engine = engine
         self.namespaces = {
             'cfdi3': 'http://www.sat.gob.mx/cfd/3',
             'cfdi4': 'http://www.sat.gob.mx/cfd/4',
             'nomina12': 'http://www.sat.gob.mx/nomina12',
             'tfd': 'http://www.sat.gob.mx/TimbreFiscalDigital'
         }
-        # Metadata to track column sorting info: name -> (SectionPriority, ClaveInt, SubitemPriority)
-        # SectionPriority: 0=Standard, 1=Percepciones, 2=Deducciones, 3=OtrosPagos
-        self.column_metadata = {}
+        self._tag_tokens = self._build_tag_tokens()
+        self.backend = get_backend(backend)
+        self.spec = _DEFAULT_SPEC if spec is None else CompiledSpec(spec)
+        self.member_filter = member_filter
+        self.max_zip_depth = max_zip_depth
+        self.io_threads = io_threads
+        # Nested ZIPs are extracted here; removed when the handler is garbage collected
+        self._spill = None
+        # Counters and stage timings of the last process_files/iter_dataframes run
+        self.metrics = RunMetrics()
+        self.cache = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.cache = ParseCache(
+                os.path.join(cache_dir, 'parse_cache.sqlite3'),
+                max_bytes=cache_max_mb * 1024 * 1024,
+                version=EXTRACTOR_VERSION
+            )
+        # Column schema: every column interned once with its sorting info
+        # (Section, Clave, Subitem). Header columns of the spec are registered up front.
+        self.registry = registry if registry is not None else ColumnRegistry()
+        self.registry.register_all(STANDARD_COLUMNS[:1] + self.spec.columns)
+
+    @property
+    def column_metadata(self) -> Dict[str, tuple]:
+        """name -> (SectionPriority, ClaveInt, SubitemPriority, name), read-only view of the registry."""
+        return self.registry.metadata
 
     def _get_attr(self, element: ET.Element, name: str, default: str = '') -> str:
         """Get attribute case-insensitive."""
         if element is None:
             return default
-        val = element.get(name)
-        if val is not None:
-            return val
-        name_lower = name.lower()
-        for k, v in element.attrib.items():
-            if k.lower() == name_lower:
-                return v
-        return default
+        return _lookup_attr(element.attrib, name, default)
 
     def _to_float(self, val: str) -> float:
         try:
@@ -46,26 +116,64 @@ class NominaXMLHandler:
     def _register_metadata(self, col_name: str, section: str, clave: str, subitem_priority: int = 0):
         """
         Register metadata for sorting.
-        Section: 'Standard', 'Percepciones', 'Deducciones', 'OtrosPagos'
+        Section: 'Standard', 'Percepciones', 'Deducciones', 'OtrosPagos', 'Totals'
         Clave: The numeric string code (e.g. "001")
         SubitemPriority: For ordering Gravado (0) vs Exento (1) or others.
         """
-        priority_map = {
-            'Standard': 0,
-            'Percepciones': 1,
-            'Deducciones': 2,
-            'OtrosPagos': 3,
-            'Totals': 4
-        }
-        
-        try:
-            clave_int = int(clave)
-        except (ValueError, TypeError):
-            clave_int = 99999 # Fallback for non-numeric keys
-            
-        self.column_metadata[col_name] = (priority_map.get(section, 99), clave_int, subitem_priority, col_name)
+        self.registry.register(col_name, section, clave, subitem_priority)
 
     def parse_xml_content(self, xml_content: bytes, filename: str) -> Dict[str, Any]:
+        if self.engine == 'stream':
+            return self._parse_xml_stream(xml_content, filename)
+        return self._parse_xml_tree(xml_content, filename)
+
+    def _build_tag_tokens(self) -> Dict[str, str]:
+        """
+        Map every fully qualified tag the stream engine cares about to a short token.
+        CFDI nodes are accepted in the cfdi4, cfdi3 or empty namespace (same as find_path).
+        """
+        tokens = {}
+        for local in ['Comprobante', 'Emisor', 'Receptor', 'Complemento']:
+            for prefix in ['cfdi4', 'cfdi3']:
+                tokens[f'{{{self.namespaces[prefix]}}}{local}'] = local
+            tokens[local] = local
+        tokens[f'{{{self.namespaces["tfd"]}}}TimbreFiscalDigital'] = 'TFD'
+        # nomina12 Emisor/Receptor share the CFDI tokens; their path under Nomina tells them apart
+        for local in ['Nomina', 'Emisor', 'Receptor', 'Percepciones', 'Percepcion', 'Deducciones',
+                      'Deduccion', 'OtrosPagos', 'OtroPago', 'SubsidioAlEmpleo']:
+            tokens[f'{{{self.namespaces["nomina12"]}}}{local}'] = local
+        return tokens
+
+    def _parse_xml_stream(self, xml_content: bytes, filename: str) -> Dict[str, Any]:
+        """
+        Single-pass extractor: the parser backend feeds start/end callbacks straight
+        into _StreamTarget, which dispatches on the fully qualified tag. With expat
+        no element tree is built, so nothing has to be freed afterwards.
+        Produces the same dict and column metadata as _parse_xml_tree.
+        """
+        target = _StreamTarget(self, filename)
+        if not self.backend.feed(xml_content, target):
+            logger.error(f"Error parsing XML: {filename}")
+            return {}
+
+        # Registrations are buffered and only applied if the whole document parses
+        self.registry.register_all(target.meta)
+        return target.record
+
+    def parse_xml_ledger(self, xml_content: bytes, filename: str):
+        """
+        Tidy variant of parse_xml_content (stream engine).
+        Returns (header, lines): header holds the receipt-level fields and lines
+        one (section, clave, concepto, gravado, exento, importe) tuple per concept.
+        Returns ({}, []) if the document cannot be parsed.
+        """
+        target = _StreamTarget(self, filename, ledger=True)
+        if not self.backend.feed(xml_content, target):
+            logger.error(f"Error parsing XML: {filename}")
+            return {}, []
+        return target.record, target.lines
+
+    def _parse_xml_tree(self, xml_content: bytes, filename: str) -> Dict[str, Any]:
         try:
             root = ET.fromstring(xml_content)
         except ET.ParseError:
@@ -82,81 +190,36 @@ class NominaXMLHandler:
                 if res is not None: return res
             return node.find(path)
 
-        # 1. Attributes of Comprobante
         comprobante = root
         if not root.tag.endswith('Comprobante'):
             found = find_path(root, 'Comprobante')
             if found is not None:
                 comprobante = found
 
-        for attr in ['Serie', 'Folio', 'Fecha', 'Moneda', 'Sello']:
-            data[attr] = self._get_attr(comprobante, attr)
-            self._register_metadata(attr, 'Standard', '0')
-            
-        for attr in ['Total', 'SubTotal']:
-            data[attr] = self._to_float(self._get_attr(comprobante, attr))
-            self._register_metadata(attr, 'Standard', '99') # Totals usually at end, but user wants Percepciones->Deducciones->OtrosPagos. 
-            # If we want Total AFTER others, we need higher priority.
-            # Let's put Total and Subtotal at Priority 4 (After OtrosPagos=3)
-            self._register_metadata(attr, 'Totals', '0')
-
-        # 2. Emisor / Receptor
         emisor = find_path(comprobante, 'Emisor')
-        if emisor is not None:
-            data['Emisor_RFC'] = self._get_attr(emisor, 'Rfc')
-            data['Emisor_Nombre'] = self._get_attr(emisor, 'Nombre')
-            data['Emisor_RegimenFiscal'] = self._get_attr(emisor, 'RegimenFiscal')
-            for k in ['Emisor_RFC', 'Emisor_Nombre', 'Emisor_RegimenFiscal']:
-                self._register_metadata(k, 'Standard', '1')
-
         receptor = find_path(comprobante, 'Receptor')
-        if receptor is not None:
-            data['Receptor_RFC'] = self._get_attr(receptor, 'Rfc')
-            data['Receptor_Nombre'] = self._get_attr(receptor, 'Nombre')
-            data['Receptor_UsoCFDI'] = self._get_attr(receptor, 'UsoCFDI')
-            for k in ['Receptor_RFC', 'Receptor_Nombre', 'Receptor_UsoCFDI']:
-                self._register_metadata(k, 'Standard', '2')
-
-        # 3. UUID
         complemento = find_path(comprobante, 'Complemento')
+        tfd = nomina = nomina_emisor = nomina_receptor = None
         if complemento is not None:
             tfd = complemento.find(f'{{{self.namespaces["tfd"]}}}TimbreFiscalDigital')
-            if tfd is not None:
-                data['UUID'] = self._get_attr(tfd, 'UUID')
-                data['FechaTimbrado'] = self._get_attr(tfd, 'FechaTimbrado')
-                self._register_metadata('UUID', 'Standard', '0')
-                self._register_metadata('FechaTimbrado', 'Standard', '0')
-
-        # 4. Nomina
-        nomina = None
-        if complemento is not None:
             nomina = complemento.find(f'{{{self.namespaces["nomina12"]}}}Nomina')
-        
         if nomina is not None:
-            # Nomina Headers
-            for attr in ['FechaPago', 'FechaInicialPago', 'FechaFinalPago']:
-                 data[attr] = self._get_attr(nomina, attr)
-                 self._register_metadata(attr, 'Standard', '3')
-            
-            # NumDiasPagados stays standard
-            data['NumDiasPagados'] = self._to_float(self._get_attr(nomina, 'NumDiasPagados'))
-            self._register_metadata('NumDiasPagados', 'Standard', '4')
+            nomina_emisor = nomina.find(f'{{{self.namespaces["nomina12"]}}}Emisor')
+            nomina_receptor = nomina.find(f'{{{self.namespaces["nomina12"]}}}Receptor')
 
-            # Move Totals to their respective sections
-            # We use 'Total' as clave which defaults to 99999 (End of section)
-            
-            tp = self._to_float(self._get_attr(nomina, 'TotalPercepciones'))
-            data['TotalPercepciones'] = tp
-            self._register_metadata('TotalPercepciones', 'Percepciones', 'Total')
-            
-            td = self._to_float(self._get_attr(nomina, 'TotalDeducciones'))
-            data['TotalDeducciones'] = td
-            self._register_metadata('TotalDeducciones', 'Deducciones', 'Total')
-            
-            top = self._to_float(self._get_attr(nomina, 'TotalOtrosPagos'))
-            data['TotalOtrosPagos'] = top
-            self._register_metadata('TotalOtrosPagos', 'OtrosPagos', 'Total')
+        # Header fields of the extraction spec, node by node
+        nodes = {
+            'Comprobante': comprobante, 'Emisor': emisor, 'Receptor': receptor,
+            'TimbreFiscalDigital': tfd, 'Nomina': nomina,
+            'Nomina/Emisor': nomina_emisor, 'Nomina/Receptor': nomina_receptor,
+        }
+        for node, extractor in self.spec.by_name.items():
+            element = nodes[node]
+            if element is not None:
+                extractor.extract(element.attrib, data)
+        self.registry.register_all(self.spec.columns)
 
+        if nomina is not None:
             ns_nomina = {'n': self.namespaces['nomina12']}
             
             # A. Percepciones
@@ -193,7 +256,7 @@ class NominaXMLHandler:
             otros_pagos_node = nomina.find('n:OtrosPagos', ns_nomina)
             if otros_pagos_node is not None:
                 for o in otros_pagos_node.findall('n:OtroPago', ns_nomina):
-                    clave = self._get_attr(o, 'Clave') or self._get_attr(d, 'TipoOtroPago')
+                    clave = self._get_attr(o, 'Clave') or self._get_attr(o, 'TipoOtroPago')
                     concepto = self._get_attr(o, 'Concepto')
                     importe = self._get_attr(o, 'Importe')
                     
@@ -214,102 +277,614 @@ class NominaXMLHandler:
     def scan_directory(self, path: str) -> List[Any]:
         """
         Recursively scans a directory for .xml and .zip files.
-        Returns a list of file-like objects (BytesIO) or tuples (content, filename).
+        Returns a list of tuples (content, filename) with every XML loaded in memory.
+        Prefer iter_directory() for large archives.
         """
         found_files = []
-        
+        for source in self.iter_directory(path):
+            content = source.read()
+            if content:
+                found_files.append((content, source.name))
+        return found_files
+
+    def iter_directory(self, path: str) -> Iterator['XMLSource']:
+        """
+        Recursively walks a directory and yields lazy XMLSource handles for
+        every .xml file and every .xml member of .zip files.
+        Nothing is read until the handle is consumed by process_files().
+        """
         if not os.path.exists(path):
-            return []
+            return
 
         for root, dirs, files in os.walk(path):
             for file in files:
                 full_path = os.path.join(root, file)
                 if file.lower().endswith('.xml'):
-                    try:
-                        with open(full_path, 'rb') as f:
-                            content = f.read()
-                        found_files.append((content, file))
-                    except Exception as e:
-                        logger.error(f"Error reading {full_path}: {e}")
-                
+                    yield XMLSource(full_path)
+
                 elif file.lower().endswith('.zip'):
-                    found_files.extend(self._process_zip(full_path))
-                    
-        return found_files
+                    yield from self._iter_zip(full_path)
+
+    def iter_paths(self, paths: Iterable[str]) -> Iterator['XMLSource']:
+        """Yield lazy handles for a mix of directories, .xml files and .zip files."""
+        for path in paths:
+            if os.path.isdir(path):
+                yield from self.iter_directory(path)
+            elif path.lower().endswith('.zip'):
+                yield from self._iter_zip(path)
+            elif os.path.isfile(path):
+                yield XMLSource(path)
+            else:
+                logger.error(f"Input not found: {path}")
+
+    def iter_uploads(self, files: Iterable[Any]) -> Iterator[Any]:
+        """
+        Expand uploaded files: XML uploads pass through, ZIP uploads yield handles over
+        the upload's own buffer (the archive is not copied or written to disk).
+        """
+        for f in files:
+            if f.name.lower().endswith('.zip'):
+                yield from self._iter_zip(f.getvalue(), f.name)
+            else:
+                yield f
+
+    def _iter_zip(self, zip_origin, label: Optional[str] = None) -> Iterator['XMLSource']:
+        if self._spill is None:
+            self._spill = tempfile.TemporaryDirectory(prefix='nomina_zip_')
+        yield from iter_archive(zip_origin, label or zip_origin, self.member_filter,
+                                self.max_zip_depth, self._spill.name)
 
     def _process_zip(self, zip_path: str) -> List[Any]:
         results = []
-        try:
-            with zipfile.ZipFile(zip_path, 'r') as z:
-                for filename in z.namelist():
-                    if filename.lower().endswith('.xml'):
-                        try:
-                            content = z.read(filename)
-                            # Use basename for simplicity in reports
-                            name = os.path.basename(filename) 
-                            results.append((content, name))
-                        except Exception as e:
-                            logger.error(f"Error reading {filename} in zip {zip_path}: {e}")
-        except Exception as e:
-            logger.error(f"Error processing zip {zip_path}: {e}")
+        for source in self._iter_zip(zip_path):
+            content = source.read()
+            if content:
+                results.append((content, source.name))
         return results
 
-    def process_files(self, files: List[Any]) -> pd.DataFrame:
-        all_data = []
-        
-        for item in files:
-            content = None
-            name = "unknown"
-            
-            # Case 1: Streamlit UploadedFile
-            if hasattr(item, 'read') and hasattr(item, 'name'):
-                content = item.read()
-                name = item.name
-                item.seek(0)
-            
-            # Case 2: Tuple (content_bytes, filename) from scan_directory
-            elif isinstance(item, tuple) and len(item) == 2:
-                content = item[0]
-                name = item[1]
-                
-            # Case 3: Path string (legacy support)
-            elif isinstance(item, str) and os.path.exists(item):
-                with open(item, 'rb') as f:
-                    content = f.read()
-                name = os.path.basename(item)
+    def _load_item(self, item: Any, zips: Optional[Dict] = None):
+        """
+        Normalize any supported input into (content, filename).
+        content is bytes or a zero-copy buffer (mmap/memoryview) for large files,
+        stored ZIP members and uploads; the parsers accept either.
+        zips: open ZipFiles of the calling reader thread (module cache if None).
+        """
+        content = None
+        name = "unknown"
 
-            if content:
-                parsed = self.parse_xml_content(content, name)
-                if parsed:
-                    all_data.append(parsed)
-        
-        if not all_data:
-            return pd.DataFrame()
-            
-        df = pd.DataFrame(all_data)
-        
-        # SORTING LOGIC
-        # Get all present columns
-        cols = list(df.columns)
-        
-        # Define a sorting key function
-        # Defaults for unknown columns: Standard, High int key, 0
-        def sort_key(col_name):
-            meta = self.column_metadata.get(col_name, (0, 99999, 0, col_name))
-            return meta
-
-        cols.sort(key=sort_key)
-        
-        # Reorder DataFrame
-        df = df[cols]
-        
-        # Fill NaNs
-        # Heuristic: If it's a numeric column (float), fill with 0.0
-        # Check dtypes
-        for col in df.columns:
-            if pd.api.types.is_float_dtype(df[col]):
-                 df[col] = df[col].fillna(0.0)
-            elif pd.api.types.is_integer_dtype(df[col]):
-                 df[col] = df[col].fillna(0)
-        
-        return df
+        # Case 0: Lazy handle from iter_directory
+        if isinstance(item, XMLSource):
+            content = item.read(zips)
+            name = item.name
+
+        # Case 1: Streamlit UploadedFile (a view of its buffer, not a copy)
+        elif hasattr(item, 'read') and hasattr(item, 'name'):
+            content = upload_buffer(item)
+            name = item.name
+
+        # Case 2: Tuple (content_bytes, filename) from scan_directory
+        elif isinstance(item, tuple) and len(item) == 2:
+            content = item[0]
+            name = item[1]
+
+        # Case 3: Path string (legacy support)
+        elif isinstance(item, str) and os.path.exists(item):
+            content = read_file(item)
+            name = os.path.basename(item)
+
+        return content, name
+
+    def deduplicate(self, files: Iterable[Any], policy: str = 'first'):
+        """
+        Drop repeated CFDIs (same TFD UUID, or same bytes when there is no UUID) before parsing.
+        Keys come from a regex scan of the TimbreFiscalDigital; loose files only read their tail.
+        ZIP members have to be inflated whole: kept ones come back as (content, name), up to
+        KEEP_BYTES in total, so the parse does not decompress them again.
+        policy: 'first', 'last' (input order) or 'latest' (newest file or ZIP entry).
+        Returns (kept items, report) where report lists each discarded duplicate.
+        """
+        loaded = {}  # id(item) -> (content, name) of inflated members
+        budget = KEEP_BYTES
+
+        def key_of(item: Any) -> Optional[str]:
+            nonlocal budget
+            if isinstance(item, XMLSource) and item.member is None:
+                uuid = peek_uuid(item.read_tail(TAIL_BYTES))
+                if uuid is not None:
+                    return uuid
+            content, name = self._load_item(item)
+            # Views (stored members, uploads) cost nothing to read again
+            member = isinstance(item, XMLSource) and item.member is not None
+            if member and isinstance(content, bytes) and len(content) <= budget:
+                loaded[id(item)] = (content, name)
+                budget -= len(content)
+            return content_key(content)
+
+        try:
+            kept, duplicates = split_duplicates(files, key_of, policy, self._item_mtime)
+        finally:
+            # Workers must not inherit ZipFile handles opened here
+            _close_zip_cache()
+        kept = [loaded.get(id(item), item) for item in kept]
+        report = [
+            {'Archivo': self._item_name(item), 'Origen': repr(item) if isinstance(item, XMLSource) else self._item_name(item),
+             'UUID': key, 'Conservado': repr(winner) if isinstance(winner, XMLSource) else self._item_name(winner)}
+            for item, key, winner in duplicates
+        ]
+        if report:
+            logger.info(f"Dedup ({policy}): {len(report)} duplicates discarded")
+        return kept, report
+
+    def _iter_loaded(self, files: Iterable[Any], readers: Optional[int] = None,
+                     pass_on_disk: bool = False):
+        """
+        (content, name) per item, read ahead by reader threads (io_threads unless given).
+        pass_on_disk: lazy handles on disk are passed through for worker processes to read.
+        """
+        load = self._load_or_pass if pass_on_disk else self._load_timed
+        readers = readers or self.io_threads
+        if readers and readers > 1:
+            return prefetch(files, load, readers)
+        return (load(item) for item in files)
+
+    def _load_or_pass(self, item: Any, zips: Optional[Dict] = None):
+        if isinstance(item, XMLSource) and item.on_disk:
+            return item
+        # Buffers cannot be pickled to the workers
+        content, name = self._load_timed(item, zips)
+        return to_bytes(content) if content else content, name
+
+    def _load_timed(self, item: Any, zips: Optional[Dict] = None):
+        start = time.perf_counter()
+        loaded = self._load_item(item, zips)
+        stage = 'decompress' if isinstance(item, XMLSource) and item.member is not None else 'read'
+        self.metrics.add_time(stage, time.perf_counter() - start)
+        return loaded
+
+    def _item_mtime(self, item: Any) -> float:
+        if isinstance(item, XMLSource):
+            return item.mtime()
+        if isinstance(item, str) and os.path.exists(item):
+            return os.path.getmtime(item)
+        return 0.0
+
+    def _item_name(self, item: Any) -> str:
+        if isinstance(item, tuple) and len(item) == 2:
+            return item[1]
+        if isinstance(item, str):
+            return os.path.basename(item)
+        return getattr(item, 'name', 'unknown')
+
+    def _parse_tracked(self, content: bytes, name: str, output: str = 'wide'):
+        """
+        Parse one document and return (result, column specs it registered).
+        result is the wide record, or (header, lines) when output='ledger'.
+        """
+        if output == 'ledger':
+            return self.parse_xml_ledger(content, name), []
+        with self.registry.recording() as specs:
+            parsed = self.parse_xml_content(content, name)
+        return parsed, specs
+
+    def _parse_cached(self, content: bytes, name: str, output: str = 'wide'):
+        if self.cache is None:
+            return self._parse_tracked(content, name, output)[0]
+        key = self._cache_key(content, output)
+        hit = self.cache.get(key)
+        if hit is not None:
+            return self._apply_cached(hit, name, output)
+        parsed, specs = self._parse_tracked(content, name, output)
+        self.cache.put(key, parsed, specs)
+        return parsed
+
+    def _cache_key(self, content: bytes, output: str) -> str:
+        key = self.cache.key(content)
+        if self.spec is not _DEFAULT_SPEC:
+            # Custom specs get their own entries instead of invalidating the default ones
+            key = f'{self.spec.digest}:{key}'
+        if self.backend.cache_tag:
+            # Backends that read documents others reject keep their own entries
+            key = f'{self.backend.cache_tag}:{key}'
+        return key if output == 'wide' else f'{output}:{key}'
+
+    def _apply_cached(self, hit, name: str, output: str = 'wide'):
+        parsed, specs = hit
+        self.registry.register_all(specs)
+        header = parsed[0] if output == 'ledger' else parsed
+        if header:
+            # Same content may come under a different file name
+            header['NombreArchivo'] = name
+        return parsed
+
+    def _iter_parsed(self, files: Iterable[Any], parallel: bool = False,
+                     max_workers: Optional[int] = None, chunksize: int = 64,
+                     output: str = 'wide', readers: Optional[int] = None):
+        """
+        Yield (filename, parsed record) in input order.
+        In parallel mode chunks of files are parsed in a process pool and each
+        worker's column registrations are replayed in input order, so the result
+        is identical to a serial run (last registration wins in both cases).
+        readers: reader threads loading files ahead of the parser (io_threads if None).
+        """
+        metrics = self.metrics
+        if not parallel:
+            try:
+                for content, name in self._iter_loaded(files, readers):
+                    if not content:
+                        metrics.unreadable.append(name)
+                        continue
+                    start = time.perf_counter()
+                    parsed = self._parse_cached(content, name, output)
+                    metrics.record_file(name, len(content), time.perf_counter() - start)
+                    yield name, parsed
+            finally:
+                _close_zip_cache()
+            return
+
+        # Lazy handles on disk are read inside the workers; anything else (uploads,
+        # members of uploaded ZIPs) is loaded here because it cannot be pickled cheaply.
+        # With a cache every file is loaded here so it can be hashed first.
+        pairs = self._iter_loaded(files, readers, pass_on_disk=self.cache is None)
+
+        workers = max_workers or os.cpu_count() or 1
+        chunks = iter(lambda: list(itertools.islice(pairs, max(1, chunksize))), [])
+
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # Bounded submission: only a few chunks in flight per worker
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(self._submit_chunk(executor, chunk, output))
+                    if len(pending) >= workers * 2:
+                        yield from self._merge_chunk(*pending.popleft())
+                while pending:
+                    yield from self._merge_chunk(*pending.popleft())
+        finally:
+            _close_zip_cache()
+
+    def _submit_chunk(self, executor, chunk, output: str = 'wide'):
+        """
+        Submit the chunk to the pool. With a cache, hits are resolved here and only
+        misses are sent; slots keeps the input order of hits and misses.
+        """
+        if self.cache is None:
+            return None, executor.submit(_parse_chunk, chunk, self.engine, output, self._worker_spec(),
+                                         self.backend.name), output
+
+        slots = []
+        misses = []
+        for content, name in chunk:
+            if not content:
+                self.metrics.unreadable.append(name)
+                continue
+            start = time.perf_counter()
+            key = self._cache_key(content, output)
+            hit = self.cache.get(key)
+            if hit is not None:
+                self.metrics.record_file(name, len(content), time.perf_counter() - start)
+                slots.append(('hit', hit, name))
+            else:
+                slots.append(('miss', key, name))
+                misses.append((to_bytes(content), name))
+        return slots, executor.submit(_parse_chunk, misses, self.engine, output, self._worker_spec(),
+                                      self.backend.name), output
+
+    def _worker_spec(self) -> Optional[List[FieldSpec]]:
+        return None if self.spec is _DEFAULT_SPEC else self.spec.spec
+
+    def _merge_chunk(self, slots, future, output: str = 'wide'):
+        results = future.result()
+        if slots is None:
+            for name, parsed, specs, stats in results:
+                if self._record_worker_stats(name, stats):
+                    self.registry.register_all(specs)
+                    yield name, parsed
+            return
+
+        results = iter(results)
+        for kind, value, name in slots:
+            if kind == 'hit':
+                yield name, self._apply_cached(value, name, output)
+            else:
+                _, parsed, specs, stats = next(results)
+                self._record_worker_stats(name, stats)
+                self.cache.put(value, parsed, specs)
+                self.registry.register_all(specs)
+                yield name, parsed
+
+    def _record_worker_stats(self, name: str, stats) -> bool:
+        """Account a file handled in a worker; False if it could not be read."""
+        nbytes, load_stage, load_seconds, parse_seconds = stats
+        if load_stage:
+            self.metrics.add_time(load_stage, load_seconds)
+        if not nbytes:
+            self.metrics.unreadable.append(name)
+            return False
+        self.metrics.record_file(name, nbytes, parse_seconds)
+        return True
+
+    def process_files(self, files: Iterable[Any], parallel: bool = False,
+                      max_workers: Optional[int] = None, chunksize: int = 64,
+                      keep_layout: bool = False, output: str = 'wide', dedup: Optional[str] = None,
+                      profile: Optional[str] = None, pipeline: bool = False):
+        """
+        Parse all files into a single DataFrame.
+        parallel: parse across CPU cores with a process pool (serial by default).
+        max_workers: number of worker processes (defaults to os.cpu_count()).
+        chunksize: number of files sent to a worker per task.
+        keep_layout: output every column of the registry, even those absent in
+        this batch, so reports built from a saved layout have identical columns.
+        output: 'wide' (one column per concept, default) or 'ledger', which
+        returns a NominaLedger with a header table and one row per concept line.
+        dedup: None (keep everything) or a deduplicate() policy; discarded
+        duplicates are listed in metrics.duplicates.
+        profile: None, 'cprofile' or 'tracemalloc'; the report ends up in metrics.profile.
+        pipeline: run discovery, reading, parsing and accumulation as concurrent stages
+        connected by bounded queues (see iter_dataframes). The result is the same.
+        Counters, stage timings and the slowest files of the run are in self.metrics.
+        """
+        results = self.iter_dataframes(files, batch_size=None, parallel=parallel,
+                                       max_workers=max_workers, chunksize=chunksize,
+                                       keep_layout=keep_layout, output=output, dedup=dedup,
+                                       profile=profile, pipeline=pipeline)
+        return next(results)
+
+    def iter_dataframes(self, files: Iterable[Any], batch_size: Optional[int] = 5000,
+                        parallel: bool = False, max_workers: Optional[int] = None,
+                        chunksize: int = 64, keep_layout: bool = False, output: str = 'wide',
+                        dedup: Optional[str] = None, profile: Optional[str] = None,
+                        pipeline: bool = False):
+        """
+        Same as process_files but yields one result per batch_size parsed receipts,
+        so large runs can be exported without building one giant DataFrame.
+        The index (or 'Registro' in ledger mode) keeps counting across batches.
+        batch_size=None yields a single result with everything.
+        Wide batches may have different columns; pass keep_layout=True with a
+        loaded registry (or use output='ledger') when the columns must be fixed.
+
+        With pipeline=True, files (e.g. a lazy iter_directory()) is walked in a discovery
+        thread, reader threads (at least PIPELINE_READERS) load the bytes ahead of the
+        parser, and parsing runs here or in the process pool while records accumulate.
+        Each hand-off is bounded (discovery queue, readers * 2 runs of files, workers * 2
+        chunks), so a slow stage holds the others back instead of filling memory.
+        Items keep their input order, so the output is identical to a phased run.
+        dedup still needs every item before parsing starts.
+        """
+        if self.cache is not None:
+            self.cache.reset_counters()
+        metrics = self.metrics = RunMetrics()
+        metrics.start_profile(profile)
+        resumed = time.perf_counter()
+        readers = discovery = None
+        if pipeline:
+            files = discovery = background(files, on_time=lambda seconds: metrics.add_time('discovery', seconds))
+            readers = max(self.io_threads or 1, PIPELINE_READERS)
+        try:
+            if dedup:
+                with metrics.stage('dedup'):
+                    files, metrics.duplicates = self.deduplicate(files, dedup)
+
+            builder = self._new_builder(output)
+            start = 0
+            yielded = False
+            for name, parsed in self._iter_parsed(files, parallel, max_workers, chunksize, output, readers):
+                metrics.files += 1
+                t = time.perf_counter()
+                if output == 'ledger':
+                    ok = bool(parsed[0])
+                    if ok:
+                        builder.append(*parsed)
+                else:
+                    ok = bool(parsed)
+                    if ok:
+                        builder.append(parsed)
+                metrics.add_time('assemble', time.perf_counter() - t)
+                if not ok:
+                    metrics.errors += 1
+                    metrics.failed_files.append(name)
+                    continue
+                metrics.records += 1
+                if batch_size and builder.rows >= batch_size:
+                    # Columns come out in the registry's sorted layout with final dtypes
+                    with metrics.stage('build'):
+                        batch = builder.build(keep_layout=keep_layout, start=start)
+                    metrics.wall += time.perf_counter() - resumed
+                    metrics.pause_profile()
+                    yield batch
+                    metrics.resume_profile()
+                    resumed = time.perf_counter()
+                    yielded = True
+                    start += builder.rows
+                    builder = self._new_builder(output)
+
+            if self.cache is not None:
+                self.cache.flush()
+                metrics.cache = self.cache.stats()
+                logger.info(f"Parse cache: {metrics.cache['hits']} hits, {metrics.cache['misses']} misses")
+
+            if builder.rows or not yielded:
+                with metrics.stage('build'):
+                    batch = builder.build(keep_layout=keep_layout, start=start)
+                metrics.wall += time.perf_counter() - resumed
+                metrics.stop_profile()
+                yield batch
+        finally:
+            if discovery is not None:
+                # Stops the discovery thread when the caller closes the generator early
+                discovery.close()
+            metrics.stop_profile()
+
+    def _new_builder(self, output: str):
+        if output == 'ledger':
+            if self.engine != 'stream':
+                raise ValueError("Ledger output requires the stream engine")
+            return LedgerBuilder(self.registry)
+        if output == 'wide':
+            return ColumnarBuilder(self.registry)
+        raise ValueError(f"Unknown output: {output}")
+
+
+def _parse_chunk(chunk: List[Any], engine: str = 'stream', output: str = 'wide',
+                 spec: Optional[List[FieldSpec]] = None, backend: Optional[str] = None) -> List[Any]:
+    """
+    Worker entry point for parallel mode.
+    Returns (filename, record, column specs, stats) per file so the parent can replay the
+    metadata registrations in input order. stats is (bytes, load stage, load seconds,
+    parse seconds); bytes is 0 for files that could not be read.
+    """
+    handler = NominaXMLHandler(engine=engine, spec=spec, backend=backend)
+    results = []
+    for item in chunk:
+        start = time.perf_counter()
+        content, name = handler._load_item(item)
+        loaded = time.perf_counter()
+        stage = None
+        if isinstance(item, XMLSource):
+            stage = 'read' if item.member is None else 'decompress'
+        if not content:
+            results.append((name, None, None, (0, stage, loaded - start, 0.0)))
+            continue
+        parsed, specs = handler._parse_tracked(content, name, output)
+        stats = (len(content), stage, loaded - start, time.perf_counter() - loaded)
+        results.append((name, parsed, specs, stats))
+    _close_zip_cache()
+    return results
+
+
+# Node keys for the stream engine: token path relative to Comprobante
+_COMPROBANTE = ('Comprobante',)
+_EMISOR = _COMPROBANTE + ('Emisor',)
+_RECEPTOR = _COMPROBANTE + ('Receptor',)
+_COMPLEMENTO = _COMPROBANTE + ('Complemento',)
+_TFD = _COMPLEMENTO + ('TFD',)
+_NOMINA = _COMPLEMENTO + ('Nomina',)
+_PERCEPCIONES = _NOMINA + ('Percepciones',)
+_PERCEPCION = _PERCEPCIONES + ('Percepcion',)
+_DEDUCCIONES = _NOMINA + ('Deducciones',)
+_DEDUCCION = _DEDUCCIONES + ('Deduccion',)
+_OTROS_PAGOS = _NOMINA + ('OtrosPagos',)
+_OTRO_PAGO = _OTROS_PAGOS + ('OtroPago',)
+_SUBSIDIO = _OTRO_PAGO + ('SubsidioAlEmpleo',)
+_NOMINA_EMISOR = _NOMINA + ('Emisor',)
+_NOMINA_RECEPTOR = _NOMINA + ('Receptor',)
+assert all(path in (_COMPROBANTE, _EMISOR, _RECEPTOR, _TFD, _NOMINA, _NOMINA_EMISOR, _NOMINA_RECEPTOR)
+           for path in NODE_PATHS.values())
+
+# Nodes where only the first match is used, mirroring ElementTree.find() in the tree engine
+_SINGLE_NODES = {
+    _COMPROBANTE, _EMISOR, _RECEPTOR, _COMPLEMENTO, _TFD, _NOMINA,
+    _NOMINA_EMISOR, _NOMINA_RECEPTOR, _PERCEPCIONES, _DEDUCCIONES, _OTROS_PAGOS,
+}
+
+
+class _StreamTarget:
+    """
+    Parser target for the stream engine. The backend calls start()/end() for every
+    element it does not prune (see xml_backends); each node is identified by its token path so dispatch is one dict lookup.
+    """
+
+    def __init__(self, handler: NominaXMLHandler, filename: str, ledger: bool = False):
+        self.tokens = handler._tag_tokens
+        self.to_float = handler._to_float
+        self.fields = handler.spec.by_path   # header node -> NodeExtractor
+        self.record = {'NombreArchivo': filename}
+        self.meta = []      # dynamic column specs; header columns come from the spec
+        # Ledger mode: concept lines go here instead of becoming record columns
+        self.lines = [] if ledger else None
+        self.stack = []     # node key per open element (None = not of interest)
+        self.seen = set()   # single nodes already consumed
+        self.otro = None    # [clave, concepto, subsidio_seen] of the open OtroPago
+
+    def start(self, tag, attrib):
+        stack = self.stack
+        if not stack:
+            # Root: either the Comprobante itself or a wrapper around it
+            key = _COMPROBANTE if tag.endswith('Comprobante') else ()
+        else:
+            parent = stack[-1]
+            token = self.tokens.get(tag)
+            key = None if parent is None or token is None else parent + (token,)
+
+        if key in _SINGLE_NODES:
+            if key in self.seen:
+                key = None
+            else:
+                self.seen.add(key)
+        stack.append(key)
+
+        if key:
+            fields = self.fields.get(key)
+            if fields is not None:
+                fields.extract(attrib, self.record)
+            action = _STREAM_ACTIONS.get(key)
+            if action is not None:
+                action(self, attrib)
+
+    def end(self, tag):
+        if self.stack.pop() == _OTRO_PAGO:
+            self.otro = None
+
+    def close(self):
+        return self.record
+
+    def _percepcion(self, attrib):
+        concepto = _lookup_attr(attrib, 'Concepto')
+        if concepto:
+            clave = _lookup_attr(attrib, 'Clave') or _lookup_attr(attrib, 'TipoPercepcion')
+            gravado = self.to_float(_lookup_attr(attrib, 'ImporteGravado'))
+            exento = self.to_float(_lookup_attr(attrib, 'ImporteExento'))
+            if self.lines is not None:
+                self.lines.append(('Percepciones', clave, concepto, gravado, exento, 0.0))
+                return
+            col_g = f'{concepto}_Gravado'
+            col_e = f'{concepto}_Exento'
+            self.record[col_g] = gravado
+            self.record[col_e] = exento
+            self.meta.append((col_g, 'Percepciones', clave, 0))
+            self.meta.append((col_e, 'Percepciones', clave, 1))
+
+    def _deduccion(self, attrib):
+        concepto = _lookup_attr(attrib, 'Concepto')
+        if concepto:
+            clave = _lookup_attr(attrib, 'Clave') or _lookup_attr(attrib, 'TipoDeduccion')
+            importe = self.to_float(_lookup_attr(attrib, 'Importe'))
+            if self.lines is not None:
+                self.lines.append(('Deducciones', clave, concepto, 0.0, 0.0, importe))
+                return
+            self.record[concepto] = importe
+            self.meta.append((concepto, 'Deducciones', clave, 0))
+
+    def _otro_pago(self, attrib):
+        clave = _lookup_attr(attrib, 'Clave') or _lookup_attr(attrib, 'TipoOtroPago')
+        concepto = _lookup_attr(attrib, 'Concepto')
+        self.otro = [clave, concepto, False]
+        if concepto:
+            importe = self.to_float(_lookup_attr(attrib, 'Importe'))
+            if self.lines is not None:
+                self.lines.append(('OtrosPagos', clave, concepto, 0.0, 0.0, importe))
+                return
+            self.record[concepto] = importe
+            self.meta.append((concepto, 'OtrosPagos', clave, 0))
+
+    def _subsidio(self, attrib):
+        # Only the first SubsidioAlEmpleo of an OtroPago with Concepto counts
+        otro = self.otro
+        if otro is not None and not otro[2]:
+            otro[2] = True
+            sub_causado = _lookup_attr(attrib, 'SubsidioCausado')
+            if otro[1] and sub_causado:
+                importe = self.to_float(sub_causado)
+                if self.lines is not None:
+                    self.lines.append(('OtrosPagos', otro[0], SUBSIDIO_CAUSADO, 0.0, 0.0, importe))
+                    return
+                self.record[SUBSIDIO_CAUSADO] = importe
+                self.meta.append((SUBSIDIO_CAUSADO, 'OtrosPagos', otro[0], 1))
+
+
+# Concept lines; header nodes are handled by the extraction spec
+_STREAM_ACTIONS = {
+    _PERCEPCION: _StreamTarget._percepcion,
+    _DEDUCCION: _StreamTarget._deduccion,
+    _OTRO_PAGO: _StreamTarget._otro_pago,
+    _SUBSIDIO: _StreamTarget._subsidio,
+}
@@ -0,0 +1,255 @@
+import io
+import os
+import time
+import shutil
+import fnmatch
+import logging
+import tempfile
+import threading
+import zipfile
+import itertools
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+from io_buffers import Buffer, open_zip, read_file, read_member
+
+logger = logging.getLogger(__name__)
+
+# How many levels of ZIP-inside-ZIP are followed (the outer archive is level 0)
+MAX_DEPTH = 3
+
+# Open ZipFile objects reused across lazy reads (origin -> ZipFile)
+_ZIP_CACHE_SIZE = 4
+_zip_cache: "OrderedDict[Any, zipfile.ZipFile]" = OrderedDict()
+
+
+def _open_zip(origin: Union[str, bytes], cache: Optional[Dict[Any, zipfile.ZipFile]] = None) -> zipfile.ZipFile:
+    """
+    Open a ZIP given its path or its bytes (uploads), reusing an open ZipFile when possible.
+    cache defaults to the module LRU; readers in other threads pass their own dict.
+    """
+    shared = cache is None
+    cache = _zip_cache if shared else cache
+    key = origin if isinstance(origin, str) else id(origin)
+    z = cache.get(key)
+    if z is not None:
+        if shared:
+            _zip_cache.move_to_end(key)
+        return z
+    z = open_zip(origin)
+    cache[key] = z
+    if shared and len(_zip_cache) > _ZIP_CACHE_SIZE:
+        _, oldest = _zip_cache.popitem(last=False)
+        oldest.close()
+    return z
+
+
+def _close_zip_cache(cache: Optional[Dict[Any, zipfile.ZipFile]] = None):
+    cache = _zip_cache if cache is None else cache
+    while cache:
+        _, z = cache.popitem()
+        z.close()
+
+
+class XMLSource:
+    """
+    Lazy handle to an XML file on disk or to an XML member inside a ZIP.
+    The bytes are only read when read() is called.
+    path is a file path, or the bytes of an in-memory ZIP (uploads); label is the
+    origin shown in reports (e.g. "entrega.zip!enero.zip" for nested archives).
+    """
+    __slots__ = ('path', 'member', 'name', 'label')
+
+    def __init__(self, path: Union[str, bytes], member: Optional[str] = None, label: Optional[str] = None):
+        self.path = path
+        self.member = member
+        # Use basename for simplicity in reports
+        self.name = os.path.basename(member if member else path)
+        self.label = label
+
+    @property
+    def on_disk(self) -> bool:
+        """True when workers can reopen the source from its path (cheap to pickle)."""
+        return isinstance(self.path, str)
+
+    @property
+    def archive(self) -> Optional[Any]:
+        """Key of the containing archive, None for loose files."""
+        if self.member is None:
+            return None
+        return self.path if self.on_disk else id(self.path)
+
+    def read(self, zips: Optional[Dict[Any, zipfile.ZipFile]] = None) -> Buffer:
+        """
+        Content as bytes, or as a zero-copy mmap/memoryview for large files and stored
+        members of mapped or in-memory archives (see io_buffers).
+        """
+        try:
+            if self.member is None:
+                return read_file(self.path)
+            return read_member(_open_zip(self.path, zips), self.member)
+        except Exception as e:
+            logger.error(f"Error reading {self}: {e}")
+            return b''
+
+    def read_tail(self, size: int) -> bytes:
+        """Last size bytes of a loose file (whole content for ZIP members, which cannot seek)."""
+        if self.member is not None:
+            return self.read()
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - size))
+                return f.read()
+        except Exception as e:
+            logger.error(f"Error reading {self}: {e}")
+            return b''
+
+    def mtime(self) -> float:
+        """Modification time of the file, or the entry date of a ZIP member."""
+        try:
+            if self.member is None:
+                return os.path.getmtime(self.path)
+            return time.mktime(_open_zip(self.path).getinfo(self.member).date_time + (0, 0, -1))
+        except Exception:
+            return 0.0
+
+    def __repr__(self):
+        if self.member is None:
+            return self.path
+        archive = self.label or (self.path if self.on_disk else '<memoria>')
+        return f"{archive}!{self.member}"
+
+
+class MemberFilter:
+    """
+    Chooses ZIP members from the central directory (name and uncompressed size),
+    before anything is decompressed.
+    include/exclude: fnmatch patterns on the member's base name, case-insensitive.
+    exclude also applies to nested archives; include and max_bytes only to XML members.
+    """
+
+    def __init__(self, include: Optional[Sequence[str]] = None, exclude: Optional[Sequence[str]] = None,
+                 max_bytes: Optional[int] = None):
+        self.include = [p.lower() for p in include or []]
+        self.exclude = [p.lower() for p in exclude or []]
+        self.max_bytes = max_bytes
+
+    def excluded(self, info: zipfile.ZipInfo) -> bool:
+        base = os.path.basename(info.filename).lower()
+        return any(fnmatch.fnmatchcase(base, p) for p in self.exclude)
+
+    def accepts(self, info: zipfile.ZipInfo) -> bool:
+        if self.excluded(info):
+            return False
+        if self.max_bytes is not None and info.file_size > self.max_bytes:
+            return False
+        if self.include:
+            base = os.path.basename(info.filename).lower()
+            return any(fnmatch.fnmatchcase(base, p) for p in self.include)
+        return True
+
+
+def iter_archive(origin: Union[str, bytes], label: str, member_filter: Optional[MemberFilter] = None,
+                 max_depth: int = MAX_DEPTH, spill_dir: Optional[str] = None, depth: int = 0) -> Iterator[XMLSource]:
+    """
+    Yield XMLSource handles for the XML members of a ZIP, in central directory order.
+    Nested ZIPs are followed up to max_depth: each one is copied (streamed, not loaded
+    in memory) to a file in spill_dir, so its members are on disk like any other archive
+    and can be read by worker processes and reader threads.
+    """
+    try:
+        z = zipfile.ZipFile(origin if isinstance(origin, str) else io.BytesIO(origin), 'r')
+    except Exception as e:
+        logger.error(f"Error processing zip {label}: {e}")
+        return
+
+    skipped = 0
+    with z:
+        for info in z.infolist():
+            if info.is_dir():
+                continue
+            lower = info.filename.lower()
+            if lower.endswith('.xml'):
+                if member_filter is None or member_filter.accepts(info):
+                    yield XMLSource(origin, info.filename, label)
+                else:
+                    skipped += 1
+            elif lower.endswith('.zip'):
+                nested_label = f"{label}!{info.filename}"
+                if member_filter is not None and member_filter.excluded(info):
+                    skipped += 1
+                elif depth + 1 > max_depth:
+                    logger.warning(f"Nested zip deeper than {max_depth} levels skipped: {nested_label}")
+                else:
+                    nested = _spill(z, info, spill_dir)
+                    if nested is not None:
+                        yield from iter_archive(nested, nested_label, member_filter, max_depth, spill_dir, depth + 1)
+
+    if skipped:
+        logger.info(f"{label}: {skipped} members skipped by filter")
+
+
+def _spill(z: zipfile.ZipFile, info: zipfile.ZipInfo, spill_dir: Optional[str]) -> Optional[str]:
+    fd, path = tempfile.mkstemp(suffix='.zip', dir=spill_dir)
+    try:
+        with os.fdopen(fd, 'wb') as dst, z.open(info) as src:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+    except Exception as e:
+        logger.error(f"Error extracting nested zip {info.filename}: {e}")
+        os.remove(path)
+        return None
+    return path
+
+
+def _runs(items: Iterable[Any], run_size: int) -> Iterator[List[Any]]:
+    """Consecutive items from the same archive (loose files together), at most run_size each."""
+    key = lambda item: item.archive if isinstance(item, XMLSource) else None
+    for _, group in itertools.groupby(items, key=key):
+        while True:
+            run = list(itertools.islice(group, run_size))
+            if not run:
+                break
+            yield run
+
+
+def _drain(loaded: List[Any]) -> Iterator[Any]:
+    """Yield a run's items, dropping each one here so it is freed once the consumer is done with it."""
+    loaded.reverse()
+    while loaded:
+        yield loaded.pop()
+
+
+def prefetch(items: Iterable[Any], load: Callable[[Any, Dict], Any], threads: int = 4,
+             run_size: int = 64) -> Iterator[Any]:
+    """
+    Yield load(item, zips) for every item, in input order, reading ahead with a thread pool.
+    Each task reads a run of consecutive items from one archive; every thread keeps its
+    own open ZipFile handles (zips), so members of different archives are decompressed
+    in parallel (zlib and file reads release the GIL). At most threads * 2 runs are in memory.
+    """
+    local = threading.local()
+    opened = []
+    lock = threading.Lock()
+
+    def load_run(run):
+        zips = getattr(local, 'zips', None)
+        if zips is None:
+            zips = local.zips = {}
+            with lock:
+                opened.append(zips)
+        return [load(item, zips) for item in run]
+
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            pending = deque()
+            for run in _runs(items, run_size):
+                pending.append(executor.submit(load_run, run))
+                if len(pending) >= threads * 2:
+                    yield from _drain(pending.popleft().result())
+            while pending:
+                yield from _drain(pending.popleft().result())
+    finally:
+        for zips in opened:
+            _close_zip_cache(zips)